@@ -0,0 +1,378 @@
+"""Query agregasi HNA (group-by, pivot, window function) tanpa load_data.
+
+Query dijalankan di engine database, hanya hasil agregasinya yang masuk ke
+pandas. Jika paket duckdb terpasang (pip install duckdb), query dibaca DuckDB
+langsung dari file SQLite (eksekusi kolumnar, bisa spill ke disk untuk data
+besar); jika tidak, query yang sama dijalankan oleh SQLite lewat session
+aplikasi.
+
+Semua query hanya membaca data aktif (hna_fact), bukan arsip tahunan.
+Perbandingan item lintas mitra memakai cluster dari item_clusters.py (join
+lewat nama_key dan satuan).
+
+Hasil disimpan di cache dataset (datasets.cached_frame) per query dan filter
+selama versi data HNA (dan item_clusters untuk query cluster) belum berubah,
+jadi rerun Streamlit tidak mengulang agregasi.
+"""
+
+import os
+import re
+import threading
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+from datasets import cached_frame, data_version
+
+try:
+    import duckdb
+except ImportError:  # opsional, lihat docstring modul
+    duckdb = None
+
+# "auto" memakai DuckDB jika terpasang; "sqlite" memaksa fallback
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "auto")
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "1GB")
+DUCKDB_TEMP_DIRECTORY = os.getenv("DUCKDB_TEMP_DIRECTORY", ".duckdb_tmp")
+
+# Kolom yang boleh dipakai sebagai baris/kolom pivot
+PIVOT_DIMENSIONS = [
+    "region",
+    "mitra",
+    "group_transaksi",
+    "satuan",
+    "kode_item",
+    "nama_barang",
+    "periode_bulan",
+    "periode_tahun",
+]
+
+# Filter -> kolom di dalam CTE hna
+FILTER_COLUMNS = {
+    "region": "r.nama",
+    "mitra": "m.nama",
+    "group_transaksi": "g.nama",
+    "satuan": "s.nama",
+    "periode_bulan": "f.periode_bulan",
+    "periode_tahun": "f.periode_tahun",
+}
+
+# {src} diganti prefix schema: kosong untuk SQLite, "hna." untuk DuckDB
+_HNA_CTE = """
+    WITH hna AS (
+        SELECT r.nama AS region, m.nama AS mitra, g.nama AS group_transaksi,
+               s.nama AS satuan, f.kode_item, f.nama_barang, f.hna,
+               f.periode_bulan, f.periode_tahun, f.nama_key, f.satuan_id
+        FROM {src}hna_fact f
+        JOIN {src}dim_region r ON r.id = f.region_id
+        JOIN {src}dim_mitra m ON m.id = f.mitra_id
+        JOIN {src}dim_group_transaksi g ON g.id = f.group_id
+        JOIN {src}dim_satuan s ON s.id = f.satuan_id
+        WHERE {where}
+    )
+"""
+
+AVG_PER_MITRA_GROUP_SQL = """
+    SELECT mitra, group_transaksi,
+           COUNT(*) AS jumlah_item,
+           AVG(hna) AS rata_rata_hna,
+           MIN(hna) AS hna_min,
+           MAX(hna) AS hna_max
+    FROM hna
+    GROUP BY mitra, group_transaksi
+    ORDER BY mitra, group_transaksi
+"""
+
+# Rata-rata per item per region, lalu region termurah lewat ROW_NUMBER
+CHEAPEST_REGION_SQL = """
+    , per_region AS (
+        SELECT kode_item, MIN(nama_barang) AS nama_barang, region,
+               AVG(hna) AS rata_rata_hna
+        FROM hna
+        GROUP BY kode_item, region
+    ), ranked AS (
+        SELECT *,
+               ROW_NUMBER() OVER (
+                   PARTITION BY kode_item ORDER BY rata_rata_hna, region
+               ) AS urutan,
+               COUNT(*) OVER (PARTITION BY kode_item) AS jumlah_region,
+               MAX(rata_rata_hna) OVER (PARTITION BY kode_item) AS hna_tertinggi
+        FROM per_region
+    )
+    SELECT kode_item, nama_barang, region AS region_termurah,
+           rata_rata_hna AS hna_termurah, hna_tertinggi, jumlah_region
+    FROM ranked
+    WHERE urutan = 1 AND jumlah_region >= :min_regions
+    ORDER BY hna_tertinggi - hna_termurah DESC, kode_item
+"""
+
+# Rata-rata per cluster item per mitra, lalu mitra termurah per cluster
+CLUSTER_COMPARISON_SQL = """
+    , per_mitra AS (
+        SELECT c.cluster_id, hna.mitra, hna.satuan,
+               MIN(hna.nama_barang) AS nama_barang,
+               AVG(hna.hna) AS rata_rata_hna
+        FROM hna
+        JOIN {src}item_clusters c
+          ON c.nama_key = hna.nama_key AND c.satuan_id = hna.satuan_id
+        GROUP BY c.cluster_id, hna.mitra, hna.satuan
+    ), ranked AS (
+        SELECT *,
+               ROW_NUMBER() OVER (
+                   PARTITION BY cluster_id ORDER BY rata_rata_hna, mitra
+               ) AS urutan,
+               COUNT(*) OVER (PARTITION BY cluster_id) AS jumlah_mitra,
+               MAX(rata_rata_hna) OVER (PARTITION BY cluster_id) AS hna_tertinggi
+        FROM per_mitra
+    )
+    SELECT cluster_id, nama_barang, satuan, mitra AS mitra_termurah,
+           rata_rata_hna AS hna_termurah, hna_tertinggi, jumlah_mitra
+    FROM ranked
+    WHERE urutan = 1 AND jumlah_mitra >= :min_mitras
+    ORDER BY hna_tertinggi - hna_termurah DESC, cluster_id
+"""
+
+CLUSTER_ITEMS_SQL = """
+    SELECT hna.mitra, hna.region, hna.kode_item, hna.nama_barang, hna.satuan,
+           hna.hna, hna.periode_bulan, hna.periode_tahun
+    FROM hna
+    JOIN {src}item_clusters c
+      ON c.nama_key = hna.nama_key AND c.satuan_id = hna.satuan_id
+    WHERE c.cluster_id = :cluster_id
+    ORDER BY hna.hna, hna.mitra
+"""
+
+PIVOT_SQL = """
+    SELECT {index} AS baris, {columns} AS kolom, {aggfunc}(hna) AS nilai
+    FROM hna
+    GROUP BY {index}, {columns}
+"""
+
+PIVOT_AGGREGATES = {"avg": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+
+_duckdb_lock = threading.Lock()
+_duckdb_connections = {}
+
+
+def duckdb_available():
+    return duckdb is not None and ANALYTICS_ENGINE != "sqlite"
+
+
+def _duckdb_cursor(sqlite_path):
+    """Cursor DuckDB yang meng-attach file SQLite, atau None jika tidak tersedia.
+
+    Satu koneksi per file per proses. Jika setup gagal (mis. extension sqlite
+    tidak bisa diunduh saat INSTALL pertama), proses ini memakai SQLite saja.
+    """
+    with _duckdb_lock:
+        if sqlite_path not in _duckdb_connections:
+            try:
+                conn = duckdb.connect()
+                conn.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+                conn.execute(f"SET temp_directory = '{DUCKDB_TEMP_DIRECTORY}'")
+                conn.execute("INSTALL sqlite")
+                conn.execute("LOAD sqlite")
+                conn.execute(
+                    "ATTACH ? AS hna (TYPE sqlite, READ_ONLY)",
+                    [os.path.abspath(sqlite_path)],
+                )
+            except duckdb.Error as e:
+                print(f"⚠️ DuckDB tidak bisa dipakai, analisis memakai SQLite: {e}")
+                conn = None
+            _duckdb_connections[sqlite_path] = conn
+        conn = _duckdb_connections[sqlite_path]
+        return conn.cursor() if conn is not None else None
+
+
+class HNAAnalytics:
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def backend(self):
+        return "duckdb" if self._duckdb_path() else "sqlite"
+
+    def _duckdb_path(self):
+        database = self.session.bind.url.database
+        if not duckdb_available() or self.session.bind.dialect.name != "sqlite":
+            return None
+        if not database or database == ":memory:":
+            return None
+        cursor = _duckdb_cursor(database)
+        if cursor is None:
+            return None
+        cursor.close()
+        return database
+
+    def _run(self, sql, filters, params=None):
+        """Hasil query di atas CTE hna yang sudah difilter, dari cache jika ada"""
+        params = dict(params or {})
+        clauses = ["1 = 1"]
+        for column, value in filters.items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"Filter tidak dikenal: {column}")
+            if value is None or value == "Semua":
+                continue
+            clauses.append(f"{FILTER_COLUMNS[column]} = :{column}")
+            params[column] = value
+
+        connection = self.session.connection()
+        key = ("analytics", sql, tuple(sorted(params.items())))
+        if "item_clusters" in sql and connection.dialect.name == "sqlite":
+            key += (data_version(connection, "item_clusters"),)
+        return cached_frame(
+            connection, "hna", key, lambda: self._query(sql, clauses, params)
+        )
+
+    def _query(self, sql, clauses, params):
+        duckdb_path = self._duckdb_path()
+        if duckdb_path:
+            query = _HNA_CTE.format(src="hna.", where=" AND ".join(clauses))
+            query += sql.replace("{src}", "hna.")
+            # DuckDB memakai $nama untuk parameter bernama
+            query = re.sub(r":(\w+)", r"$\1", query)
+            cursor = _duckdb_cursor(duckdb_path)
+            try:
+                return cursor.execute(query, params).df()
+            finally:
+                cursor.close()
+
+        query = _HNA_CTE.format(src="", where=" AND ".join(clauses))
+        query += sql.replace("{src}", "")
+        return pd.read_sql(text(query), self.session.connection(), params=params)
+
+    def avg_hna_per_mitra_group(
+        self, region=None, mitra=None, group=None, satuan=None, bulan=None, tahun=None
+    ):
+        """Jumlah item dan rata-rata/min/max HNA per mitra dan group transaksi"""
+        try:
+            return self._run(
+                AVG_PER_MITRA_GROUP_SQL,
+                {
+                    "region": region,
+                    "mitra": mitra,
+                    "group_transaksi": group,
+                    "satuan": satuan,
+                    "periode_bulan": bulan,
+                    "periode_tahun": tahun,
+                },
+            )
+        except Exception as e:
+            st.error(f"❌ Error analisis HNA: {e}")
+            return pd.DataFrame()
+
+    def cheapest_region_per_item(
+        self,
+        mitra=None,
+        group=None,
+        satuan=None,
+        bulan=None,
+        tahun=None,
+        min_regions=2,
+    ):
+        """Region dengan rata-rata HNA termurah per kode item.
+
+        Hanya item yang ada di minimal min_regions region; urut selisih harga
+        termurah-termahal terbesar dulu.
+        """
+        try:
+            return self._run(
+                CHEAPEST_REGION_SQL,
+                {
+                    "mitra": mitra,
+                    "group_transaksi": group,
+                    "satuan": satuan,
+                    "periode_bulan": bulan,
+                    "periode_tahun": tahun,
+                },
+                {"min_regions": int(min_regions)},
+            )
+        except Exception as e:
+            st.error(f"❌ Error analisis HNA: {e}")
+            return pd.DataFrame()
+
+    def cheapest_mitra_per_cluster(
+        self,
+        region=None,
+        group=None,
+        satuan=None,
+        bulan=None,
+        tahun=None,
+        min_mitras=2,
+    ):
+        """Mitra dengan rata-rata HNA termurah per cluster item (item_clusters).
+
+        Hanya cluster yang dijual minimal min_mitras mitra; urut selisih harga
+        termurah-termahal terbesar dulu.
+        """
+        try:
+            return self._run(
+                CLUSTER_COMPARISON_SQL,
+                {
+                    "region": region,
+                    "group_transaksi": group,
+                    "satuan": satuan,
+                    "periode_bulan": bulan,
+                    "periode_tahun": tahun,
+                },
+                {"min_mitras": int(min_mitras)},
+            )
+        except Exception as e:
+            st.error(f"❌ Error analisis HNA: {e}")
+            return pd.DataFrame()
+
+    def cluster_items(
+        self, cluster_id, region=None, group=None, bulan=None, tahun=None
+    ):
+        """Semua baris HNA satu cluster item, termurah dulu"""
+        try:
+            return self._run(
+                CLUSTER_ITEMS_SQL,
+                {
+                    "region": region,
+                    "group_transaksi": group,
+                    "periode_bulan": bulan,
+                    "periode_tahun": tahun,
+                },
+                {"cluster_id": int(cluster_id)},
+            )
+        except Exception as e:
+            st.error(f"❌ Error analisis HNA: {e}")
+            return pd.DataFrame()
+
+    def price_pivot(
+        self,
+        index="nama_barang",
+        columns="mitra",
+        aggfunc="avg",
+        region=None,
+        mitra=None,
+        group=None,
+        satuan=None,
+        bulan=None,
+        tahun=None,
+    ):
+        """Pivot HNA (baris index x kolom columns); agregasi dihitung di database"""
+        if index not in PIVOT_DIMENSIONS or columns not in PIVOT_DIMENSIONS:
+            raise ValueError(f"Kolom pivot harus salah satu dari {PIVOT_DIMENSIONS}")
+        try:
+            result = self._run(
+                PIVOT_SQL.format(
+                    index=index, columns=columns, aggfunc=PIVOT_AGGREGATES[aggfunc]
+                ),
+                {
+                    "region": region,
+                    "mitra": mitra,
+                    "group_transaksi": group,
+                    "satuan": satuan,
+                    "periode_bulan": bulan,
+                    "periode_tahun": tahun,
+                },
+            )
+        except Exception as e:
+            st.error(f"❌ Error analisis HNA: {e}")
+            return pd.DataFrame()
+        # Hasil agregasi sudah kecil; pandas hanya mengubah bentuknya
+        return result.pivot(index="baris", columns="kolom", values="nilai").rename_axis(
+            index=index, columns=columns
+        )
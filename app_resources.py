@@ -0,0 +1,38 @@
+"""Resource Streamlit per proses: engine, sessionmaker dan metrik pool.
+
+Script Streamlit dijalankan ulang pada setiap interaksi. Objek yang mahal
+disimpan sekali per proses dengan st.cache_resource, sedangkan session
+database hanya hidup selama satu rerun lewat session_scope().
+"""
+
+from contextlib import contextmanager
+
+import streamlit as st
+
+import db
+
+
+@st.cache_resource
+def get_pool_metrics():
+    """Metrik pool untuk engine bersama; dipasang sekali per proses"""
+    return db.PoolMetrics(db.engine)
+
+
+@st.cache_resource
+def get_session_factory():
+    """sessionmaker yang terikat ke engine bersama (juga dipakai thread job)"""
+    get_pool_metrics()
+    return db.SessionLocal
+
+
+@contextmanager
+def session_scope():
+    """Session untuk satu rerun; selalu ditutup, termasuk saat st.rerun()/st.stop().
+
+    Perubahan yang belum di-commit dibatalkan saat session ditutup.
+    """
+    session = get_session_factory()()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,268 @@
+import io
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from excel_reader import iter_excel_chunks
+from ingest import (
+    PERIODE_BULAN,
+    IngestError,
+    check_hna_header,
+    prepare_hna_frame,
+    write_hna_records,
+)
+from upload_registry import (
+    describe_upload,
+    file_sha256,
+    find_uploads_by_hash,
+    register_upload,
+)
+from validation import HNAValidator, build_error_workbook
+
+# Parsing Excel murni CPU (openpyxl), jadi dijalankan di beberapa proses.
+# Penulisan ke database tetap satu file per transaksi di proses utama.
+BATCH_PARSE_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+MANIFEST_SHEET = "manifest"
+
+# Contoh nama file: "Jawa Barat_St. Yusup_Januari_2025.xlsx"
+FILENAME_PATTERN = re.compile(
+    r"^(?P<region>[^_]+)_(?P<mitra>[^_]+)_(?P<bulan>[A-Za-z]+)_(?P<tahun>\d{4})$"
+)
+
+_BULAN_LOOKUP = {bulan.lower(): bulan for bulan in PERIODE_BULAN}
+
+
+def expand_uploads(files):
+    """Ubah daftar (nama, bytes) menjadi daftar workbook .xlsx; isi ZIP diekstrak"""
+    workbooks = []
+    for name, data in files:
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    member_name = os.path.basename(member.filename)
+                    if (
+                        member.is_dir()
+                        or member.filename.startswith("__MACOSX/")
+                        or member_name.startswith("~$")
+                        or not member_name.lower().endswith(".xlsx")
+                    ):
+                        continue
+                    workbooks.append((member_name, archive.read(member)))
+        elif name.lower().endswith(".xlsx"):
+            workbooks.append((name, data))
+    return workbooks
+
+
+def _normalize_meta(meta, source):
+    try:
+        region = str(meta["region"]).strip()
+        mitra = str(meta["mitra"]).strip()
+        bulan = _BULAN_LOOKUP.get(str(meta["bulan"]).strip().lower())
+        tahun = int(float(meta["tahun"]))
+    except (KeyError, TypeError, ValueError):
+        raise IngestError(f"Region/Mitra/Bulan/Tahun dari {source} tidak lengkap")
+
+    if not region or not mitra:
+        raise IngestError(f"Region dan Mitra dari {source} tidak boleh kosong")
+    if bulan is None:
+        raise IngestError(f"Nama bulan dari {source} tidak dikenal: {meta['bulan']}")
+    if not 2000 <= tahun <= 2100:
+        raise IngestError(f"Tahun dari {source} tidak valid: {tahun}")
+    return {"region": region, "mitra": mitra, "bulan": bulan, "tahun": tahun}
+
+
+def resolve_metadata(filename, workbook):
+    """Ambil region/mitra/periode dari sheet manifest, atau dari pola nama file.
+
+    Sheet manifest berisi dua kolom (kunci, nilai) dengan kunci Region, Mitra,
+    Bulan, dan Tahun. Mengembalikan (metadata, nama sheet data).
+    """
+    sheet_names = workbook.sheetnames
+    manifest = next(
+        (name for name in sheet_names if name.strip().lower() == MANIFEST_SHEET), None
+    )
+    data_sheet = next((name for name in sheet_names if name != manifest), None)
+    if data_sheet is None:
+        raise IngestError("Workbook tidak berisi sheet data")
+
+    if manifest is not None:
+        meta = {}
+        for row in workbook[manifest].iter_rows(max_col=2, values_only=True):
+            if row[0] is not None and len(row) > 1:
+                meta[str(row[0]).strip().lower()] = row[1]
+        return _normalize_meta(meta, f"sheet {manifest}"), data_sheet
+
+    match = FILENAME_PATTERN.match(os.path.splitext(filename)[0])
+    if not match:
+        raise IngestError(
+            "Nama file harus berpola REGION_MITRA_BULAN_TAHUN.xlsx "
+            "atau workbook harus punya sheet Manifest"
+        )
+    return _normalize_meta(match.groupdict(), "nama file"), data_sheet
+
+
+def parse_hna_workbook(filename, data, user, previous_uploads=()):
+    """Worker proses: baca satu workbook menjadi baris HNA siap insert.
+
+    Mengembalikan dict berisi file, metadata, records, skipped dan errors
+    (baris yang ditolak validasi), atau error jika file tidak bisa dibaca.
+    previous_uploads adalah registrasi lama dengan hash yang sama; jika salah
+    satunya cocok dengan metadata file ini, isi file tidak di-parse sama sekali
+    dan hasilnya berisi previous.
+    Harus tetap fungsi top-level agar bisa di-pickle oleh ProcessPoolExecutor.
+    """
+    result = {"file": filename}
+    try:
+        workbook = load_workbook(io.BytesIO(data), read_only=True)
+        try:
+            meta, data_sheet = resolve_metadata(filename, workbook)
+        finally:
+            workbook.close()
+        result.update(meta)
+
+        for upload in previous_uploads:
+            if (
+                upload["region"] == meta["region"]
+                and upload["mitra"] == meta["mitra"]
+                and upload["periode_bulan"] == meta["bulan"]
+                and upload["periode_tahun"] == meta["tahun"]
+            ):
+                result["previous"] = upload
+                return result
+
+        validator = HNAValidator()
+        frames = []
+        chunks = iter_excel_chunks(
+            io.BytesIO(data), validate_header=check_hna_header, sheet_name=data_sheet
+        )
+        for chunk in chunks:
+            frames.append(
+                prepare_hna_frame(
+                    chunk,
+                    meta["region"],
+                    meta["mitra"],
+                    meta["bulan"],
+                    meta["tahun"],
+                    user,
+                    validator,
+                )
+            )
+
+        result["records"] = pd.concat(frames) if frames else None
+        result["skipped"] = validator.invalid_count
+        if validator.invalid_count:
+            errors = validator.error_frame()
+            errors.insert(0, "File", filename)
+            result["errors"] = errors
+    except IngestError as e:
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = f"❌ Error membaca file: {e}"
+    return result
+
+
+def ingest_hna_batch(
+    session, files, user, mode="replace", progress=None, job_id=None, force=False
+):
+    """Parse banyak workbook HNA secara paralel lalu tulis satu transaksi per file.
+
+    files adalah daftar (nama, bytes) berisi .xlsx dan/atau .zip.
+    progress(files_done, total_files) dipanggil setiap satu file selesai.
+    File yang isi dan periodenya sudah pernah diupload dilewati kecuali force.
+    Mengembalikan (daftar ringkasan per file, bytes Excel laporan error atau None).
+    """
+    workbooks = expand_uploads(files)
+    summary = []
+    errors = []
+    if not workbooks:
+        return summary, None
+
+    hashes = [file_sha256(data) for _, data in workbooks]
+    known = {} if force else find_uploads_by_hash(session, set(hashes))
+
+    if progress is not None:
+        progress(0, len(workbooks))
+
+    # "spawn" agar proses anak tidak mewarisi thread server Streamlit
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=min(BATCH_PARSE_WORKERS, len(workbooks)), mp_context=context
+    ) as pool:
+        futures = {
+            pool.submit(
+                parse_hna_workbook, name, data, user, known.get(digest, [])
+            ): digest
+            for (name, data), digest in zip(workbooks, hashes)
+        }
+        for future in as_completed(futures):
+            parsed = future.result()
+            if "errors" in parsed:
+                errors.append(parsed["errors"])
+            item = _write_parsed(session, parsed, mode)
+            if item["status"] == "done":
+                register_upload(
+                    session,
+                    futures[future],
+                    item["file"],
+                    item["region"],
+                    item["mitra"],
+                    item["bulan"],
+                    item["tahun"],
+                    user,
+                    job_id,
+                )
+            summary.append(item)
+            if progress is not None:
+                progress(len(summary), len(workbooks))
+
+    summary.sort(key=lambda item: item["file"])
+    error_report = build_error_workbook(pd.concat(errors)) if errors else None
+    return summary, error_report
+
+
+def _write_parsed(session, parsed, mode):
+    item = {
+        "file": parsed["file"],
+        "region": parsed.get("region"),
+        "mitra": parsed.get("mitra"),
+        "bulan": parsed.get("bulan"),
+        "tahun": parsed.get("tahun"),
+        "status": "failed",
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "skipped": parsed.get("skipped", 0),
+        "message": parsed.get("error"),
+    }
+    if "error" in parsed:
+        return item
+    if "previous" in parsed:
+        item.update(status="duplicate", message=describe_upload(parsed["previous"]))
+        return item
+
+    started = time.perf_counter()
+    try:
+        records = parsed["records"]
+        result = write_hna_records(
+            session, [records] if records is not None else [], mode
+        )
+    except Exception as e:
+        item["message"] = f"❌ Error upload: {e}"
+        return item
+
+    item.update(
+        status="done",
+        inserted=result["inserted"],
+        updated=result["updated"],
+        unchanged=result["unchanged"],
+        skipped=item["skipped"] + result["duplicates"],
+        message=f"{result['total']} baris dalam {time.perf_counter() - started:.1f} detik",
+    )
+    return item
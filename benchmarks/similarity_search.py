@@ -0,0 +1,111 @@
+"""Benchmark pencarian similarity nama barang: implementasi lama vs similarity.py.
+
+Lama: preprocess_text per nama setiap query lalu fuzzywuzzy process.extract.
+Baru: NameIndex (normalisasi sekali per versi data) lalu satu panggilan batch
+per query; dicatat waktu bangun index dan waktu per query dengan index siap.
+Implementasi lama dilewati di atas --legacy-max nama (bawaan 100000) karena
+terlalu lama; perbandingan di 1 juta nama butuh --legacy-max 1000000.
+
+Jalankan dari root repo:
+    python benchmarks/similarity_search.py --sizes 10000 100000 1000000
+    python benchmarks/similarity_search.py --sizes 1000000 --legacy-max 1000000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = [
+    "PARACETAMOL",
+    "AMOXICILLIN",
+    "VERBAN",
+    "ELASTIS",
+    "KASA",
+    "STERIL",
+    "INFUS",
+    "RINGER",
+    "LAKTAT",
+    "SPUIT",
+    "OMEPRAZOLE",
+    "CEFTRIAXONE",
+    "HANDSCOON",
+    "KATETER",
+    "NACL",
+    "DEXTROSE",
+]
+FORMS = ["TAB", "KAPS", "SIRUP", "INJ", "PER CM", "BTL", "AMP", "PCS"]
+QUERIES = ["paracetamol 500 mg tab", "verban elastis 8x4", "infus ringer laktat"]
+
+
+def make_names(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        f"{' '.join(rng.sample(WORDS, rng.randint(1, 3)))} "
+        f"{rng.choice([5, 10, 100, 250, 500, 1000])}{rng.choice(['MG', 'ML', 'G'])} "
+        f"{rng.choice(FORMS)} #{i}"
+        for i in range(n)
+    ]
+
+
+def preprocess_text(text):
+    """Normalisasi lama, dijalankan per nama pada setiap query"""
+    text = str(text).lower().strip()
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text
+
+
+def legacy_search(names, query, threshold=85, limit=20):
+    from fuzzywuzzy import process
+
+    query_processed = preprocess_text(query)
+    choices_processed = [preprocess_text(choice) for choice in names]
+    results = process.extract(query_processed, choices_processed, limit=limit)
+    return [r for r in results if r[1] >= threshold]
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--legacy-max", type=int, default=100000)
+    args = parser.parse_args()
+
+    import similarity
+
+    backend = "rapidfuzz" if similarity.rapid_process is not None else "fuzzywuzzy"
+    print(f"Backend similarity.py: {backend}; {len(QUERIES)} query per ukuran")
+    for size in args.sizes:
+        names = make_names(size)
+        legacy = None
+        if size <= args.legacy_max:
+            legacy = sum(timed(legacy_search, names, q)[0] for q in QUERIES)
+        build, index = timed(similarity.NameIndex, names)
+        search = sum(
+            timed(similarity.similarity_search, q, names, 85, 20, index)[0]
+            for q in QUERIES
+        )
+        per_query = lambda total: total / len(QUERIES) * 1000
+        legacy_text = "-" if legacy is None else f"{per_query(legacy):,.0f} ms"
+        speedup = "" if legacy is None else f" ({legacy / search:,.0f}x)"
+        print(
+            f"{size:>9,} nama: lama {legacy_text}/query, baru {per_query(search):,.0f}"
+            f" ms/query{speedup}, bangun index {build * 1000:,.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Benchmark pembaca vs upload besar pada SQLite, profil default vs production.
+
+Satu thread menulis upload HNA besar lewat write_hna_records (satu transaksi)
+sementara beberapa thread pembaca terus menjalankan query agregasi seperti
+halaman Data HNA, dan satu thread lain membuat job upload baru (transaksi
+tulis pendek). Dicatat latensi dan jumlah error "database is locked".
+
+Jalankan dari root repo:
+    python benchmarks/sqlite_contention.py --rows 200000 --readers 8
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SHORT_WRITE_SQL = """
+    INSERT INTO ingest_jobs (kind, status, created_by)
+    VALUES ('benchmark', 'done', 'benchmark')
+"""
+
+READ_SQL = """
+    SELECT mitra, periode_tahun, COUNT(*) AS n, AVG(hna) AS rata_rata
+    FROM hna_data GROUP BY mitra, periode_tahun
+"""
+
+
+def make_frames(rows, bulan, chunk_size=5000):
+    import pandas as pd
+
+    for start in range(0, rows, chunk_size):
+        n = min(chunk_size, rows - start)
+        codes = [f"K{start + i:07d}" for i in range(n)]
+        yield pd.DataFrame(
+            {
+                "region": "Jawa Barat",
+                "mitra": [f"RS {i % 20}" for i in range(start, start + n)],
+                "kode_item": codes,
+                "periode_bulan": bulan,
+                "periode_tahun": 2025,
+                "nama_barang": [f"OBAT {code}" for code in codes],
+                "group_transaksi": "OBAT",
+                "satuan": "TAB",
+                "hna": [1000.0 + i for i in range(n)],
+                "uploaded_by": "benchmark",
+            }
+        )
+
+
+def run_profile(profile, db_path, rows, readers, think):
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+
+    import db
+    from ingest import write_hna_records
+
+    engine = db.make_engine(f"sqlite:///{db_path}", profile=profile)
+    Session = sessionmaker(bind=engine)
+
+    # Data awal agar query pembaca punya sesuatu untuk dihitung
+    session = Session()
+    write_hna_records(session, make_frames(rows // 2, "Januari"))
+    session.close()
+
+    writing = threading.Event()
+    writing.set()
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+
+    def client(kind, sql):
+        while writing.is_set():
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(sql))
+            except OperationalError:
+                with lock:
+                    errors[kind] += 1
+                continue
+            with lock:
+                latencies[kind].append(time.perf_counter() - started)
+            # Jeda seperti user yang sedang membaca hasil sebelum rerun berikutnya
+            time.sleep(think)
+
+    threads = [
+        threading.Thread(target=client, args=("read", READ_SQL)) for _ in range(readers)
+    ]
+    threads.append(threading.Thread(target=client, args=("write", SHORT_WRITE_SQL)))
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    session = Session()
+    upload_error = None
+    try:
+        write_hna_records(session, make_frames(rows, "Februari"))
+    except OperationalError as e:
+        upload_error = str(e.orig)
+    finally:
+        session.close()
+        write_seconds = time.perf_counter() - started
+        writing.clear()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    result = {
+        "profile": profile,
+        "write_seconds": write_seconds,
+        "upload_error": upload_error,
+    }
+    for kind, values in latencies.items():
+        values.sort()
+        result[kind] = {
+            "count": len(values),
+            "p50_ms": statistics.median(values) * 1000 if values else None,
+            "p95_ms": values[int(len(values) * 0.95) - 1] * 1000 if values else None,
+            "max_ms": values[-1] * 1000 if values else None,
+            "errors": errors[kind],
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument(
+        "--think-ms", type=int, default=100, help="jeda tiap pembaca antar query"
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hna_bench_")
+    try:
+        # db.py membuat skema di ./hna_compare.db saat diimport
+        os.chdir(workdir)
+        import db
+
+        template = os.path.join(workdir, f"{db.DB_NAME}.db")
+        results = []
+        for profile in ("default", "production"):
+            path = os.path.join(workdir, f"{profile}.db")
+            shutil.copy(template, path)
+            results.append(
+                run_profile(
+                    profile, path, args.rows, args.readers, args.think_ms / 1000
+                )
+            )
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    fmt = lambda v: "-" if v is None else f"{v:,.1f}"
+    print(f"{args.rows:,} baris upload, {args.readers} pembaca bersamaan")
+    for result in results:
+        status = result["upload_error"] or "berhasil"
+        print(
+            f"{result['profile']}: upload {result['write_seconds']:.1f} dtk ({status})"
+        )
+        for kind, label in (("read", "baca"), ("write", "tulis pendek")):
+            stats = result[kind]
+            print(
+                f"  {label:>12}: {stats['count']} query, p50 {fmt(stats['p50_ms'])} ms, "
+                f"p95 {fmt(stats['p95_ms'])} ms, max {fmt(stats['max_ms'])} ms, "
+                f"{stats['errors']} error locked"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Dataset halaman data HNA dan penunjang, dengan snapshot Parquet.
+
+load_dataset membaca snapshot Parquet (memory-mapped, hanya kolom yang
+diminta) selama versi dataset di tabel data_version sama dengan versi saat
+snapshot ditulis. Jika snapshot basi atau belum ada, dataset dibaca dari SQL
+lalu snapshot ditulis ulang. Jalur upload dan hapus memanggil
+refresh_snapshot agar pembaca berikutnya langsung mendapat snapshot baru.
+
+Snapshot butuh pyarrow (ada di requirements.txt); tanpa itu dataset selalu
+dibaca dari SQL dan peringatan dicetak sekali saat modul di-import.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # opsional, lihat docstring modul
+    pa = pq = None
+    # Sekali per proses, saat modul di-import
+    print(
+        "⚠️ pyarrow tidak terpasang: snapshot Parquet nonaktif, dataset dibaca dari SQL"
+    )
+
+from hna_query import build_select
+from migrations import HNA_DIMENSIONS
+from result_cache import ResultCache
+from search_keys import search_keys
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+DATASET_CACHE_MB = int(os.getenv("DATASET_CACHE_MB", 512))
+
+# Satu cache per proses, dipakai bersama semua session Streamlit; antar
+# proses berbagi lewat snapshot Parquet
+dataset_cache = ResultCache(DATASET_CACHE_MB * 1024 * 1024)
+
+# Urutan kolom hna_data lama, dipertahankan untuk tampilan dan export;
+# nama_key (kunci pencarian, search_keys.py) ada di akhir dan tidak ditampilkan
+HNA_COLUMNS = [
+    "id",
+    "region",
+    "mitra",
+    "kode_item",
+    "nama_barang",
+    "group_transaksi",
+    "satuan",
+    "hna",
+    "periode_bulan",
+    "periode_tahun",
+    "uploaded_by",
+    "uploaded_at",
+    "nama_key",
+]
+
+PENUNJANG_COLUMNS = [
+    "id",
+    "mitra",
+    "kode",
+    "deskripsi",
+    "group_transaksi",
+    "satuan",
+    "uploaded_by",
+    "uploaded_at",
+    "deskripsi_key",
+]
+
+# Kolom tarif per kelas di dataset penunjang: "tarif:<column_name>"
+TARIF_PREFIX = "tarif:"
+
+
+def fill_search_keys(df, column, key_column):
+    """Hitung key_column yang kosong dari column (in-place).
+
+    Kunci ditulis saat upload; baris arsip atau yang ditulis lewat jalur lain
+    belum punya kunci, jadi hanya baris itu yang dinormalisasi di sini.
+    """
+    if key_column in df.columns:
+        keys = df[key_column].astype(object)
+    else:
+        keys = pd.Series(None, index=df.index, dtype=object)
+    missing = keys.isna().to_numpy()
+    if missing.any():
+        keys = keys.copy()
+        keys[missing] = search_keys(df.loc[missing, column])
+    df[key_column] = keys
+
+
+def build_hna_frame(connection, source="hna_fact", filters=None, limit=None):
+    """Baca hna_fact (atau view hna_fact_all); kolom dimensi jadi Categorical.
+
+    filters dan limit dijalankan di database (hna_query.build_select).
+    Kolom dimensi dibangun dari kode id tanpa membaca ulang string per
+    baris, sehingga memori dan waktu filter jauh lebih kecil.
+    """
+    sql, params = build_select(source, filters, limit)
+    df = pd.read_sql(sql, connection, params=params)
+    for column, (table, id_column) in HNA_DIMENSIONS.items():
+        dim = pd.read_sql(f"SELECT id, nama FROM {table} ORDER BY nama", connection)
+        # id dimensi -> posisi di daftar kategori (terurut nama)
+        lookup = np.full(int(dim["id"].max() if len(dim) else 0) + 1, -1)
+        lookup[dim["id"].to_numpy()] = np.arange(len(dim))
+        df[column] = pd.Categorical.from_codes(
+            lookup[df.pop(id_column).to_numpy(dtype="int64")],
+            categories=dim["nama"],
+        )
+    for column in ["periode_bulan", "uploaded_by"]:
+        df[column] = df[column].astype("category")
+    fill_search_keys(df, "nama_barang", "nama_key")
+    return df[HNA_COLUMNS]
+
+
+def _tarif_values(values):
+    # Parquet butuh satu tipe per kolom: angka jika semua nilai angka,
+    # selain itu teks apa adanya
+    numbers = pd.to_numeric(values, errors="coerce")
+    if numbers.notna().sum() == values.notna().sum():
+        return numbers.astype("float64")
+    return values.map(str, na_action="ignore")
+
+
+def build_penunjang_frame(connection):
+    """Data pakem penunjang + satu kolom tarif per kelas (format lebar)"""
+    df = pd.read_sql(
+        f"""
+        SELECT {", ".join(PENUNJANG_COLUMNS)}
+        FROM pemeriksaan_penunjang ORDER BY uploaded_at DESC
+        """,
+        connection,
+    )
+    fill_search_keys(df, "deskripsi", "deskripsi_key")
+    tarif = pd.read_sql(
+        """
+        SELECT penunjang_id, column_name, COALESCE(nilai, nilai_asli) AS nilai
+        FROM pemeriksaan_tarif ORDER BY id
+        """,
+        connection,
+    )
+    wide = tarif.pivot_table(
+        index="penunjang_id",
+        columns="column_name",
+        values="nilai",
+        aggfunc="first",
+        sort=False,
+    )
+    wide = wide.apply(_tarif_values).add_prefix(TARIF_PREFIX)
+    wide.columns.name = None
+    return df.join(wide, on="id")
+
+
+BUILDERS = {"hna": build_hna_frame, "penunjang": build_penunjang_frame}
+
+
+def data_version(connection, name):
+    """Versi dataset saat ini; naik setiap ada baris yang ditulis"""
+    return connection.execute(
+        text("SELECT version FROM data_version WHERE name = :name"), {"name": name}
+    ).scalar_one()
+
+
+def snapshot_path(connection, name):
+    """Path snapshot di sebelah file SQLite, atau None jika bukan SQLite"""
+    url = connection.engine.url
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    folder = os.path.join(os.path.dirname(os.path.abspath(url.database)), SNAPSHOT_DIR)
+    return os.path.join(folder, f"{name}.parquet")
+
+
+def read_snapshot(connection, name, columns=None):
+    """Snapshot yang masih berlaku, atau None. Kolom yang tidak ada dilewati."""
+    path = snapshot_path(connection, name)
+    if pq is None or path is None or not os.path.exists(path):
+        return None
+    schema = pq.read_schema(path, memory_map=True)
+    snapshot_version = (schema.metadata or {}).get(b"data_version")
+    if snapshot_version != str(data_version(connection, name)).encode():
+        return None
+    if columns is not None:
+        columns = [column for column in columns if column in schema.names]
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def write_snapshot(connection, name, df, version):
+    """Tulis snapshot secara atomik (file sementara lalu os.replace)"""
+    path = snapshot_path(connection, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"data_version"] = str(version).encode()
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), temp_path)
+    os.replace(temp_path, path)
+
+
+def refresh_snapshot(connection, name):
+    """Baca dataset dari SQL dan tulis ulang snapshot; mengembalikan DataFrame"""
+    if pq is None or snapshot_path(connection, name) is None:
+        return BUILDERS[name](connection)
+    # Versi dibaca sebelum data: jika ada tulisan di antaranya, snapshot
+    # tercatat lebih tua dari isinya dan dibangun ulang pada pembacaan berikut
+    version = data_version(connection, name)
+    df = BUILDERS[name](connection)
+    try:
+        write_snapshot(connection, name, df, version)
+    except (OSError, pa.ArrowException) as e:
+        print(f"⚠️ Snapshot {name} tidak bisa ditulis: {e}")
+    return df
+
+
+def cached_frame(connection, name, key, loader):
+    """Hasil loader() dari cache selama versi dataset name belum berubah.
+
+    Yang dikembalikan salinan dangkal (copy-on-write), jadi pemanggil boleh
+    menambah atau mengubah kolom tanpa mengubah isi cache.
+    """
+    if connection.dialect.name != "sqlite":
+        return loader()
+    # Versi dibaca sebelum data, sama seperti refresh_snapshot
+    version = data_version(connection, name)
+    df = dataset_cache.get((name, key), version)
+    if df is None:
+        df = loader()
+        dataset_cache.put((name, key), version, df)
+    return df.copy(deep=False)
+
+
+def _read_dataset(connection, name, columns):
+    df = read_snapshot(connection, name, columns)
+    if df is None:
+        df = refresh_snapshot(connection, name)
+        if columns is not None:
+            df = df[[column for column in columns if column in df.columns]]
+    return df
+
+
+def load_dataset(connection, name, columns=None):
+    """Dataset dari cache, snapshot yang masih berlaku, atau SQL.
+
+    columns membatasi kolom yang dibaca; kolom yang tidak ada dilewati.
+    """
+    key = ("dataset", None if columns is None else tuple(columns))
+    return cached_frame(
+        connection, name, key, lambda: _read_dataset(connection, name, columns)
+    )
@@ -1,8 +1,12 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+from collections import deque
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
-import sqlite3
+from hna_archive import attach_archives
+from migrations import run_migrations
 
 load_dotenv()
 
@@ -21,89 +25,169 @@ else:
     DB_NAME = os.getenv("DB_NAME", "hna_compare")
     DATABASE_URL = f"sqlite:///./{DB_NAME}.db"
 
-engine = create_engine(DATABASE_URL)
+# Profil SQLite untuk banyak sesi Streamlit sekaligus. WAL membuat pembaca
+# tidak terblokir oleh upload yang sedang menulis; busy_timeout membuat
+# penulis kedua menunggu giliran alih-alih langsung "database is locked".
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    # NORMAL aman untuk WAL: commit tidak hilang kecuali listrik/OS mati
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 30000)),
+    # Negatif = KiB, jadi -65536 = 64 MB cache halaman per koneksi
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -65536)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 268435456)),
+    "temp_store": "MEMORY",
+}
+
+SQLITE_POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 20)),
+    "pool_timeout": 30,
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def make_engine(database_url, profile=DB_PROFILE):
+    """Buat engine; untuk SQLite profil "production" memasang pragma dan pool di atas.
+
+    Setiap koneksi SQLite juga meng-attach arsip HNA per tahun (hna_archive.py).
+    """
+    if not database_url.startswith("sqlite"):
+        return create_engine(database_url)
+
+    if profile != "production":
+        new_engine = create_engine(database_url)
+    else:
+        new_engine = create_engine(
+            database_url,
+            # Koneksi dipakai bergantian oleh thread Streamlit dan thread job upload
+            connect_args={
+                "check_same_thread": False,
+                "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+            },
+            **SQLITE_POOL_SETTINGS,
+        )
+        event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+    event.listen(new_engine, "connect", attach_archives)
+    return new_engine
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine)
 
-# Migrasi data dari mysql ke sqlite
-def migrate_mysql_to_sqlite():
-    """Migrate data dari MySQL ke SQLite jika diperlukan"""
+
+class PoolMetrics:
+    """Statistik pool koneksi engine: jumlah checkout dan lama menunggu koneksi.
+
+    Jumlah checkout dari event checkout pool. Lama menunggu diukur per
+    Session, dari awal transaksi sampai koneksi didapat (after_transaction_create
+    sampai after_begin), jadi termasuk waktu antre saat semua koneksi sedang
+    dipakai dan waktu membuka koneksi baru.
+    """
+
+    def __init__(self, engine, samples=1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self.engine = engine
+        self.pool = engine.pool
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.max_wait = 0.0
+        self._started_key = ("pool_metrics_started", id(self))
+
+        for target, name, listener in self._listeners():
+            event.listen(target, name, listener)
+
+    def _listeners(self):
+        return [
+            (self.engine, "checkout", self._on_checkout),
+            (self.engine, "connect", self._on_connect),
+            (self.engine, "invalidate", self._on_invalidate),
+            (Session, "after_transaction_create", self._on_transaction_create),
+            (Session, "after_begin", self._on_begin),
+        ]
+
+    def close(self):
+        """Lepas listener dari engine dan Session"""
+        for target, name, listener in self._listeners():
+            if event.contains(target, name, listener):
+                event.remove(target, name, listener)
+
+    def _on_transaction_create(self, session, transaction):
+        if transaction.parent is None:
+            session.info[self._started_key] = time.perf_counter()
+
+    def _on_begin(self, session, transaction, connection):
+        started = session.info.pop(self._started_key, None)
+        if started is not None and connection.engine is self.engine:
+            self._record_wait(time.perf_counter() - started)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _record_wait(self, seconds):
+        with self._lock:
+            self.max_wait = max(self.max_wait, seconds)
+            self._waits.append(seconds)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        """Ringkasan saat ini; lama checkout dalam milidetik dari sampel terakhir"""
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+        def percentile_ms(q):
+            return waits[int(q * (len(waits) - 1))] * 1000 if waits else 0.0
+
+        stats.update(
+            p50_wait_ms=percentile_ms(0.50),
+            p95_wait_ms=percentile_ms(0.95),
+            # Tidak semua pool punya ukuran (mis. NullPool/StaticPool)
+            pool_size=getattr(self.pool, "size", lambda: None)(),
+            checked_out=getattr(self.pool, "checkedout", lambda: None)(),
+            overflow=getattr(self.pool, "overflow", lambda: None)(),
+        )
+        return stats
+
+
+def ensure_schema():
+    """Buat database SQLite jika belum ada lalu jalankan migrasi yang belum diterapkan"""
+    if DB_TYPE == "mysql":
+        return True
     try:
         if not os.path.exists(f"{DB_NAME}.db"):
             print("🗃️ Membuat database SQLite...")
-            
-            # Buat koneksi SQLite
-            sqlite_conn = sqlite3.connect(f"{DB_NAME}.db")
-            cursor = sqlite_conn.cursor()
-            
-            # Buat tabel users
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    role TEXT NOT NULL DEFAULT 'user',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Buat tabel hna_data
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS hna_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    region TEXT NOT NULL,
-                    mitra TEXT NOT NULL,
-                    kode_item TEXT NOT NULL,
-                    nama_barang TEXT NOT NULL,
-                    group_transaksi TEXT NOT NULL,
-                    satuan TEXT NOT NULL,
-                    hna REAL NOT NULL,
-                    periode_bulan TEXT NOT NULL,
-                    periode_tahun INTEGER NOT NULL,
-                    uploaded_by TEXT NOT NULL,
-                    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Buat tabel pemeriksaan_penunjang
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS pemeriksaan_penunjang (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    mitra TEXT NOT NULL,
-                    kode TEXT NOT NULL,
-                    deskripsi TEXT NOT NULL,
-                    group_transaksi TEXT NOT NULL,
-                    satuan TEXT NOT NULL,
-                    additional_data TEXT,
-                    uploaded_by TEXT NOT NULL,
-                    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Buat tabel pemeriksaan_columns_metadata
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS pemeriksaan_columns_metadata (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    column_name TEXT UNIQUE NOT NULL,
-                    display_name TEXT NOT NULL,
-                    created_by TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Tambah user admin default jika belum ada
-            cursor.execute("""
-                INSERT OR IGNORE INTO users (username, password, role) 
-                VALUES ('admin', 'admin', 'admin')
-            """)
-            
-            sqlite_conn.commit()
-            sqlite_conn.close()
-            
-            print("✅ Database SQLite berhasil dibuat!")
+        applied = run_migrations(f"{DB_NAME}.db")
+        if applied:
+            print(f"✅ Migrasi skema diterapkan: {', '.join(applied)}")
         return True
     except Exception as e:
-        print(f"❌ Error membuat database SQLite: {e}")
+        print(f"❌ Error migrasi skema SQLite: {e}")
         return False
 
+
 # Jalankan migrasi saat import
-migrate_mysql_to_sqlite()
\ No newline at end of file
+ensure_schema()
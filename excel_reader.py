@@ -0,0 +1,73 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+# Jumlah baris Excel per chunk. Puncak memori ditentukan oleh angka ini,
+# bukan oleh ukuran file.
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _normalize_header(raw_header):
+    """Rapikan baris header: buang kolom kosong di kanan, beri nama seperti pandas"""
+    header = list(raw_header)
+    while header and header[-1] is None:
+        header.pop()
+    return [
+        f"Unnamed: {idx}" if value is None else str(value).strip()
+        for idx, value in enumerate(header)
+    ]
+
+
+def iter_excel_chunks(
+    file,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    validate_header=None,
+    sheet_name=None,
+    progress=None,
+):
+    """Baca file Excel secara streaming (openpyxl read-only) per chunk DataFrame.
+
+    validate_header(header) dipanggil sebelum baris data pertama dibaca,
+    sehingga file dengan format salah ditolak tanpa membaca seluruh isinya.
+    Baris yang seluruh selnya kosong dilewati, sama seperti pd.read_excel.
+    Index setiap chunk adalah nomor baris di Excel (header = baris 1).
+    progress(rows_done, total_rows) dipanggil setiap kali chunk selesai diproses
+    oleh pemanggil; total_rows adalah perkiraan dari dimensi sheet.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+
+        header = _normalize_header(next(rows, ()))
+        if validate_header is not None:
+            validate_header(header)
+
+        width = len(header)
+        total_rows = max((worksheet.max_row or 1) - 1, 0)
+        rows_done = 0
+        buffer = []
+        row_numbers = []
+        for row_number, row in enumerate(rows, start=2):
+            row = row[:width]
+            if all(value is None for value in row):
+                continue
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            buffer.append(row)
+            row_numbers.append(row_number)
+
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header, index=row_numbers)
+                rows_done += len(buffer)
+                buffer = []
+                row_numbers = []
+                if progress is not None:
+                    progress(rows_done, max(total_rows, rows_done))
+
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header, index=row_numbers)
+            rows_done += len(buffer)
+        if progress is not None:
+            progress(rows_done, rows_done)
+    finally:
+        workbook.close()
@@ -3,7 +3,7 @@ import gspread
 from google.oauth2.service_account import Credentials
 import streamlit as st
 from db import SessionLocal
-import json
+from models_penunjang import PemeriksaanPenunjang
 
 # Konfigurasi Google Sheets API
 SCOPES = [
@@ -69,30 +69,17 @@ class GoogleSheetsExporter:
             # Load data dari database
             session = SessionLocal()
             df = pd.read_sql("SELECT * FROM pemeriksaan_penunjang ORDER BY uploaded_at DESC", session.bind)
-            session.close()
             
             if df.empty:
+                session.close()
                 st.warning("Tidak ada data Penunjang untuk diexport")
                 return
             
-            # Parse JSON additional_data
-            if not df.empty and 'additional_data' in df.columns:
-                df['additional_data'] = df['additional_data'].apply(
-                    lambda x: json.loads(x) if x else {}
-                )
-                
-                # Extract additional columns
-                additional_cols = set()
-                for data in df['additional_data']:
-                    if data:
-                        additional_cols.update(data.keys())
-                
-                # Add additional columns to dataframe
-                for col in additional_cols:
-                    df[col] = df['additional_data'].apply(lambda x: x.get(col, ''))
-                
-                # Drop the original additional_data column
-                df = df.drop('additional_data', axis=1)
+            # Tambahkan kolom tarif per kelas dari pemeriksaan_tarif
+            tarif_wide = PemeriksaanPenunjang(session).load_tarif_wide()
+            df = df.drop('additional_data', axis=1).join(tarif_wide, on='id')
+            df = df.astype(object).where(df.notna(), '')
+            session.close()
             
             # Buka atau buat spreadsheet
             try:
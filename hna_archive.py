@@ -0,0 +1,354 @@
+"""Arsip HNA per tahun: tahun yang sudah ditutup dipindah ke file SQLite sendiri.
+
+Data tahun berjalan tetap di hna_fact, jadi load_data dan semua filter/upsert
+hanya menyentuh data aktif. Setiap tahun yang diarsipkan disalin ke
+arsip_hna/hna_<tahun>.db (tabel WITHOUT ROWID terurut per key, tanpa index
+tambahan, di-VACUUM lalu dibuat read-only), dihapus dari hna_fact, dan
+dicatat di tabel hna_archive.
+
+Setiap koneksi SQLite meng-attach file arsip secara read-only dan membuat
+view sementara hna_fact_all (hna_fact + semua arsip) untuk tampilan lintas
+tahun. Tahun yang diarsipkan tidak bisa diupload ulang sebelum dipulihkan.
+
+Setelah dipulihkan, koneksi lain yang masih meng-attach arsip itu melepasnya
+lewat refresh_archives sebelum membaca hna_fact_all. Dari proses yang sama,
+berikan engine ke restore_year agar pool-nya di-dispose; dari CLI saat
+aplikasi berjalan, file arsip yang masih terbuka (Windows) tidak bisa dihapus
+dan dibersihkan saat tahun itu diarsipkan lagi.
+
+Contoh:
+    python hna_archive.py --daftar
+    python hna_archive.py --tahun 2023
+    python hna_archive.py --tahun 2023 --pulihkan
+"""
+
+import argparse
+import datetime
+import os
+import pathlib
+import sqlite3
+
+from sqlalchemy import text
+
+from migrations import run_migrations
+from search_keys import search_key
+
+ARCHIVE_DIR = "arsip_hna"
+
+# Batas bawaan SQLite untuk database yang di-attach per koneksi
+MAX_ATTACHED_ARCHIVES = 10
+
+ARCHIVE_CHUNK_SIZE = 10000
+
+# Arsip yang ikut di-attach (dan masuk hna_fact_all): tahun terbaru dulu
+ATTACHABLE_ARCHIVES_SQL = (
+    "SELECT periode_tahun, path FROM hna_archive "
+    "ORDER BY periode_tahun DESC LIMIT :limit"
+)
+
+FACT_COLUMNS = [
+    "id",
+    "region_id",
+    "mitra_id",
+    "kode_item",
+    "nama_barang",
+    "nama_key",
+    "group_id",
+    "satuan_id",
+    "hna",
+    "periode_bulan",
+    "periode_tahun",
+    "uploaded_by",
+    "uploaded_at",
+]
+_FACT_COLS = ", ".join(FACT_COLUMNS)
+
+# Key unik hna_fact dijadikan primary key clustered, jadi arsip tidak butuh
+# index terpisah dan baris satu mitra/periode tersimpan berdekatan
+ARCHIVE_TABLE_SQL = """
+    CREATE TABLE hna_fact (
+        id INTEGER NOT NULL,
+        region_id INTEGER NOT NULL,
+        mitra_id INTEGER NOT NULL,
+        kode_item TEXT NOT NULL,
+        nama_barang TEXT NOT NULL,
+        nama_key TEXT,
+        group_id INTEGER NOT NULL,
+        satuan_id INTEGER NOT NULL,
+        hna REAL NOT NULL,
+        periode_bulan TEXT NOT NULL,
+        periode_tahun INTEGER NOT NULL,
+        uploaded_by TEXT NOT NULL,
+        uploaded_at TIMESTAMP,
+        PRIMARY KEY (region_id, mitra_id, kode_item, periode_bulan, periode_tahun)
+    ) WITHOUT ROWID
+"""
+
+
+class ArchiveError(Exception):
+    """Error arsip yang pesannya aman ditampilkan ke user"""
+
+
+def archive_relpath(tahun):
+    """Path file arsip, relatif terhadap folder database utama"""
+    return f"{ARCHIVE_DIR}/hna_{int(tahun)}.db"
+
+
+def _archive_uri(path):
+    # immutable: file tidak pernah berubah, jadi SQLite tidak perlu mengunci
+    return pathlib.Path(path).resolve().as_uri() + "?mode=ro&immutable=1"
+
+
+def _connect(db_path):
+    # isolation_level=None: transaksi diatur manual dengan BEGIN IMMEDIATE
+    return sqlite3.connect(db_path, isolation_level=None, timeout=30)
+
+
+def _registered(conn, tahun):
+    return conn.execute(
+        "SELECT path FROM hna_archive WHERE periode_tahun = ?", (int(tahun),)
+    ).fetchone()
+
+
+def _archive_cols(conn, schema):
+    """Daftar SELECT FACT_COLUMNS dari arsip; kolom yang belum ada di arsip lama
+    (nama_key) dibaca sebagai NULL"""
+    present = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(hna_fact)")}
+    return ", ".join(
+        column if column in present else f"NULL AS {column}" for column in FACT_COLUMNS
+    )
+
+
+def archive_year(db_path, tahun, archived_by="admin"):
+    """Pindahkan semua data HNA satu tahun tertutup ke file arsip read-only.
+
+    Mengembalikan dict: tahun, rows, size_bytes, path.
+    """
+    tahun = int(tahun)
+    if tahun >= datetime.date.today().year:
+        raise ArchiveError(f"❌ Tahun {tahun} belum ditutup, tidak bisa diarsipkan.")
+
+    relpath = archive_relpath(tahun)
+    path = os.path.join(os.path.dirname(os.path.abspath(db_path)), relpath)
+    conn = _connect(db_path)
+    try:
+        if _registered(conn, tahun):
+            raise ArchiveError(f"❌ Tahun {tahun} sudah diarsipkan.")
+
+        # Sisa arsip dari proses yang terhenti sebelum commit dibuat ulang
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.chmod(path, 0o644)
+            os.remove(path)
+
+        # Write lock di database utama selama penyalinan: tidak ada upload
+        # yang bisa menambah baris tahun ini sebelum baris dihapus
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            archive = sqlite3.connect(path)
+            try:
+                archive.execute(ARCHIVE_TABLE_SQL)
+                rows = conn.execute(
+                    f"SELECT {_FACT_COLS} FROM hna_fact WHERE periode_tahun = ?",
+                    (tahun,),
+                )
+                copied = 0
+                while batch := rows.fetchmany(ARCHIVE_CHUNK_SIZE):
+                    archive.executemany(
+                        f"INSERT INTO hna_fact ({_FACT_COLS}) "
+                        f"VALUES ({', '.join('?' for _ in FACT_COLUMNS)})",
+                        batch,
+                    )
+                    copied += len(batch)
+                archive.commit()
+                if copied == 0:
+                    raise ArchiveError(f"❌ Tidak ada data HNA tahun {tahun}.")
+                archive.execute("VACUUM")
+            finally:
+                archive.close()
+            os.chmod(path, 0o444)
+            size_bytes = os.path.getsize(path)
+
+            conn.execute("DELETE FROM hna_fact WHERE periode_tahun = ?", (tahun,))
+            conn.execute(
+                """
+                INSERT INTO hna_archive
+                    (periode_tahun, path, row_count, size_bytes, archived_by)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (tahun, relpath, copied, size_bytes, archived_by),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            if os.path.exists(path):
+                os.chmod(path, 0o644)
+                os.remove(path)
+            raise
+    finally:
+        conn.close()
+    return {"tahun": tahun, "rows": copied, "size_bytes": size_bytes, "path": path}
+
+
+def restore_year(db_path, tahun, engine=None):
+    """Kembalikan data tahun yang diarsipkan ke hna_fact (mis. untuk koreksi).
+
+    engine: engine aplikasi di proses ini; pool-nya di-dispose sebelum file
+    arsip dihapus agar tidak ada koneksi yang masih meng-attach file itu.
+    Mengembalikan jumlah baris yang dipulihkan.
+    """
+    tahun = int(tahun)
+    conn = _connect(db_path)
+    try:
+        registered = _registered(conn, tahun)
+        if not registered:
+            raise ArchiveError(f"❌ Tahun {tahun} tidak ada di arsip.")
+        path = os.path.join(os.path.dirname(os.path.abspath(db_path)), registered[0])
+
+        # ATTACH tidak boleh di dalam transaksi
+        conn.execute("ATTACH DATABASE ? AS arsip", (_archive_uri(path),))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            restored = conn.execute(
+                f"INSERT INTO main.hna_fact ({_FACT_COLS}) "
+                f"SELECT {_archive_cols(conn, 'arsip')} FROM arsip.hna_fact"
+            ).rowcount
+            # Arsip lama belum menyimpan nama_key
+            missing = conn.execute(
+                "SELECT id, nama_barang FROM main.hna_fact "
+                "WHERE periode_tahun = ? AND nama_key IS NULL",
+                (tahun,),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE main.hna_fact SET nama_key = ? WHERE id = ?",
+                [(search_key(nama), row_id) for row_id, nama in missing],
+            )
+            conn.execute("DELETE FROM hna_archive WHERE periode_tahun = ?", (tahun,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("DETACH DATABASE arsip")
+    finally:
+        conn.close()
+    if engine is not None:
+        engine.dispose()
+    try:
+        os.chmod(path, 0o644)
+        os.remove(path)
+    except OSError as e:
+        # Masih di-attach koneksi proses lain; dihapus saat diarsipkan lagi
+        print(f"⚠️ File arsip {path} tidak bisa dihapus: {e}")
+    return restored
+
+
+def attach_archives(dbapi_connection, connection_record=None):
+    """Attach arsip terdaftar (read-only) dan buat view sementara hna_fact_all.
+
+    Dipasang sebagai event "connect" engine SQLite; aman dipanggil ulang,
+    hanya arsip yang berubah sejak panggilan terakhir yang di-attach/detach.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT 1 FROM main.sqlite_master WHERE type = 'table' "
+            "AND name = 'hna_archive'"
+        )
+        if cursor.fetchone() is None:
+            return
+        databases = cursor.execute("PRAGMA database_list").fetchall()
+        main_file = next(path for _, name, path in databases if name == "main")
+        attached = {name for _, name, _ in databases if name.startswith("arsip_")}
+        wanted = {
+            f"arsip_{tahun}": os.path.join(os.path.dirname(main_file), path)
+            for tahun, path in cursor.execute(
+                ATTACHABLE_ARCHIVES_SQL, {"limit": MAX_ATTACHED_ARCHIVES}
+            ).fetchall()
+        }
+        cursor.execute("SELECT 1 FROM temp.sqlite_master WHERE name = 'hna_fact_all'")
+        if attached == set(wanted) and cursor.fetchone() is not None:
+            return
+
+        cursor.execute("DROP VIEW IF EXISTS temp.hna_fact_all")
+        for name in attached - set(wanted):
+            cursor.execute(f"DETACH DATABASE {name}")
+        for name in sorted(set(wanted) - attached):
+            try:
+                cursor.execute(
+                    f"ATTACH DATABASE ? AS {name}", (_archive_uri(wanted[name]),)
+                )
+            except sqlite3.Error as e:
+                print(f"⚠️ Arsip {wanted[name]} tidak bisa dibuka: {e}")
+                del wanted[name]
+
+        selects = [f"SELECT {_FACT_COLS} FROM main.hna_fact"] + [
+            f"SELECT {_archive_cols(cursor, name)} FROM {name}.hna_fact"
+            for name in sorted(wanted)
+        ]
+        cursor.execute(
+            f"CREATE TEMP VIEW hna_fact_all AS {' UNION ALL '.join(selects)}"
+        )
+    finally:
+        cursor.close()
+
+
+def refresh_archives(session):
+    """Samakan arsip yang ter-attach di koneksi session dengan tabel hna_archive"""
+    dbapi_connection = session.connection().connection.driver_connection
+    # ATTACH/DETACH tidak boleh di dalam transaksi; view lama tetap dipakai
+    if not dbapi_connection.in_transaction:
+        attach_archives(dbapi_connection)
+
+
+def archived_years(session):
+    """Tahun arsip yang ikut di hna_fact_all, terbaru dulu.
+
+    Hanya MAX_ATTACHED_ARCHIVES tahun terbaru yang di-attach; arsip yang lebih
+    lama tetap tercatat (lihat --daftar) tapi tidak ikut ditampilkan.
+    """
+    rows = session.execute(
+        text(ATTACHABLE_ARCHIVES_SQL), {"limit": MAX_ATTACHED_ARCHIVES}
+    )
+    return [row[0] for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="hna_compare.db", help="file SQLite utama")
+    parser.add_argument("--tahun", type=int, help="tahun yang diarsipkan/dipulihkan")
+    parser.add_argument(
+        "--pulihkan", action="store_true", help="kembalikan arsip ke data aktif"
+    )
+    parser.add_argument("--daftar", action="store_true", help="tampilkan arsip")
+    parser.add_argument("--user", default="admin", help="dicatat sebagai pengarsip")
+    args = parser.parse_args()
+
+    run_migrations(args.db)
+    if args.daftar or args.tahun is None:
+        conn = sqlite3.connect(args.db)
+        for tahun, path, rows, size, user, at in conn.execute(
+            "SELECT periode_tahun, path, row_count, size_bytes, archived_by, "
+            "archived_at FROM hna_archive ORDER BY periode_tahun"
+        ):
+            print(
+                f"  {tahun}  {rows:>10,} baris  {size / 1e6:>8.1f} MB  {path}  ({user}, {at})"
+            )
+        conn.close()
+        return
+
+    try:
+        if args.pulihkan:
+            rows = restore_year(args.db, args.tahun)
+            print(f"✅ {rows:,} baris tahun {args.tahun} dikembalikan ke data aktif")
+        else:
+            result = archive_year(args.db, args.tahun, args.user)
+            print(
+                f"✅ {result['rows']:,} baris tahun {args.tahun} diarsipkan ke "
+                f"{result['path']} ({result['size_bytes'] / 1e6:.1f} MB)"
+            )
+    except ArchiveError as e:
+        print(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Filter data HNA sebagai klausa WHERE berparameter.
+
+Filter halaman data (region/mitra/group/satuan/bulan/tahun) dijalankan di
+database, sehingga hanya baris yang cocok yang dibaca. Kolom dimensi
+dicocokkan lewat id (subquery ke tabel dim_*) agar index hna_fact bisa
+dipakai. Nilai None, "" dan "Semua" berarti filter tidak dipakai.
+"""
+
+import os
+
+from sqlalchemy import text
+
+from migrations import HNA_DIMENSIONS
+
+# Batas baris halaman data saat tidak ada pencarian nama
+HNA_PAGE_LIMIT = int(os.getenv("HNA_PAGE_LIMIT", 5000))
+
+PERIODE_COLUMNS = ["periode_bulan", "periode_tahun"]
+
+FILTER_COLUMNS = list(HNA_DIMENSIONS) + PERIODE_COLUMNS
+
+
+def active_filters(filters):
+    """Filter yang benar-benar dipilih user"""
+    active = {}
+    for column, value in (filters or {}).items():
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"Filter tidak dikenal: {column}")
+        if value is None or value == "" or value == "Semua":
+            continue
+        active[column] = value
+    return active
+
+
+def build_where(filters):
+    """Klausa WHERE untuk hna_fact (atau hna_fact_all) dan parameternya"""
+    clauses = []
+    params = {}
+    for column, value in active_filters(filters).items():
+        if column in HNA_DIMENSIONS:
+            table, id_column = HNA_DIMENSIONS[column]
+            clauses.append(
+                f"{id_column} = (SELECT id FROM {table} WHERE nama = :{column})"
+            )
+        else:
+            clauses.append(f"{column} = :{column}")
+        params[column] = value
+    return " AND ".join(clauses) or "1 = 1", params
+
+
+def build_select(source="hna_fact", filters=None, limit=None):
+    """SELECT baris terbaru dulu dari source, difilter dan dibatasi limit"""
+    where, params = build_where(filters)
+    sql = f"SELECT * FROM {source} WHERE {where} ORDER BY uploaded_at DESC"
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = int(limit)
+    return text(sql), params
+
+
+def filter_options(connection, source="hna_fact"):
+    """Nilai yang tersedia untuk setiap filter, hanya yang punya data"""
+    options = {}
+    for column, (table, id_column) in HNA_DIMENSIONS.items():
+        options[column] = connection.execute(text(f"""
+            SELECT d.nama FROM {table} d
+            WHERE EXISTS (SELECT 1 FROM {source} f WHERE f.{id_column} = d.id)
+            ORDER BY d.nama
+        """)).scalars().all()
+    for column in PERIODE_COLUMNS:
+        options[column] = (
+            connection.execute(
+                text(f"SELECT DISTINCT {column} FROM {source} ORDER BY {column}")
+            )
+            .scalars()
+            .all()
+        )
+    return options
+
+
+def filter_frame(df, filters):
+    """Filter yang sama untuk DataFrame yang sudah terbaca (mis. hasil upload)"""
+    for column, value in active_filters(filters).items():
+        df = df[df[column] == value]
+    return df
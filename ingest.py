@@ -0,0 +1,478 @@
+import json
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from excel_reader import DEFAULT_CHUNK_SIZE, iter_excel_chunks
+from migrations import HNA_DIMENSIONS
+from search_keys import search_keys
+from validation import (
+    HNA_EXCEL_COLUMNS,
+    HNAValidator,
+    build_error_workbook,
+    parse_numbers,
+)
+
+# Jumlah baris per executemany. Cukup besar agar overhead per statement kecil,
+# tapi tetap jauh di bawah batas memori worker Streamlit.
+BULK_BATCH_SIZE = 5000
+
+PERIODE_BULAN = [
+    "Januari",
+    "Februari",
+    "Maret",
+    "April",
+    "Mei",
+    "Juni",
+    "Juli",
+    "Agustus",
+    "September",
+    "Oktober",
+    "November",
+    "Desember",
+]
+
+HNA_COLUMN_MAPPING = {
+    "Kode Item": "kode_item",
+    "Nama Barang": "nama_barang",
+    "Group Transaki": "group_transaksi",
+    "Satuan": "satuan",
+    "HNA": "hna",
+}
+
+HNA_KEY_COLUMNS = ["region", "mitra", "kode_item", "periode_bulan", "periode_tahun"]
+
+# nama_key: kunci pencarian nama_barang (search_keys.py), dihitung saat upload
+HNA_VALUE_COLUMNS = ["nama_barang", "nama_key", "group_transaksi", "satuan", "hna"]
+
+HNA_INSERT_COLUMNS = HNA_KEY_COLUMNS + HNA_VALUE_COLUMNS + ["uploaded_by"]
+
+# Mode upload HNA terhadap baris yang key-nya (region, mitra, kode_item,
+# periode) sudah ada di database
+UPLOAD_MODES = {
+    "replace": "Ganti data lama dengan data baru",
+    "skip": "Lewati data yang sudah ada",
+}
+
+
+def _fact_column(col):
+    return HNA_DIMENSIONS[col][1] if col in HNA_DIMENSIONS else col
+
+
+HNA_FACT_KEY_COLUMNS = [_fact_column(col) for col in HNA_KEY_COLUMNS]
+HNA_FACT_VALUE_COLUMNS = [_fact_column(col) for col in HNA_VALUE_COLUMNS]
+HNA_FACT_INSERT_COLUMNS = [_fact_column(col) for col in HNA_INSERT_COLUMNS]
+
+_HNA_COLS = ", ".join(HNA_INSERT_COLUMNS)
+_HNA_KEYS = ", ".join(HNA_KEY_COLUMNS)
+_FACT_COLS = ", ".join(HNA_FACT_INSERT_COLUMNS)
+_FACT_KEYS = ", ".join(HNA_FACT_KEY_COLUMNS)
+_FACT_KEY_JOIN = " AND ".join(f"h.{col} = s.{col}" for col in HNA_FACT_KEY_COLUMNS)
+_FACT_SAME_VALUES = " AND ".join(
+    f"h.{col} IS s.{col}" for col in HNA_FACT_VALUE_COLUMNS
+)
+_FACT_SET_VALUES = ", ".join(
+    f"{col} = excluded.{col}" for col in HNA_FACT_VALUE_COLUMNS
+)
+_FACT_CHANGED_VALUES = " OR ".join(
+    f"hna_fact.{col} IS NOT excluded.{col}" for col in HNA_FACT_VALUE_COLUMNS
+)
+
+# Tabel staging per koneksi; file ditampung di sini dulu (masih berupa teks)
+# agar jumlah baris baru/berubah/tetap bisa dihitung dan ditulis dengan satu
+# statement set-based
+HNA_STAGING_CREATE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS hna_staging (
+        region TEXT,
+        mitra TEXT,
+        kode_item TEXT,
+        periode_bulan TEXT,
+        periode_tahun INTEGER,
+        nama_barang TEXT,
+        nama_key TEXT,
+        group_transaksi TEXT,
+        satuan TEXT,
+        hna REAL,
+        uploaded_by TEXT
+    )
+"""
+
+HNA_STAGING_INSERT_SQL = f"""
+    INSERT INTO hna_staging ({_HNA_COLS})
+    VALUES ({", ".join(":" + col for col in HNA_INSERT_COLUMNS)})
+"""
+
+# Statement tulis kosong untuk mengambil write lock hna_fact sebelum transaksi
+# membaca tabel itu. Jika transaksi sudah membaca lalu baru menulis, SQLite
+# langsung menolak dengan "database is locked" (tanpa menunggu busy_timeout)
+# bila ada penulis lain yang commit di antaranya.
+HNA_WRITE_LOCK_SQL = "DELETE FROM hna_fact WHERE 0"
+
+# Tahun di file upload yang sudah dipindah ke arsip (lihat hna_archive.py)
+HNA_STAGING_ARCHIVED_SQL = """
+    SELECT DISTINCT periode_tahun FROM hna_staging
+    WHERE periode_tahun IN (SELECT periode_tahun FROM hna_archive)
+"""
+
+# Pengaman: kode item ganda sudah ditolak HNAValidator, tapi jika lolos
+# (mis. data dari sumber lain) baris terakhir yang dipakai
+HNA_STAGING_DEDUPE_SQL = f"""
+    DELETE FROM hna_staging WHERE rowid NOT IN (
+        SELECT MAX(rowid) FROM hna_staging GROUP BY {_HNA_KEYS}
+    )
+"""
+
+# Nama region/mitra/group/satuan baru didaftarkan sekaligus per upload
+HNA_DIMENSION_INSERT_SQLS = [f"""
+    INSERT OR IGNORE INTO {table} (nama)
+    SELECT DISTINCT {col} FROM hna_staging WHERE {col} IS NOT NULL
+    """ for col, (table, _) in HNA_DIMENSIONS.items()]
+
+# Staging dengan nama dimensi sudah diganti id. LEFT JOIN agar nilai kosong
+# tetap gagal di constraint NOT NULL hna_fact, bukan hilang diam-diam.
+_HNA_STAGING_RESOLVED = f"""
+    SELECT {", ".join(
+        f"{HNA_DIMENSIONS[col][0]}.id AS {HNA_DIMENSIONS[col][1]}"
+        if col in HNA_DIMENSIONS
+        else f"s.{col}"
+        for col in HNA_INSERT_COLUMNS
+    )}
+    FROM hna_staging s
+    {" ".join(
+        f"LEFT JOIN {table} ON {table}.nama = s.{col}"
+        for col, (table, _) in HNA_DIMENSIONS.items()
+    )}
+"""
+
+HNA_STAGING_DIFF_SQL = f"""
+    SELECT
+        COUNT(*) AS total,
+        COALESCE(SUM(CASE WHEN h.id IS NULL THEN 1 ELSE 0 END), 0) AS new_rows,
+        COALESCE(SUM(CASE WHEN h.id IS NOT NULL AND {_FACT_SAME_VALUES} THEN 1 ELSE 0 END), 0) AS same_rows
+    FROM ({_HNA_STAGING_RESOLVED}) s
+    LEFT JOIN hna_fact h ON {_FACT_KEY_JOIN}
+"""
+
+# "WHERE true" wajib di SQLite agar ON CONFLICT tidak dibaca sebagai bagian JOIN
+HNA_UPSERT_SQL = f"""
+    INSERT INTO hna_fact ({_FACT_COLS})
+    SELECT {_FACT_COLS} FROM ({_HNA_STAGING_RESOLVED}) WHERE true
+    ON CONFLICT ({_FACT_KEYS}) DO UPDATE SET
+        {_FACT_SET_VALUES},
+        uploaded_by = excluded.uploaded_by,
+        uploaded_at = CURRENT_TIMESTAMP
+    WHERE {_FACT_CHANGED_VALUES}
+"""
+
+HNA_INSERT_NEW_SQL = f"""
+    INSERT INTO hna_fact ({_FACT_COLS})
+    SELECT {_FACT_COLS} FROM ({_HNA_STAGING_RESOLVED}) WHERE true
+    ON CONFLICT ({_FACT_KEYS}) DO NOTHING
+"""
+
+PENUNJANG_BASE_COLUMNS = ["KODE", "DESKRIPSI", "GROUP TRANSAKSI", "SATUAN"]
+
+PENUNJANG_COLUMN_MAPPING = {
+    "KODE": "kode",
+    "DESKRIPSI": "deskripsi",
+    "GROUP TRANSAKSI": "group_transaksi",
+    "SATUAN": "satuan",
+}
+
+PENUNJANG_INSERT_SQL = """
+    INSERT INTO pemeriksaan_penunjang
+    (mitra, kode, deskripsi, deskripsi_key, group_transaksi, satuan, additional_data, uploaded_by)
+    VALUES (:mitra, :kode, :deskripsi, :deskripsi_key, :group_transaksi, :satuan, :additional_data, :uploaded_by)
+"""
+
+PENUNJANG_TARIF_INSERT_SQL = """
+    INSERT INTO pemeriksaan_tarif (penunjang_id, column_name, nilai, nilai_asli)
+    VALUES (:penunjang_id, :column_name, :nilai, :nilai_asli)
+"""
+
+PENUNJANG_METADATA_SQL = """
+    INSERT OR IGNORE INTO pemeriksaan_columns_metadata (column_name, display_name, created_by)
+    VALUES (:column_name, :display_name, :created_by)
+"""
+
+
+class IngestError(Exception):
+    """Error validasi file upload yang pesannya aman ditampilkan ke user"""
+
+
+def check_hna_header(header):
+    """Tolak file HNA yang tidak memiliki semua kolom template"""
+    missing = [col for col in HNA_EXCEL_COLUMNS if col not in header]
+    if missing:
+        raise IngestError(
+            f"Format kolom tidak sesuai template! Kolom tidak ditemukan: {', '.join(missing)}"
+        )
+
+
+def check_penunjang_header(header):
+    """Pastikan semua kolom pakem penunjang ada di header"""
+    for col in PENUNJANG_BASE_COLUMNS:
+        if col not in header:
+            raise IngestError(f"❌ Kolom {col} tidak ditemukan dalam file!")
+
+
+def prepare_hna_frame(df, region, mitra, bulan, tahun, user, validator):
+    """Validasi dan konversi DataFrame HNA secara vectorized menjadi baris siap insert.
+
+    Baris yang tidak lolos validasi tidak ikut dikembalikan dan dicatat di validator.
+    """
+    check_hna_header(list(df.columns))
+
+    records = validator.validate(df).rename(columns=HNA_COLUMN_MAPPING)
+    records = records.astype(object).where(records.notna(), None)
+    records["region"] = region
+    records["mitra"] = mitra
+    records["periode_bulan"] = bulan
+    records["periode_tahun"] = int(tahun)
+    records["uploaded_by"] = user
+    return records
+
+
+def prepare_penunjang_frame(df, mitra, user):
+    """Konversi DataFrame penunjang; kolom di luar kolom pakem disimpan sebagai JSON"""
+    df = df[df["KODE"].notna() & df["DESKRIPSI"].notna()]
+    additional_cols = [col for col in df.columns if col not in PENUNJANG_BASE_COLUMNS]
+
+    records = df[PENUNJANG_BASE_COLUMNS].rename(columns=PENUNJANG_COLUMN_MAPPING)
+    records = records.astype(object).where(records.notna(), None)
+    if additional_cols:
+        extra = df[additional_cols]
+        records["additional_data"] = [
+            json.dumps(
+                {
+                    col: str(value)
+                    for col, value in zip(additional_cols, values)
+                    if not pd.isna(value)
+                }
+            )
+            for values in extra.itertuples(index=False, name=None)
+        ]
+    else:
+        records["additional_data"] = "{}"
+    records["deskripsi_key"] = search_keys(records["deskripsi"])
+    records["mitra"] = mitra
+    records["uploaded_by"] = user
+    return records
+
+
+def prepare_penunjang_tarif(chunk, records, ids):
+    """Ubah kolom kelas/tarif menjadi format panjang: satu baris per item per kolom.
+
+    records adalah hasil prepare_penunjang_frame (index sama dengan chunk) dan
+    ids adalah id pemeriksaan_penunjang untuk records tersebut, berurutan.
+    """
+    additional_cols = [
+        col for col in chunk.columns if col not in PENUNJANG_BASE_COLUMNS
+    ]
+    extra = chunk.loc[records.index, additional_cols]
+    extra.index = pd.Index(ids, name="penunjang_id")
+    tarif = (
+        extra.rename_axis(columns="column_name")
+        .stack()
+        .dropna()
+        .rename("value")
+        .reset_index()
+    )
+    tarif["nilai"] = parse_numbers(tarif["value"])
+    tarif["nilai_asli"] = tarif["value"].astype(str)
+    tarif = tarif.drop(columns="value")
+    return tarif.astype(object).where(tarif.notna(), None)
+
+
+def bulk_insert(session, sql, records, batch_size=BULK_BATCH_SIZE):
+    """Insert DataFrame dalam batch executemany, tanpa commit"""
+    stmt = text(sql)
+    total = 0
+    for start in range(0, len(records), batch_size):
+        batch = records.iloc[start : start + batch_size].to_dict("records")
+        session.execute(stmt, batch)
+        total += len(batch)
+    return total
+
+
+def _stats(rows, skipped, started, **extra):
+    seconds = time.perf_counter() - started
+    stats = {
+        "rows": rows,
+        "skipped": skipped,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else float(rows),
+    }
+    stats.update(extra)
+    return stats
+
+
+def write_hna_records(session, record_chunks, mode="replace"):
+    """Upsert potongan DataFrame hasil prepare_hna_frame dalam satu transaksi.
+
+    mode "replace" mengganti baris dengan key yang sama, "skip" membiarkannya.
+    Mengembalikan dict: total, inserted, updated, unchanged, duplicates.
+    """
+    if mode not in UPLOAD_MODES:
+        raise ValueError(f"Mode upload tidak dikenal: {mode}")
+
+    staged = 0
+    try:
+        session.execute(text(HNA_STAGING_CREATE_SQL))
+        session.execute(text("DELETE FROM hna_staging"))
+
+        for records in record_chunks:
+            records = records.assign(nama_key=search_keys(records["nama_barang"]))
+            staged += bulk_insert(
+                session, HNA_STAGING_INSERT_SQL, records[HNA_INSERT_COLUMNS]
+            )
+
+        session.execute(text(HNA_WRITE_LOCK_SQL))
+        archived = session.execute(text(HNA_STAGING_ARCHIVED_SQL)).scalars().all()
+        if archived:
+            raise IngestError(
+                f"❌ Data tahun {', '.join(map(str, archived))} sudah diarsipkan "
+                "(read-only). Pulihkan arsip tahun tersebut sebelum upload."
+            )
+        session.execute(text(HNA_STAGING_DEDUPE_SQL))
+        for sql in HNA_DIMENSION_INSERT_SQLS:
+            session.execute(text(sql))
+        diff = session.execute(text(HNA_STAGING_DIFF_SQL)).mappings().one()
+
+        if mode == "replace":
+            session.execute(text(HNA_UPSERT_SQL))
+            updated = diff["total"] - diff["new_rows"] - diff["same_rows"]
+            unchanged = diff["same_rows"]
+        else:
+            session.execute(text(HNA_INSERT_NEW_SQL))
+            updated = 0
+            unchanged = diff["total"] - diff["new_rows"]
+
+        session.execute(text("DELETE FROM hna_staging"))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return {
+        "total": diff["total"],
+        "inserted": diff["new_rows"],
+        "updated": updated,
+        "unchanged": unchanged,
+        "duplicates": staged - diff["total"],
+    }
+
+
+def ingest_hna(
+    session,
+    file,
+    region,
+    mitra,
+    bulan,
+    tahun,
+    user,
+    mode="replace",
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    progress=None,
+):
+    """Baca file Excel HNA secara streaming dan upsert semua baris valid dalam satu transaksi.
+
+    progress(rows_done, total_rows) dipanggil setelah setiap chunk.
+    Baris yang tidak valid dilewati; baris valid tetap disimpan.
+    Mengembalikan dict statistik: rows, inserted, updated, unchanged, skipped,
+    duplicates, seconds, rows_per_second, dan error_report (bytes Excel berisi
+    baris yang ditolak, atau None).
+    """
+    started = time.perf_counter()
+    validator = HNAValidator()
+
+    def prepared_chunks():
+        chunks = iter_excel_chunks(
+            file, chunk_size, validate_header=check_hna_header, progress=progress
+        )
+        for chunk in chunks:
+            yield prepare_hna_frame(chunk, region, mitra, bulan, tahun, user, validator)
+
+    result = write_hna_records(session, prepared_chunks(), mode)
+    total = result.pop("total")
+    error_report = None
+    if validator.invalid_count:
+        error_report = build_error_workbook(validator.error_frame())
+    return _stats(
+        total,
+        validator.invalid_count,
+        started,
+        error_report=error_report,
+        **result,
+    )
+
+
+def ingest_penunjang(
+    session, file, mitra, user, chunk_size=DEFAULT_CHUNK_SIZE, progress=None
+):
+    """Baca file Excel pemeriksaan penunjang secara streaming dalam satu transaksi.
+
+    Selain statistik seperti ingest_hna, dict hasil berisi additional_cols.
+    """
+    started = time.perf_counter()
+    header_info = {}
+
+    def validate_header(header):
+        check_penunjang_header(header)
+        header_info["additional_cols"] = [
+            col for col in header if col not in PENUNJANG_BASE_COLUMNS
+        ]
+        _register_penunjang_columns(session, header_info["additional_cols"], user)
+
+    inserted = 0
+    skipped = 0
+    try:
+        chunks = iter_excel_chunks(
+            file, chunk_size, validate_header=validate_header, progress=progress
+        )
+        for chunk in chunks:
+            records = prepare_penunjang_frame(chunk, mitra, user)
+            last_id = session.execute(
+                text("SELECT COALESCE(MAX(id), 0) FROM pemeriksaan_penunjang")
+            ).scalar()
+            inserted += bulk_insert(session, PENUNJANG_INSERT_SQL, records)
+            skipped += len(chunk) - len(records)
+
+            # Di dalam transaksi ini hanya kita yang menulis, jadi id baru
+            # berurutan sesuai urutan records
+            ids = (
+                session.execute(
+                    text(
+                        "SELECT id FROM pemeriksaan_penunjang WHERE id > :last_id ORDER BY id"
+                    ),
+                    {"last_id": last_id},
+                )
+                .scalars()
+                .all()
+            )
+            tarif = prepare_penunjang_tarif(chunk, records, ids)
+            bulk_insert(session, PENUNJANG_TARIF_INSERT_SQL, tarif)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return _stats(
+        inserted,
+        skipped,
+        started,
+        additional_cols=header_info.get("additional_cols", []),
+    )
+
+
+def _register_penunjang_columns(session, columns, user):
+    if not columns:
+        return
+    session.execute(
+        text(PENUNJANG_METADATA_SQL),
+        [
+            {"column_name": col, "display_name": col, "created_by": user}
+            for col in columns
+        ],
+    )
@@ -0,0 +1,354 @@
+"""Pengelompokan item HNA yang sama lintas mitra (entity resolution offline).
+
+Setiap mitra menamai item dengan caranya sendiri. Nama barang dikelompokkan
+menjadi cluster item dan disimpan di tabel item_clusters, satu baris per
+kunci nama (hna_fact.nama_key) + satuan. Perbandingan harga lintas mitra
+cukup join hna_fact ke item_clusters, tanpa pencarian fuzzy per item.
+
+Langkahnya:
+1. Blocking: kunci hanya dibandingkan dengan kunci bersatuan sama, dengan
+   angka yang sama persis (kekuatan, ukuran) dan minimal satu kata yang sama.
+2. Di dalam block, pasangan diskor token_sort_ratio (angka dipisah dari
+   satuannya, "500mg" = "500 mg"); skor >=
+   CLUSTER_THRESHOLD menyatukan keduanya (union-find).
+3. Jika pasangannya banyak, block diskor paralel di process pool.
+
+Jalannya inkremental: hanya kunci yang belum ada di item_clusters yang
+diskor, terhadap sesamanya dan kunci lama di block yang sama. Cluster lama
+tidak pernah dipecah; jika kunci baru menjembatani dua cluster lama,
+keduanya digabung ke id terkecil. update_clusters dipanggil setelah setiap
+job upload HNA (jobs.py). Hanya data aktif (hna_fact) yang dikelompokkan;
+nama yang kuncinya kosong (mis. hanya tanda baca) tidak ikut.
+
+Contoh:
+    python item_clusters.py
+    python item_clusters.py --rebuild
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz
+from sqlalchemy import text
+
+try:
+    from rapidfuzz import fuzz as rapid_fuzz
+    from rapidfuzz import process as rapid_process
+except ImportError:  # opsional, sama seperti similarity.py
+    rapid_process = None
+
+from search_keys import search_keys
+
+# Skor token_sort_ratio minimum agar dua kunci dianggap item yang sama
+CLUSTER_THRESHOLD = int(os.getenv("CLUSTER_THRESHOLD", 90))
+
+# Block yang lebih besar dilewati (kata terlalu umum); kuncinya tetap
+# dibandingkan lewat block kata lainnya
+CLUSTER_MAX_BLOCK = int(os.getenv("CLUSTER_MAX_BLOCK", 2000))
+
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", os.cpu_count() or 1))
+
+# Di bawah jumlah pasangan ini skor dihitung di proses sendiri; memulai
+# process pool lebih mahal daripada skornya
+CLUSTER_PARALLEL_MIN_PAIRS = int(os.getenv("CLUSTER_PARALLEL_MIN_PAIRS", 200000))
+
+_NUMBERS = re.compile(r"\d+")
+_WORDS = re.compile(r"[^\W\d_]{3,}")
+_NUMBER_UNIT = re.compile(r"(?<=\d)(?=[^\W\d_])|(?<=[^\W\d_])(?=\d)")
+
+
+def scoring_key(key):
+    """Kunci nama dengan angka dan satuannya dipisah ("500mg" -> "500 mg")"""
+    return _NUMBER_UNIT.sub(" ", key)
+
+
+def block_keys(key):
+    """(angka, kata) untuk setiap kata unik kunci nama.
+
+    Angka (mis. "500" dari "500mg") harus sama persis agar kekuatan atau
+    ukuran berbeda tidak pernah dibandingkan. Kunci tanpa kata memakai kata
+    kosong.
+    """
+    numbers = " ".join(sorted(set(_NUMBERS.findall(key))))
+    words = sorted(set(_WORDS.findall(key))) or [""]
+    return [(numbers, word) for word in words]
+
+
+def build_blocks(items, max_block=CLUSTER_MAX_BLOCK):
+    """Posisi item per block (satuan, angka, kata).
+
+    Hanya block berisi kunci baru dengan 2..max_block kunci yang dikembalikan.
+    """
+    rows = [
+        (position, satuan_id, numbers, word)
+        for position, (key, satuan_id) in enumerate(
+            zip(items["nama_key"], items["satuan_id"])
+        )
+        for numbers, word in block_keys(key)
+    ]
+    blocks = pd.DataFrame(rows, columns=["position", "satuan_id", "numbers", "word"])
+    blocks["new"] = items["new"].to_numpy()[blocks["position"].to_numpy()]
+    grouped = blocks.groupby(["satuan_id", "numbers", "word"], sort=False)
+    size = grouped["position"].transform("size")
+    has_new = grouped["new"].transform("any")
+    blocks = blocks[(size > 1) & (size <= max_block) & has_new]
+    return [
+        group.to_numpy()
+        for _, group in blocks.groupby(["satuan_id", "numbers", "word"], sort=False)[
+            "position"
+        ]
+    ]
+
+
+def score_block(keys, new, threshold=CLUSTER_THRESHOLD):
+    """Pasangan (i, j, skor) di satu block dengan skor >= threshold.
+
+    Hanya pasangan yang melibatkan kunci baru (new[i]) yang diskor; pasangan
+    dua kunci baru dilaporkan sekali.
+    """
+    new = np.asarray(new, dtype=bool)
+    queries = np.flatnonzero(new)
+    if rapid_process is not None:
+        scores = rapid_process.cdist(
+            [keys[i] for i in queries],
+            keys,
+            scorer=rapid_fuzz.token_sort_ratio,
+            processor=None,
+            score_cutoff=threshold,
+            workers=1,
+        )
+    else:
+        scores = np.array(
+            [
+                [
+                    fuzz.token_sort_ratio(keys[i], key, full_process=False)
+                    for key in keys
+                ]
+                for i in queries
+            ]
+        ).reshape(len(queries), len(keys))
+    rows, j = np.nonzero(scores >= threshold)
+    i = queries[rows]
+    keep = (i != j) & ~(new[j] & (j < i))
+    scores = np.rint(scores[rows[keep], j[keep]]).astype(int)
+    return list(zip(i[keep].tolist(), j[keep].tolist(), scores.tolist()))
+
+
+def _score_blocks(blocks, threshold):
+    return [score_block(keys, new, threshold) for keys, new in blocks]
+
+
+def score_blocks(items, blocks, threshold=CLUSTER_THRESHOLD, workers=CLUSTER_WORKERS):
+    """Semua pasangan (posisi item, posisi item, skor) dengan skor >= threshold"""
+    keys = items["nama_key"].to_numpy(dtype=object)
+    new = items["new"].to_numpy()
+    keys = np.asarray([scoring_key(key) for key in keys], dtype=object)
+    payload = [(keys[block].tolist(), new[block]) for block in blocks]
+    pairs = sum(int(block_new.sum()) * len(block_new) for _, block_new in payload)
+    if workers > 1 and pairs >= CLUSTER_PARALLEL_MIN_PAIRS:
+        # Block kecil dikirim berkelompok agar overhead antarproses kecil.
+        # spawn: proses anak tidak mewarisi thread/koneksi proses Streamlit.
+        size = max(1, len(payload) // (workers * 4))
+        tasks = [
+            payload[start : start + size] for start in range(0, len(payload), size)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results = [
+                edges
+                for chunk in executor.map(
+                    _score_blocks, tasks, [threshold] * len(tasks)
+                )
+                for edges in chunk
+            ]
+    else:
+        results = _score_blocks(payload, threshold)
+    # Pasangan yang berbagi beberapa kata muncul di beberapa block
+    return sorted(
+        {
+            (int(block[i]), int(block[j]), score)
+            for block, edges in zip(blocks, results)
+            for i, j, score in edges
+        }
+    )
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def assign_clusters(items, edges):
+    """(cluster_id, skor terbaik) per item setelah pasangan edges disatukan.
+
+    Item lama tetap bersama cluster lamanya. Komponen dengan beberapa cluster
+    lama digabung ke id terkecil; komponen tanpa item lama mendapat id baru.
+    Skor -1 berarti item tidak punya pasangan.
+    """
+    parent = list(range(len(items)))
+    existing = items["cluster_id"].to_numpy(dtype=float)
+    first = {}
+    for position in np.flatnonzero(~np.isnan(existing)):
+        root = first.setdefault(existing[position], position)
+        parent[_find(parent, position)] = _find(parent, root)
+    scores = np.full(len(items), -1)
+    for i, j, score in edges:
+        parent[_find(parent, i)] = _find(parent, j)
+        scores[i] = max(scores[i], score)
+        scores[j] = max(scores[j], score)
+    roots = pd.Series([_find(parent, i) for i in range(len(items))])
+    cluster_ids = pd.Series(existing).groupby(roots).transform("min")
+    unassigned = cluster_ids.isna()
+    if unassigned.any():
+        next_id = 1 if np.isnan(existing).all() else int(np.nanmax(existing)) + 1
+        new_roots = pd.unique(roots[unassigned])
+        new_ids = pd.Series(np.arange(next_id, next_id + len(new_roots)), new_roots)
+        cluster_ids[unassigned] = roots[unassigned].map(new_ids)
+    return cluster_ids.to_numpy(dtype=np.int64), scores
+
+
+def _fill_missing_keys(session):
+    # Baris yang ditulis di luar jalur upload (view hna_data, salinan MySQL,
+    # arsip yang dipulihkan) belum punya nama_key
+    rows = session.execute(
+        text("SELECT id, nama_barang FROM hna_fact WHERE nama_key IS NULL")
+    ).all()
+    if rows:
+        keys = search_keys(nama for _, nama in rows)
+        session.execute(
+            text("UPDATE hna_fact SET nama_key = :key WHERE id = :id"),
+            [{"key": key, "id": row_id} for (row_id, _), key in zip(rows, keys)],
+        )
+    session.commit()
+
+
+def update_clusters(
+    session, threshold=CLUSTER_THRESHOLD, workers=CLUSTER_WORKERS, rebuild=False
+):
+    """Kelompokkan kunci nama yang belum ada di item_clusters.
+
+    Data dibaca dan diskor di luar transaksi tulis, lalu hasilnya ditulis
+    dalam satu transaksi singkat. rebuild=True menghitung ulang semua cluster.
+    Mengembalikan dict: keys, clusters, merged, pairs, seconds.
+    """
+    started = time.perf_counter()
+    _fill_missing_keys(session)
+    connection = session.connection()
+    if rebuild:
+        existing = pd.DataFrame(columns=["nama_key", "satuan_id", "cluster_id"])
+        new_sql = """
+            SELECT DISTINCT nama_key, satuan_id FROM hna_fact WHERE nama_key <> ''
+        """
+    else:
+        existing = pd.read_sql(
+            "SELECT nama_key, satuan_id, cluster_id FROM item_clusters", connection
+        )
+        new_sql = """
+            SELECT DISTINCT f.nama_key, f.satuan_id FROM hna_fact f
+            WHERE f.nama_key <> '' AND NOT EXISTS (
+                SELECT 1 FROM item_clusters c
+                WHERE c.nama_key = f.nama_key AND c.satuan_id = f.satuan_id
+            )
+        """
+    new = pd.read_sql(new_sql, connection)
+    session.commit()
+
+    stats = {"keys": len(new), "clusters": 0, "merged": 0, "pairs": 0}
+    if new.empty:
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+    items = pd.concat(
+        [existing.assign(new=False), new.assign(cluster_id=np.nan, new=True)],
+        ignore_index=True,
+    )
+    edges = score_blocks(items, build_blocks(items), threshold, workers)
+    cluster_ids, scores = assign_clusters(items, edges)
+
+    old = ~items["new"].to_numpy()
+    moved = pd.DataFrame(
+        {"old": items["cluster_id"].to_numpy()[old], "new": cluster_ids[old]}
+    )
+    moved = moved[moved["old"] != moved["new"]].drop_duplicates("old")
+    added = items[~old].assign(
+        cluster_id=cluster_ids[~old],
+        score=[None if score < 0 else score for score in scores[~old]],
+    )
+    try:
+        if rebuild:
+            session.execute(text("DELETE FROM item_clusters"))
+        if not moved.empty:
+            session.execute(
+                text(
+                    "UPDATE item_clusters SET cluster_id = :new WHERE cluster_id = :old"
+                ),
+                [
+                    {"old": int(row.old), "new": int(row.new)}
+                    for row in moved.itertuples()
+                ],
+            )
+        # OR IGNORE: kunci yang sudah ditulis proses lain sejak dibaca
+        session.execute(
+            text("""
+                INSERT OR IGNORE INTO item_clusters
+                (nama_key, satuan_id, cluster_id, score)
+                VALUES (:nama_key, :satuan_id, :cluster_id, :score)
+            """),
+            [
+                {
+                    "nama_key": row.nama_key,
+                    "satuan_id": int(row.satuan_id),
+                    "cluster_id": int(row.cluster_id),
+                    "score": row.score,
+                }
+                for row in added.itertuples()
+            ],
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    stats["clusters"] = int(added["cluster_id"].nunique())
+    stats["merged"] = len(moved)
+    stats["pairs"] = len(edges)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="hna_compare.db", help="file SQLite utama")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="hitung ulang semua cluster"
+    )
+    parser.add_argument("--threshold", type=int, default=CLUSTER_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=CLUSTER_WORKERS)
+    args = parser.parse_args()
+
+    run_migrations(args.db)
+    with Session(create_engine(f"sqlite:///{args.db}")) as session:
+        stats = update_clusters(session, args.threshold, args.workers, args.rebuild)
+    print(
+        f"✅ {stats['keys']:,} nama baru dikelompokkan ke {stats['clusters']:,} "
+        f"cluster ({stats['pairs']:,} pasangan cocok, {stats['merged']:,} cluster "
+        f"lama digabung) dalam {stats['seconds']:.1f} detik"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import bindparam, text
+
+from db import DB_TYPE, SessionLocal
+from batch_upload import ingest_hna_batch
+from datasets import refresh_snapshot
+from ingest import IngestError, ingest_hna, ingest_penunjang
+from item_clusters import update_clusters
+from trigram_index import sync_index
+from upload_registry import register_upload
+
+# SQLite hanya punya satu writer: job upload dijalankan berurutan agar tidak
+# saling menunggu write lock sampai timeout. Yang penting halaman Streamlit
+# tidak ikut menunggu.
+MAX_WORKERS = 1 if DB_TYPE == "sqlite" else 4
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+JOB_LIST_COLUMNS = [
+    "id",
+    "kind",
+    "filename",
+    "status",
+    "total_rows",
+    "processed_rows",
+    "inserted_rows",
+    "updated_rows",
+    "unchanged_rows",
+    "skipped_rows",
+    "message",
+    "result",
+    "created_by",
+    "created_at",
+    "started_at",
+    "finished_at",
+]
+
+# hna / penunjang: satu file Excel; hna_batch: banyak file .xlsx/.zip
+JOB_KINDS = ("hna", "penunjang", "hna_batch")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Progress job yang sedang berjalan disimpan di memori proses. Menulisnya ke
+# ingest_jobs selama upload akan berebut write lock dengan transaksi upload itu.
+_live_progress = {}
+_progress_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _mark_interrupted_jobs()
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_WORKERS, thread_name_prefix="ingest-job"
+            )
+        return _executor
+
+
+def _mark_interrupted_jobs():
+    """Job yang masih queued/running saat proses baru mulai tidak akan pernah selesai"""
+    _execute(
+        """
+        UPDATE ingest_jobs
+        SET status = :failed, message = :message, finished_at = CURRENT_TIMESTAMP
+        WHERE status IN (:queued, :running)
+        """,
+        {
+            "failed": JOB_FAILED,
+            "queued": JOB_QUEUED,
+            "running": JOB_RUNNING,
+            "message": "Job terhenti karena server dimulai ulang. Silakan upload ulang.",
+        },
+    )
+
+
+def _execute(sql, params):
+    """Jalankan satu statement dalam transaksi pendek; mengembalikan lastrowid"""
+    session = SessionLocal()
+    try:
+        result = session.execute(text(sql), params)
+        last_id = result.lastrowid
+        session.commit()
+        return last_id
+    finally:
+        session.close()
+
+
+def _create_job(kind, filename, params, user):
+    return _execute(
+        """
+        INSERT INTO ingest_jobs (kind, filename, params, status, created_by)
+        VALUES (:kind, :filename, :params, :status, :user)
+        """,
+        {
+            "kind": kind,
+            "filename": filename,
+            "params": json.dumps(params),
+            "status": JOB_QUEUED,
+            "user": user,
+        },
+    )
+
+
+def _set_progress(job_id, rows_done, total_rows):
+    with _progress_lock:
+        _live_progress[job_id] = {
+            "processed_rows": rows_done,
+            "total_rows": total_rows,
+        }
+
+
+def _run_ingest(session, job_id, kind, payload, params, user, progress):
+    """Jalankan ingest sesuai jenis job; mengembalikan (stats, message, result)"""
+    if kind == "hna":
+        params = dict(params)
+        sha256 = params.pop("sha256", None)
+        filename = params.pop("filename", None)
+        file = io.BytesIO(payload)
+        stats = ingest_hna(session, file, user=user, progress=progress, **params)
+        if sha256:
+            register_upload(
+                session,
+                sha256,
+                filename,
+                params["region"],
+                params["mitra"],
+                params["bulan"],
+                params["tahun"],
+                user,
+                job_id,
+            )
+        return stats, None, None
+
+    if kind == "penunjang":
+        file = io.BytesIO(payload)
+        stats = ingest_penunjang(session, file, user=user, progress=progress, **params)
+        message = None
+        if stats["additional_cols"]:
+            message = f"Kolom tambahan: {', '.join(stats['additional_cols'])}"
+        return stats, message, None
+
+    summary, error_report = ingest_hna_batch(
+        session, payload, user=user, progress=progress, job_id=job_id, **params
+    )
+    done = [item for item in summary if item["status"] == JOB_DONE]
+    stats = {
+        "rows": sum(
+            item["inserted"] + item["updated"] + item["unchanged"] for item in done
+        ),
+        "inserted": sum(item["inserted"] for item in done),
+        "updated": sum(item["updated"] for item in done),
+        "unchanged": sum(item["unchanged"] for item in done),
+        "skipped": sum(item["skipped"] for item in summary),
+        "error_report": error_report,
+    }
+    message = f"{len(done)} dari {len(summary)} file berhasil diupload"
+    duplicates = sum(item["status"] == "duplicate" for item in summary)
+    if duplicates:
+        message += f", {duplicates} file sudah pernah diupload"
+    return stats, message, json.dumps(summary)
+
+
+def _refresh_snapshot(session, kind):
+    """Tulis ulang snapshot dataset sebelum job ditandai selesai.
+
+    Gagal menulis snapshot tidak menggagalkan job; snapshot dibangun ulang
+    saat data dibaca berikutnya.
+    """
+    try:
+        if kind == "penunjang":
+            refresh_snapshot(session.connection(), "penunjang")
+        else:
+            refresh_snapshot(session.connection(), "hna")
+            # Nama barang baru langsung masuk index trigram
+            sync_index(session.connection())
+    except Exception as e:
+        print(f"⚠️ Snapshot gagal diperbarui setelah job {kind}: {e}")
+
+
+def _update_clusters(session, kind):
+    """Kelompokkan nama barang baru lintas mitra setelah job HNA selesai.
+
+    Gagal tidak mengubah status job; nama yang terlewat ikut diproses pada
+    job berikutnya.
+    """
+    if kind == "penunjang":
+        return
+    try:
+        update_clusters(session)
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ Cluster item gagal diperbarui setelah job {kind}: {e}")
+
+
+def _run_job(job_id, kind, payload, params, user):
+    _execute(
+        "UPDATE ingest_jobs SET status = :status, started_at = CURRENT_TIMESTAMP WHERE id = :id",
+        {"status": JOB_RUNNING, "id": job_id},
+    )
+    _set_progress(job_id, 0, None)
+
+    def progress(done, total):
+        _set_progress(job_id, done, total)
+
+    session = SessionLocal()
+    try:
+        stats, message, result = _run_ingest(
+            session, job_id, kind, payload, params, user, progress
+        )
+        _refresh_snapshot(session, kind)
+        skipped = stats["skipped"] + stats.get("duplicates", 0)
+        _execute(
+            """
+            UPDATE ingest_jobs
+            SET status = :status, total_rows = :total, processed_rows = :total,
+                inserted_rows = :inserted, updated_rows = :updated,
+                unchanged_rows = :unchanged, skipped_rows = :skipped,
+                message = :message, result = :result, error_report = :error_report,
+                finished_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+            """,
+            {
+                "status": JOB_DONE,
+                "total": stats["rows"] + skipped,
+                "inserted": stats.get("inserted", stats["rows"]),
+                "updated": stats.get("updated", 0),
+                "unchanged": stats.get("unchanged", 0),
+                "skipped": skipped,
+                "message": message,
+                "result": result,
+                "error_report": stats.get("error_report"),
+                "id": job_id,
+            },
+        )
+        _update_clusters(session, kind)
+    except Exception as e:
+        message = str(e) if isinstance(e, IngestError) else f"❌ Error upload: {e}"
+        _execute(
+            """
+            UPDATE ingest_jobs
+            SET status = :status, message = :message, finished_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+            """,
+            {"status": JOB_FAILED, "message": message, "id": job_id},
+        )
+    finally:
+        session.close()
+        with _progress_lock:
+            _live_progress.pop(job_id, None)
+
+
+def submit_job(kind, payload, filename, params, user):
+    """Daftarkan job upload dan jalankan di background; mengembalikan id job.
+
+    payload berisi bytes file, atau daftar (nama, bytes) untuk job hna_batch.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Jenis job tidak dikenal: {kind}")
+    executor = _get_executor()
+    job_id = _create_job(kind, filename, params, user)
+    executor.submit(_run_job, job_id, kind, payload, params, user)
+    return job_id
+
+
+def list_jobs(kinds, user=None, limit=10):
+    """Daftar job terbaru (terbaru dulu) beserta progress live jika masih berjalan.
+
+    Laporan error tidak ikut diambil; cek has_error_report lalu pakai
+    get_error_report.
+    """
+    if isinstance(kinds, str):
+        kinds = (kinds,)
+    sql = f"""
+        SELECT {", ".join(JOB_LIST_COLUMNS)},
+               error_report IS NOT NULL AS has_error_report
+        FROM ingest_jobs WHERE kind IN :kinds
+    """
+    params = {"kinds": list(kinds), "limit": limit}
+    if user:
+        sql += " AND created_by = :user"
+        params["user"] = user
+    sql += " ORDER BY id DESC LIMIT :limit"
+    stmt = text(sql).bindparams(bindparam("kinds", expanding=True))
+
+    session = SessionLocal()
+    try:
+        jobs = [dict(row) for row in session.execute(stmt, params).mappings()]
+    finally:
+        session.close()
+
+    with _progress_lock:
+        for job in jobs:
+            live = _live_progress.get(job["id"])
+            if live and job["status"] in ACTIVE_STATUSES:
+                job.update(live)
+    return jobs
+
+
+def get_error_report(job_id):
+    """Bytes Excel berisi baris yang ditolak validasi untuk job ini, atau None"""
+    session = SessionLocal()
+    try:
+        return session.execute(
+            text("SELECT error_report FROM ingest_jobs WHERE id = :id"), {"id": job_id}
+        ).scalar()
+    finally:
+        session.close()
@@ -1,13 +1,33 @@
 import streamlit as st
 import pandas as pd
 import io
-from db import SessionLocal
+import json
+from analytics import HNAAnalytics
+from app_resources import get_pool_metrics, session_scope
+from datasets import dataset_cache
+from hna_query import HNA_PAGE_LIMIT
 from models import HNAData, format_currency_id
+from ingest import PERIODE_BULAN, UPLOAD_MODES
+from jobs import (
+    ACTIVE_STATUSES,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    get_error_report,
+    list_jobs,
+)
 from models_penunjang import PemeriksaanPenunjang
+from search_index import rank_by_ids
+from search_keys import key_matches
 from sidebar_manager import SidebarManager
+from similarity import (
+    SIMILARITY_COLUMN,
+    add_similarity,
+    broadcast_scores,
+    similarity_search,
+)
 from navigation_header import NavigationHeader
-from fuzzywuzzy import process
-import re
 from themes import get_theme_css
 
 
@@ -23,13 +43,6 @@ if "theme" not in st.session_state:
     st.session_state.theme = "light"
 
 
-session = SessionLocal()
-sidebar_mgr = SidebarManager(session)
-nav_header = NavigationHeader(session)
-hna_mgr = HNAData(session)
-penunjang_mgr = PemeriksaanPenunjang(session)
-
-
 theme_css = get_theme_css(st.session_state.theme)
 st.markdown(theme_css, unsafe_allow_html=True)
 
@@ -66,50 +79,145 @@ st.markdown(
 )
 
 
-def preprocess_text(text):
-    """Preprocess text untuk similarity matching yang lebih akurat"""
-    if pd.isna(text):
-        return ""
-   
-    text = str(text).lower().strip()
-    text = re.sub(r"[^\w\s]", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text
-
-
-def advanced_similarity_search(df, query, column="nama_barang", threshold=85, limit=20):
-    """Advanced similarity search dengan multiple strategies"""
+def advanced_similarity_search(
+    df,
+    query,
+    column="nama_barang",
+    threshold=85,
+    limit=20,
+    fts_ids=None,
+    name_index=None,
+    trigram_index=None,
+    key_column="nama_key",
+    score_matches=False,
+):
+    """Advanced similarity search dengan multiple strategies
+
+    fts_ids: id hasil index FTS (urut relevansi). Jika diisi, tahap exact dan
+    awal kata hanya memeriksa baris tersebut; jika index tidak menemukan apa
+    pun, potongan di tengah kata dicari dengan scan DataFrame.
+    name_index: similarity.NameIndex berisi nama yang sudah dinormalisasi.
+    trigram_index: trigram_index.TrigramIndex; jika diisi hanya nama dengan
+    overlap trigram terbanyak yang diskor.
+    key_column: kolom kunci pencarian tersimpan (search_keys.py) untuk tahap
+    exact dan contains; hanya query yang dinormalisasi.
+    score_matches: hasil FTS/contains ikut disaring threshold similarity
+    (mode "Hanya Similarity"); hasil exact selalu dikembalikan.
+    """
     if not query or df.empty:
         return df
 
-    query_processed = preprocess_text(query)
-    choices = df[column].dropna().unique().tolist()
-
-    if not choices:
+    if df[column].dropna().empty:
         return pd.DataFrame()
 
-    exact_matches = df[df[column].str.lower() == query.lower()]
+    # Dengan FTS: semua kata query ada sebagai awal kata di nama barang
+    candidates = df.iloc[:0] if fts_ids is None else rank_by_ids(df, fts_ids)
+    exact_matches = key_matches(
+        df if fts_ids is None else candidates, column, query, key_column
+    )
     if not exact_matches.empty:
         return exact_matches
 
-    contains_matches = df[df[column].str.lower().str.contains(query.lower(), na=False)]
-    if not contains_matches.empty:
-        return contains_matches
+    if candidates.empty:
+        # Index mencocokkan awal kata; potongan di tengah kata tetap dicari
+        candidates = key_matches(df, column, query, key_column, contains=True)
+    if score_matches and not candidates.empty:
+        candidates = add_similarity(candidates, query, column, name_index, key_column)
+        candidates = candidates[candidates[SIMILARITY_COLUMN] >= threshold]
+    if not candidates.empty:
+        return candidates
+
+    # Semua nama unik diskor dalam satu panggilan batch; skornya ikut
+    # dikembalikan agar tidak dihitung ulang saat ditampilkan
+    names = df[column]
+    if trigram_index is not None:
+        names = trigram_index.candidates(query, names)
+    matches = similarity_search(query, names, threshold, limit, name_index)
+    if not matches.empty:
+        result = df[df[column].isin(matches["name"])]
+        return result.assign(
+            **{
+                SIMILARITY_COLUMN: broadcast_scores(
+                    result[column], matches["name"], matches["score"]
+                )
+            }
+        )
 
-    choices_processed = [preprocess_text(choice) for choice in choices]
-    results = process.extract(query_processed, choices_processed, limit=limit)
+    return pd.DataFrame()
 
-    matched_original_names = []
-    for processed_choice, score, original_choice in zip(
-        choices_processed, [r[1] for r in results], choices
-    ):
-        if score >= threshold:
-            matched_original_names.append(original_choice)
 
-    if matched_original_names:
-        return df[df[column].isin(matched_original_names)]
+JOB_STATUS_LABELS = {
+    JOB_QUEUED: "🕒 Menunggu",
+    JOB_RUNNING: "⏳ Diproses",
+    JOB_DONE: "✅ Selesai",
+    JOB_FAILED: "❌ Gagal",
+    # Status per file pada job batch
+    "duplicate": "⏭️ Sudah pernah diupload",
+}
 
-    return pd.DataFrame()
+
+BATCH_SUMMARY_COLUMNS = {
+    "file": "File",
+    "region": "Regional",
+    "mitra": "Mitra",
+    "bulan": "Bulan",
+    "tahun": "Tahun",
+    "status": "Status",
+    "inserted": "Baru",
+    "updated": "Diperbarui",
+    "unchanged": "Tidak Berubah",
+    "skipped": "Dilewati",
+    "message": "Keterangan",
+}
+
+
+@st.fragment(run_every="2s")
+def render_ingest_jobs(kinds):
+    """Tampilkan status job upload milik user; diperbarui otomatis tiap 2 detik"""
+    jobs = list_jobs(kinds, user=st.session_state["username"], limit=5)
+    if not jobs:
+        return
+
+    st.markdown("---")
+    st.subheader("📦 Status Upload")
+    for job in jobs:
+        label = JOB_STATUS_LABELS.get(job["status"], job["status"])
+        st.write(f"**#{job['id']} · {job['filename']}** — {label}")
+
+        if job["status"] in ACTIVE_STATUSES:
+            total = job["total_rows"] or 0
+            done = job["processed_rows"] or 0
+            unit = "file" if job["kind"] == "hna_batch" else "baris"
+            st.progress(
+                min(done / total, 1.0) if total else 0.0,
+                text=f"{done:,} / {total:,} {unit}".replace(",", "."),
+            )
+        elif job["status"] == JOB_DONE:
+            st.caption(
+                f"{job['inserted_rows']} baru, {job['updated_rows']} diperbarui, "
+                f"{job['unchanged_rows']} tidak berubah, {job['skipped_rows']} dilewati"
+            )
+            if job["message"]:
+                st.caption(job["message"])
+            if job.get("result"):
+                summary_df = pd.DataFrame(json.loads(job["result"]))
+                summary_df["status"] = summary_df["status"].map(JOB_STATUS_LABELS)
+                st.dataframe(
+                    summary_df.rename(columns=BATCH_SUMMARY_COLUMNS),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+        elif job["message"]:
+            st.error(job["message"])
+
+        if job["has_error_report"]:
+            st.download_button(
+                label="📥 Download Laporan Error",
+                data=get_error_report(job["id"]),
+                file_name=f"error_upload_{job['id']}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key=f"error_report_{job['id']}",
+            )
 
 
 def render_upload_page(hna_mgr):
@@ -144,21 +252,7 @@ def render_upload_page(hna_mgr):
         with col2:
             bulan = st.selectbox(
                 "Periode Bulan*",
-                [""]
-                + [
-                    "Januari",
-                    "Februari",
-                    "Maret",
-                    "April",
-                    "Mei",
-                    "Juni",
-                    "Juli",
-                    "Agustus",
-                    "September",
-                    "Oktober",
-                    "November",
-                    "Desember",
-                ],
+                [""] + PERIODE_BULAN,
             )
             tahun = st.number_input(
                 "Periode Tahun*", min_value=2000, max_value=2100, value=2025
@@ -168,27 +262,256 @@ def render_upload_page(hna_mgr):
             "Pilih File Excel*", type=["xlsx"], help="Format harus sesuai template"
         )
 
+        upload_mode = st.radio(
+            "Jika Kode Item pada periode ini sudah ada",
+            options=list(UPLOAD_MODES.keys()),
+            format_func=lambda x: UPLOAD_MODES[x],
+            horizontal=True,
+        )
+        force_upload = st.checkbox(
+            "Upload ulang walaupun file yang sama sudah pernah diupload"
+        )
+
         submit_btn = st.form_submit_button("🚀 Import File", use_container_width=True)
 
         if submit_btn:
             if not all([region, mitra, bulan, tahun, uploaded_file]):
                 st.error("❌ Harap lengkapi semua field yang wajib diisi (*)")
             else:
-                hna_mgr.upload_excel(
+                job_id = hna_mgr.submit_upload_job(
                     uploaded_file,
                     region,
                     mitra,
                     bulan,
                     tahun,
                     st.session_state["username"],
+                    mode=upload_mode,
+                    force=force_upload,
+                )
+                if job_id:
+                    st.success(
+                        f"⏳ File diterima dan sedang diproses di background (job #{job_id})."
+                    )
+
+    st.markdown("---")
+    st.subheader("📚 Upload Banyak File Sekaligus")
+    st.info(
+        """
+    **Region, mitra dan periode diambil otomatis per file:**
+    - dari sheet **Manifest** (kolom A: Region, Mitra, Bulan, Tahun; kolom B: nilainya), atau
+    - dari nama file dengan pola **REGION_MITRA_BULAN_TAHUN.xlsx**, contoh: `Jawa Barat_St. Yusup_Januari_2025.xlsx`
+    - Bisa memilih banyak file .xlsx sekaligus atau satu file .zip berisi file-file tersebut.
+    """
+    )
+
+    with st.form("batch_upload_form"):
+        batch_files = st.file_uploader(
+            "Pilih File Excel / ZIP*",
+            type=["xlsx", "zip"],
+            accept_multiple_files=True,
+        )
+        batch_mode = st.radio(
+            "Jika Kode Item pada periode ini sudah ada",
+            options=list(UPLOAD_MODES.keys()),
+            format_func=lambda x: UPLOAD_MODES[x],
+            horizontal=True,
+            key="batch_upload_mode",
+        )
+        batch_force = st.checkbox(
+            "Upload ulang walaupun file yang sama sudah pernah diupload",
+            key="batch_force_upload",
+        )
+        batch_btn = st.form_submit_button(
+            "🚀 Import Semua File", use_container_width=True
+        )
+
+        if batch_btn:
+            if not batch_files:
+                st.error("❌ Harap pilih minimal satu file")
+            else:
+                job_id = hna_mgr.submit_batch_upload_job(
+                    batch_files,
+                    st.session_state["username"],
+                    mode=batch_mode,
+                    force=batch_force,
+                )
+                st.success(
+                    f"⏳ {len(batch_files)} file diterima dan sedang diproses di background (job #{job_id})."
                 )
 
+    render_ingest_jobs(("hna", "hna_batch"))
 
-def render_data_page(hna_mgr):
+
+PIVOT_LABELS = {
+    "region": "Regional",
+    "mitra": "Mitra",
+    "group_transaksi": "Group Transaksi",
+    "satuan": "Satuan",
+    "kode_item": "Kode Item",
+    "nama_barang": "Nama Barang",
+    "periode_bulan": "Bulan",
+    "periode_tahun": "Tahun",
+}
+
+PIVOT_AGGREGATE_LABELS = {
+    "avg": "Rata-rata HNA",
+    "min": "HNA Min",
+    "max": "HNA Max",
+    "count": "Jumlah Item",
+}
+
+
+def render_price_comparison(analytics, region, mitra, group, satuan, bulan, tahun):
+    """Ringkasan perbandingan harga; agregasi dihitung di engine analitik"""
+    with st.expander("📊 Perbandingan Harga"):
+        st.caption(f"Engine analitik: {analytics.backend}")
+        tab_group, tab_region, tab_pivot, tab_cluster = st.tabs(
+            [
+                "Rata-rata per Mitra & Group",
+                "Region Termurah per Item",
+                "Pivot Harga",
+                "Item Sama Lintas Mitra",
+            ]
+        )
+        with tab_group:
+            summary = analytics.avg_hna_per_mitra_group(
+                region=region,
+                mitra=mitra,
+                group=group,
+                satuan=satuan,
+                bulan=bulan,
+                tahun=tahun,
+            )
+            for col in ["rata_rata_hna", "hna_min", "hna_max"]:
+                if col in summary:
+                    summary[col] = summary[col].apply(format_currency_id)
+            st.dataframe(
+                summary.rename(
+                    columns={
+                        "mitra": "Mitra",
+                        "group_transaksi": "Group Transaksi",
+                        "jumlah_item": "Jumlah Item",
+                        "rata_rata_hna": "Rata-rata HNA",
+                        "hna_min": "HNA Min",
+                        "hna_max": "HNA Max",
+                    }
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+        with tab_region:
+            cheapest = analytics.cheapest_region_per_item(
+                mitra=mitra, group=group, satuan=satuan, bulan=bulan, tahun=tahun
+            )
+            for col in ["hna_termurah", "hna_tertinggi"]:
+                if col in cheapest:
+                    cheapest[col] = cheapest[col].apply(format_currency_id)
+            st.dataframe(
+                cheapest.rename(
+                    columns={
+                        "kode_item": "Kode Item",
+                        "nama_barang": "Nama Barang",
+                        "region_termurah": "Region Termurah",
+                        "hna_termurah": "HNA Termurah",
+                        "hna_tertinggi": "HNA Tertinggi",
+                        "jumlah_region": "Jumlah Region",
+                    }
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+        with tab_pivot:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                pivot_index = st.selectbox(
+                    "Baris",
+                    list(PIVOT_LABELS),
+                    index=list(PIVOT_LABELS).index("group_transaksi"),
+                    format_func=PIVOT_LABELS.get,
+                )
+            with col2:
+                pivot_columns = st.selectbox(
+                    "Kolom",
+                    list(PIVOT_LABELS),
+                    index=list(PIVOT_LABELS).index("mitra"),
+                    format_func=PIVOT_LABELS.get,
+                )
+            with col3:
+                pivot_aggfunc = st.selectbox(
+                    "Nilai",
+                    list(PIVOT_AGGREGATE_LABELS),
+                    format_func=PIVOT_AGGREGATE_LABELS.get,
+                )
+            if pivot_index == pivot_columns:
+                st.info("Pilih kolom yang berbeda untuk baris dan kolom pivot")
+            else:
+                pivot = analytics.price_pivot(
+                    index=pivot_index,
+                    columns=pivot_columns,
+                    aggfunc=pivot_aggfunc,
+                    region=region,
+                    mitra=mitra,
+                    group=group,
+                    satuan=satuan,
+                    bulan=bulan,
+                    tahun=tahun,
+                )
+                if pivot_aggfunc != "count":
+                    pivot = pivot.map(format_currency_id)
+                st.dataframe(pivot, use_container_width=True)
+        with tab_cluster:
+            # Item dikelompokkan offline (item_clusters.py) setelah upload;
+            # di sini cukup join, tanpa pencarian fuzzy per item
+            clusters = analytics.cheapest_mitra_per_cluster(
+                region=region, group=group, satuan=satuan, bulan=bulan, tahun=tahun
+            )
+            if clusters.empty:
+                st.info("Belum ada item yang sama di lebih dari satu mitra")
+                return
+            display = clusters.drop(columns="cluster_id")
+            for col in ["hna_termurah", "hna_tertinggi"]:
+                display[col] = display[col].apply(format_currency_id)
+            st.dataframe(
+                display.rename(
+                    columns={
+                        "nama_barang": "Nama Barang",
+                        "satuan": "Satuan",
+                        "mitra_termurah": "Mitra Termurah",
+                        "hna_termurah": "HNA Termurah",
+                        "hna_tertinggi": "HNA Tertinggi",
+                        "jumlah_mitra": "Jumlah Mitra",
+                    }
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+            cluster_id = st.selectbox(
+                "Detail item",
+                clusters["cluster_id"].tolist(),
+                format_func=dict(
+                    zip(clusters["cluster_id"], clusters["nama_barang"])
+                ).get,
+            )
+            items = analytics.cluster_items(
+                cluster_id, region=region, group=group, bulan=bulan, tahun=tahun
+            )
+            if "hna" in items:
+                items["hna"] = items["hna"].apply(format_currency_id)
+            st.dataframe(items, use_container_width=True, hide_index=True)
+
+
+def render_data_page(hna_mgr, analytics):
     """Render data display page"""
-    df = hna_mgr.load_data()
+    include_archive = False
+    archived_years = hna_mgr.archived_years()
+    if archived_years:
+        include_archive = st.checkbox(
+            f"📦 Sertakan data arsip ({', '.join(map(str, archived_years))})",
+            help="Tahun yang sudah ditutup disimpan terpisah; centang untuk ikut menampilkannya",
+        )
+    options = hna_mgr.filter_options(include_archive=include_archive)
 
-    if df.empty:
+    if not options.get("region"):
         st.warning("📭 Belum ada data HNA.")
         return
 
@@ -197,22 +520,22 @@ def render_data_page(hna_mgr):
     col1, col2, col3, col4, col5, col6 = st.columns(6)
 
     with col1:
-        region_options = ["Semua"] + sorted(df["region"].unique().tolist())
+        region_options = ["Semua"] + options["region"]
         region_filter = st.selectbox("Region", region_options)
     with col2:
-        mitra_options = ["Semua"] + sorted(df["mitra"].unique().tolist())
+        mitra_options = ["Semua"] + options["mitra"]
         mitra_filter = st.selectbox("Mitra", mitra_options)
     with col3:
-        group_options = ["Semua"] + sorted(df["group_transaksi"].unique().tolist())
+        group_options = ["Semua"] + options["group_transaksi"]
         group_filter = st.selectbox("Group Transaksi", group_options)
     with col4:
-        satuan_options = ["Semua"] + sorted(df["satuan"].unique().tolist())
+        satuan_options = ["Semua"] + options["satuan"]
         satuan_filter = st.selectbox("Satuan", satuan_options)
     with col5:
-        bulan_options = ["Semua"] + sorted(df["periode_bulan"].unique().tolist())
+        bulan_options = ["Semua"] + options["periode_bulan"]
         bulan_filter = st.selectbox("Bulan", bulan_options)
     with col6:
-        tahun_options = ["Semua"] + sorted(df["periode_tahun"].unique().tolist())
+        tahun_options = ["Semua"] + options["periode_tahun"]
         tahun_filter = st.selectbox("Tahun", tahun_options)
 
     st.subheader("🔎 Pencarian Nama Obat")
@@ -230,45 +553,82 @@ def render_data_page(hna_mgr):
     similarity_threshold = st.session_state.similarity_threshold
     search_mode = st.session_state.search_mode
 
-    filtered_df = df.copy()
+    # Filter dijalankan di database; tanpa pencarian nama hanya baris
+    # terbaru yang dibaca, pencarian nama butuh semua baris yang cocok filter
+    page_limit = None if name_query else HNA_PAGE_LIMIT
+    filtered_df = hna_mgr.load_data(
+        include_archive=include_archive,
+        filters={
+            "region": region_filter,
+            "mitra": mitra_filter,
+            "group_transaksi": group_filter,
+            "satuan": satuan_filter,
+            "periode_bulan": bulan_filter,
+            "periode_tahun": tahun_filter,
+        },
+        limit=page_limit,
+    )
+    if page_limit is not None and len(filtered_df) >= page_limit:
+        st.info(
+            f"ℹ️ Menampilkan {page_limit:,} data terbaru. Persempit filter atau "
+            "gunakan pencarian nama untuk melihat data lainnya."
+        )
 
-    if region_filter != "Semua":
-        filtered_df = filtered_df[filtered_df["region"] == region_filter]
-    if mitra_filter != "Semua":
-        filtered_df = filtered_df[filtered_df["mitra"] == mitra_filter]
-    if group_filter != "Semua":
-        filtered_df = filtered_df[filtered_df["group_transaksi"] == group_filter]
-    if satuan_filter != "Semua":
-        filtered_df = filtered_df[filtered_df["satuan"] == satuan_filter]
-    if bulan_filter != "Semua":
-        filtered_df = filtered_df[filtered_df["periode_bulan"] == bulan_filter]
-    if tahun_filter != "Semua":
-        filtered_df = filtered_df[filtered_df["periode_tahun"] == tahun_filter]
+    if not include_archive:
+        render_price_comparison(
+            analytics,
+            region=region_filter,
+            mitra=mitra_filter,
+            group=group_filter,
+            satuan=satuan_filter,
+            bulan=bulan_filter,
+            tahun=tahun_filter,
+        )
 
-    
     search_results = None
     if name_query:
+        # Kandidat dari index FTS; data arsip tidak diindeks sehingga saat
+        # arsip ikut ditampilkan pencarian tetap scan DataFrame
+        fts_ids = None if include_archive else hna_mgr.search_ids(name_query)
+        name_index = hna_mgr.name_index()
+        trigram_index = hna_mgr.trigram_index()
+        exact_candidates = (
+            filtered_df if fts_ids is None else rank_by_ids(filtered_df, fts_ids)
+        )
         if search_mode == "Hanya Exact Match":
            
-            search_results = filtered_df[
-                filtered_df["nama_barang"].str.lower() == name_query.lower()
-            ]
+            search_results = key_matches(
+                exact_candidates, "nama_barang", name_query, "nama_key"
+            )
         elif search_mode == "Hanya Similarity":
          
             search_results = advanced_similarity_search(
-                filtered_df, name_query, "nama_barang", similarity_threshold
+                filtered_df,
+                name_query,
+                "nama_barang",
+                similarity_threshold,
+                fts_ids=fts_ids,
+                name_index=name_index,
+                trigram_index=trigram_index,
+                score_matches=True,
             )
         else:  
-            exact_matches = filtered_df[
-                filtered_df["nama_barang"].str.lower() == name_query.lower()
-            ]
+            exact_matches = key_matches(
+                exact_candidates, "nama_barang", name_query, "nama_key"
+            )
             if not exact_matches.empty:
                 search_results = exact_matches
                 st.success("🎯 Ditemukan exact match!")
             else:
               
                 search_results = advanced_similarity_search(
-                    filtered_df, name_query, "nama_barang", similarity_threshold
+                    filtered_df,
+                    name_query,
+                    "nama_barang",
+                    similarity_threshold,
+                    fts_ids=fts_ids,
+                    name_index=name_index,
+                    trigram_index=trigram_index,
                 )
                 if not search_results.empty:
                     st.info(
@@ -279,6 +639,14 @@ def render_data_page(hna_mgr):
 
         if search_results is not None:
             filtered_df = search_results
+        if not filtered_df.empty and search_mode in [
+            "Auto (Exact + Similarity)",
+            "Hanya Similarity",
+        ]:
+            # Hasil exact/FTS belum punya skor; dihitung sekali per nama unik
+            filtered_df = add_similarity(
+                filtered_df, name_query, "nama_barang", name_index, "nama_key"
+            )
 
    
     st.subheader(f"📋 Hasil Filter ({len(filtered_df)} data)")
@@ -341,14 +709,7 @@ def render_data_page(hna_mgr):
             and search_mode in ["Auto (Exact + Similarity)", "Hanya Similarity"]
             and not filtered_df.empty
         ):
-            similarity_scores = []
-            for name in filtered_df["nama_barang"]:
-                score = process.extractOne(
-                    preprocess_text(name_query), [preprocess_text(name)]
-                )[1]
-                similarity_scores.append(score)
-
-            display_df["Similarity (%)"] = similarity_scores
+            display_df["Similarity (%)"] = filtered_df[SIMILARITY_COLUMN].to_numpy()
             display_df = display_df.sort_values("Similarity (%)", ascending=False)
 
        
@@ -482,9 +843,14 @@ def render_upload_page_penunjang(penunjang_mgr):
         if not uploaded_file or not mitra:
             st.error("❌ Harap pilih file dan isi nama mitra yang akan diupload")
         else:
-            penunjang_mgr.upload_excel(
+            job_id = penunjang_mgr.submit_upload_job(
                 uploaded_file, mitra, st.session_state["username"]
             )
+            st.success(
+                f"⏳ File diterima dan sedang diproses di background (job #{job_id})."
+            )
+
+    render_ingest_jobs("penunjang")
 
 
 def render_data_page_penunjang(penunjang_mgr):
@@ -528,9 +894,18 @@ def render_data_page_penunjang(penunjang_mgr):
     if satuan_filter != "Semua":
         filtered_df = filtered_df[filtered_df["satuan"] == satuan_filter]
     if search_query:
-        filtered_df = filtered_df[
-            filtered_df["deskripsi"].str.contains(search_query, case=False, na=False)
-        ]
+        search_ids = penunjang_mgr.search_ids(search_query)
+        matched = None if search_ids is None else rank_by_ids(filtered_df, search_ids)
+        if matched is None or matched.empty:
+            # Index mencocokkan awal kata; potongan di tengah kata tetap dicari
+            matched = key_matches(
+                filtered_df, "deskripsi", search_query, "deskripsi_key", contains=True
+            )
+        filtered_df = matched
+    if kelas_filter != "Semua":
+        filtered_df[kelas_filter] = filtered_df["id"].map(
+            penunjang_mgr.load_tarif(kelas_filter)
+        )
 
 
     st.subheader(f"📋 Data Pemeriksaan Penunjang ({len(filtered_df)} data)")
@@ -563,9 +938,8 @@ def render_data_page_penunjang(penunjang_mgr):
             }
 
             
-            if kelas_filter != "Semua" and row["additional_data"]:
-                kelas_value = row["additional_data"].get(kelas_filter, "")
-                base_data[kelas_filter] = format_number(kelas_value)
+            if kelas_filter != "Semua":
+                base_data[kelas_filter] = format_number(row[kelas_filter])
 
             display_data.append(base_data)
 
@@ -616,14 +990,12 @@ def render_data_page_penunjang(penunjang_mgr):
         )
 
        
-        additional_data = selected_item.get("additional_data", {})
-        if additional_data:
-            for key, value in additional_data.items():
-                display_name = penunjang_mgr.get_column_display_name(key)
-                detail_headers.append(display_name)
-                
-                formatted_value = format_number(value)
-                detail_values.append(formatted_value)
+        for key, value in penunjang_mgr.get_item_tarif(int(selected_item["id"])):
+            display_name = penunjang_mgr.get_column_display_name(key)
+            detail_headers.append(display_name)
+            
+            formatted_value = format_number(value)
+            detail_values.append(formatted_value)
 
        
         horizontal_detail_df = pd.DataFrame([detail_values], columns=detail_headers)
@@ -650,24 +1022,23 @@ def render_data_page_penunjang(penunjang_mgr):
         output = io.BytesIO()
         with pd.ExcelWriter(output, engine="openpyxl") as writer:
            
-            download_data = []
-            for _, row in filtered_df.iterrows():
-                row_data = {
-                    "Mitra": row["mitra"],
-                    "Kode": row["kode"],
-                    "Deskripsi": row["deskripsi"],
-                    "Group Transaksi": row["group_transaksi"],
-                    "Satuan": row["satuan"],
+            download_df = filtered_df[
+                ["mitra", "kode", "deskripsi", "group_transaksi", "satuan"]
+            ].rename(
+                columns={
+                    "mitra": "Mitra",
+                    "kode": "Kode",
+                    "deskripsi": "Deskripsi",
+                    "group_transaksi": "Group Transaksi",
+                    "satuan": "Satuan",
                 }
+            )
 
-                # Tambahkan semua kolom tambahan
-                additional_data = row.get("additional_data", {})
-                for col in available_columns:
-                    row_data[col] = additional_data.get(col, "")
-
-                download_data.append(row_data)
-
-            download_df = pd.DataFrame(download_data)
+            # Tambahkan semua kolom tambahan
+            tarif_wide = penunjang_mgr.load_tarif_wide(available_columns)
+            download_df = download_df.join(
+                tarif_wide.reindex(filtered_df["id"]).set_axis(download_df.index)
+            )
             download_df.to_excel(writer, index=False, sheet_name="Data Penunjang")
 
            
@@ -738,6 +1109,29 @@ def render_user_management_page(user_mgr):
             else:
                 user_mgr.add_user(new_user, new_pass, role)
 
+    render_pool_metrics()
+
+
+def render_pool_metrics():
+    """Statistik pool koneksi database untuk memantau antrean koneksi"""
+    with st.expander("📈 Koneksi Database"):
+        stats = get_pool_metrics().snapshot()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Checkout", f"{stats['checkouts']:,}".replace(",", "."))
+        col2.metric("Dipakai / Pool", f"{stats['checked_out']} / {stats['pool_size']}")
+        col3.metric("Checkout p95", f"{stats['p95_wait_ms']:.1f} ms")
+        col4.metric("Checkout maks", f"{stats['max_wait_ms']:.1f} ms")
+        st.caption(
+            f"p50 {stats['p50_wait_ms']:.2f} ms · koneksi baru {stats['connects']} · "
+            f"overflow {stats['overflow']} · invalidasi {stats['invalidations']}"
+        )
+        cache = dataset_cache.snapshot()
+        st.caption(
+            f"Cache data: {cache['entries']} entri · "
+            f"{cache['bytes'] / 2**20:,.0f} / {cache['max_bytes'] / 2**20:,.0f} MB · "
+            f"hit {cache['hits']} · miss {cache['misses']} · dibuang {cache['evictions']}"
+        )
+
 
 def render_delete_data_page(hna_mgr, penunjang_mgr):
     """Halaman untuk menghapus data (admin only)"""
@@ -817,11 +1211,7 @@ def render_delete_data_page(hna_mgr, penunjang_mgr):
                         use_container_width=True,
                     ):
                         selected_ids = edited_df[edited_df["Pilih"]]["id"].tolist()
-                        success_count = 0
-
-                        for data_id in selected_ids:
-                            if hna_mgr.delete_data_by_id(data_id) > 0:
-                                success_count += 1
+                        success_count = hna_mgr.delete_data_by_ids(selected_ids)
 
                         st.success(f"✅ Berhasil menghapus {success_count} data!")
                         st.rerun()
@@ -943,11 +1333,7 @@ def render_delete_data_page(hna_mgr, penunjang_mgr):
                         key="delete_selected_penunjang",
                     ):
                         selected_ids = edited_df[edited_df["Pilih"]]["id"].tolist()
-                        success_count = 0
-
-                        for data_id in selected_ids:
-                            if penunjang_mgr.delete_data_by_id(data_id) > 0:
-                                success_count += 1
+                        success_count = penunjang_mgr.delete_data_by_ids(selected_ids)
 
                         st.success(
                             f"✅ Berhasil menghapus {success_count} data penunjang!"
@@ -1013,30 +1399,38 @@ def render_delete_data_page(hna_mgr, penunjang_mgr):
             st.info("📭 Tidak ada data Penunjang yang bisa dihapus")
 
 
-# Render sidebar and get selected page
-selected_page = sidebar_mgr.render_sidebar()
+# Satu session per rerun, ditutup di akhir script (juga saat st.rerun)
+with session_scope() as session:
+    sidebar_mgr = SidebarManager(session)
+    nav_header = NavigationHeader(session)
+    hna_mgr = HNAData(session)
+    penunjang_mgr = PemeriksaanPenunjang(session)
+    analytics = HNAAnalytics(session)
+
+    # Render sidebar and get selected page
+    selected_page = sidebar_mgr.render_sidebar()
 
-# Main content based on selected page
-if st.session_state["login"]:
-    if selected_page == "Upload Data":
-        st.title("📤 Upload Data HNA")
-        render_upload_page(hna_mgr)
+    # Main content based on selected page
+    if st.session_state["login"]:
+        if selected_page == "Upload Data":
+            st.title("📤 Upload Data HNA")
+            render_upload_page(hna_mgr)
 
-    elif selected_page == "Tampilan Data":
-        st.title("📊 Data HNA")
-        render_data_page(hna_mgr)
+        elif selected_page == "Tampilan Data":
+            st.title("📊 Data HNA")
+            render_data_page(hna_mgr, analytics)
 
-    elif selected_page == "Upload Penunjang":
-        st.title("🩺 Upload Data Pemeriksaan Penunjang")
-        render_upload_page_penunjang(penunjang_mgr)
+        elif selected_page == "Upload Penunjang":
+            st.title("🩺 Upload Data Pemeriksaan Penunjang")
+            render_upload_page_penunjang(penunjang_mgr)
 
-    elif selected_page == "Tampilan Penunjang":
-        st.title("📋 Data Pemeriksaan Penunjang")
-        render_data_page_penunjang(penunjang_mgr)
+        elif selected_page == "Tampilan Penunjang":
+            st.title("📋 Data Pemeriksaan Penunjang")
+            render_data_page_penunjang(penunjang_mgr)
 
-    elif selected_page == "Hapus Data":
-        render_delete_data_page(hna_mgr, penunjang_mgr)
+        elif selected_page == "Hapus Data":
+            render_delete_data_page(hna_mgr, penunjang_mgr)
 
-    elif selected_page == "Manajemen User":
-        st.title("👥 Manajemen User")
-        render_user_management_page(sidebar_mgr.user_mgr)
+        elif selected_page == "Manajemen User":
+            st.title("👥 Manajemen User")
+            render_user_management_page(sidebar_mgr.user_mgr)
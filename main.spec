@@ -16,6 +16,8 @@ a = Analysis(
         'streamlit.web',
         'importlib_metadata',
         'openpyxl',
+        'pyarrow',
+        'pyarrow.parquet',
     ],
     hookspath=[],
     hooksconfig={},
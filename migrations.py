@@ -0,0 +1,628 @@
+"""Migrasi skema SQLite berversi.
+
+Setiap migrasi punya nomor versi yang naik terus dan dijalankan sekali per
+database, dalam transaksinya sendiri. Versi yang sudah diterapkan dicatat di
+tabel schema_migrations. Migrasi baru selalu ditambahkan di akhir MIGRATIONS;
+migrasi lama tidak boleh diubah setelah dirilis.
+
+Migrasi 1-5 menyusul skema yang dulu dibuat tanpa versi, jadi semuanya
+idempoten agar aman dijalankan pada database lama.
+"""
+
+import sqlite3
+
+import pandas as pd
+
+from search_keys import search_key
+from validation import parse_numbers
+
+
+def _index_exists(cursor, index_name):
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)
+    )
+    return cursor.fetchone() is not None
+
+
+def _table_exists(cursor, table_name):
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    )
+    return cursor.fetchone() is not None
+
+
+def _add_column_if_missing(cursor, table, column, definition):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _m001_base_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS hna_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region TEXT NOT NULL,
+            mitra TEXT NOT NULL,
+            kode_item TEXT NOT NULL,
+            nama_barang TEXT NOT NULL,
+            group_transaksi TEXT NOT NULL,
+            satuan TEXT NOT NULL,
+            hna REAL NOT NULL,
+            periode_bulan TEXT NOT NULL,
+            periode_tahun INTEGER NOT NULL,
+            uploaded_by TEXT NOT NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pemeriksaan_penunjang (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mitra TEXT NOT NULL,
+            kode TEXT NOT NULL,
+            deskripsi TEXT NOT NULL,
+            group_transaksi TEXT NOT NULL,
+            satuan TEXT NOT NULL,
+            additional_data TEXT,
+            uploaded_by TEXT NOT NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pemeriksaan_columns_metadata (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            column_name TEXT UNIQUE NOT NULL,
+            display_name TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # User admin default jika belum ada
+    cursor.execute("""
+        INSERT OR IGNORE INTO users (username, password, role)
+        VALUES ('admin', 'admin', 'admin')
+    """)
+
+
+def _m002_hna_unique_item_periode(cursor):
+    # Unique key untuk upsert HNA. Duplikat lama dibersihkan dulu,
+    # baris terbaru (id terbesar) yang dipertahankan.
+    if _index_exists(cursor, "ux_hna_data_item_periode"):
+        return
+    cursor.execute("""
+        DELETE FROM hna_data WHERE id NOT IN (
+            SELECT MAX(id) FROM hna_data
+            GROUP BY region, mitra, kode_item, periode_bulan, periode_tahun
+        )
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX ux_hna_data_item_periode
+        ON hna_data (region, mitra, kode_item, periode_bulan, periode_tahun)
+    """)
+
+
+def _m003_ingest_jobs(cursor):
+    # Tabel status job upload yang dijalankan di background
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            filename TEXT,
+            params TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            total_rows INTEGER,
+            processed_rows INTEGER NOT NULL DEFAULT 0,
+            inserted_rows INTEGER NOT NULL DEFAULT 0,
+            updated_rows INTEGER NOT NULL DEFAULT 0,
+            unchanged_rows INTEGER NOT NULL DEFAULT 0,
+            skipped_rows INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            created_by TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    # Ringkasan per file untuk job batch (JSON)
+    _add_column_if_missing(cursor, "ingest_jobs", "result", "TEXT")
+    # File Excel berisi baris yang ditolak validasi
+    _add_column_if_missing(cursor, "ingest_jobs", "error_report", "BLOB")
+
+
+def _m004_upload_registry(cursor):
+    # Registry hash file upload, untuk mendeteksi file yang diupload ulang
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_registry (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sha256 TEXT NOT NULL,
+            filename TEXT,
+            region TEXT NOT NULL,
+            mitra TEXT NOT NULL,
+            periode_bulan TEXT NOT NULL,
+            periode_tahun INTEGER NOT NULL,
+            job_id INTEGER,
+            uploaded_by TEXT NOT NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_upload_registry_file_periode
+        ON upload_registry (sha256, region, mitra, periode_bulan, periode_tahun)
+    """)
+
+
+def backfill_pemeriksaan_tarif(cursor, after_id=0, up_to_id=None):
+    """Isi pemeriksaan_tarif dari JSON additional_data item dengan id > after_id.
+
+    up_to_id membatasi rentang id (mis. satu chunk salinan). Item yang sudah
+    punya baris tarif dilewati agar tarifnya tidak tersalin dua kali.
+    """
+    if up_to_id is None:
+        up_to_id = cursor.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM pemeriksaan_penunjang"
+        ).fetchone()[0]
+    cursor.execute(
+        """
+        INSERT INTO pemeriksaan_tarif (penunjang_id, column_name, nilai_asli)
+        SELECT p.id, j.key, j.value
+        FROM pemeriksaan_penunjang p, json_each(p.additional_data) j
+        WHERE p.id > ? AND p.id <= ?
+          AND NOT EXISTS (
+              SELECT 1 FROM pemeriksaan_tarif t WHERE t.penunjang_id = p.id
+          )
+          AND json_valid(p.additional_data) AND j.value IS NOT NULL
+        ORDER BY p.id, j.id
+        """,
+        (after_id, up_to_id),
+    )
+    cursor.execute(
+        """
+        SELECT id, nilai_asli FROM pemeriksaan_tarif
+        WHERE penunjang_id > ? AND penunjang_id <= ? AND nilai IS NULL
+        """,
+        (after_id, up_to_id),
+    )
+    rows = cursor.fetchall()
+    if rows:
+        ids, raw = zip(*rows)
+        nilai = parse_numbers(pd.Series(raw, dtype=object))
+        cursor.executemany(
+            "UPDATE pemeriksaan_tarif SET nilai = ? WHERE id = ?",
+            [
+                (float(value), row_id)
+                for row_id, value in zip(ids, nilai)
+                if not pd.isna(value)
+            ],
+        )
+
+
+def _m005_pemeriksaan_tarif(cursor):
+    # Tarif per kelas pemeriksaan penunjang dalam format panjang,
+    # menggantikan pembacaan JSON additional_data baris per baris
+    if not _table_exists(cursor, "pemeriksaan_tarif"):
+        cursor.execute("""
+            CREATE TABLE pemeriksaan_tarif (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                penunjang_id INTEGER NOT NULL,
+                column_name TEXT NOT NULL,
+                nilai REAL,
+                nilai_asli TEXT
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX ix_pemeriksaan_tarif_penunjang
+            ON pemeriksaan_tarif (penunjang_id, column_name)
+        """)
+        cursor.execute("""
+            CREATE INDEX ix_pemeriksaan_tarif_kolom
+            ON pemeriksaan_tarif (column_name, penunjang_id, nilai)
+        """)
+        backfill_pemeriksaan_tarif(cursor)
+    # Semua jalur hapus penunjang ikut membersihkan tarifnya
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_pemeriksaan_penunjang_delete
+        AFTER DELETE ON pemeriksaan_penunjang
+        BEGIN
+            DELETE FROM pemeriksaan_tarif WHERE penunjang_id = old.id;
+        END
+    """)
+
+
+def _m006_query_indexes(cursor):
+    # Index mengikuti bentuk query yang benar-benar dipakai:
+    # - filter/hapus per region, mitra dan periode (kolom kesetaraan dulu,
+    #   tahun sebelum bulan karena tahun lebih sering dipakai sendiri)
+    # - filter mitra + group transaksi di halaman data dan perbandingan
+    # - ORDER BY uploaded_at DESC di load_data
+    # - pencarian/perbandingan per kode item lintas mitra
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_hna_data_region_mitra_periode
+        ON hna_data (region, mitra, periode_tahun, periode_bulan)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_hna_data_mitra_group
+        ON hna_data (mitra, group_transaksi)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_hna_data_uploaded_at
+        ON hna_data (uploaded_at)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_hna_data_kode_item
+        ON hna_data (kode_item)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_pemeriksaan_penunjang_mitra_group
+        ON pemeriksaan_penunjang (mitra, group_transaksi)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_pemeriksaan_penunjang_uploaded_at
+        ON pemeriksaan_penunjang (uploaded_at)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_pemeriksaan_penunjang_kode
+        ON pemeriksaan_penunjang (kode)
+    """)
+    # Statistik untuk query planner agar index baru benar-benar dipilih
+    cursor.execute("ANALYZE")
+
+
+# Kolom teks hna_data yang disimpan sebagai id ke tabel dimensi:
+# kolom -> (tabel dimensi, kolom id di hna_fact)
+HNA_DIMENSIONS = {
+    "region": ("dim_region", "region_id"),
+    "mitra": ("dim_mitra", "mitra_id"),
+    "group_transaksi": ("dim_group_transaksi", "group_id"),
+    "satuan": ("dim_satuan", "satuan_id"),
+}
+
+
+def _m007_hna_dimensions(cursor):
+    # hna_data dipecah menjadi tabel fakta hna_fact + tabel dimensi. Nama
+    # hna_data tetap ada sebagai view dengan kolom teks yang sama, jadi
+    # pembaca lama (export, utils, upload_handler) tidak perlu diubah.
+    for column, (table, _) in HNA_DIMENSIONS.items():
+        cursor.execute(f"""
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY,
+                nama TEXT NOT NULL UNIQUE
+            )
+        """)
+        cursor.execute(f"""
+            INSERT INTO {table} (nama)
+            SELECT DISTINCT {column} FROM hna_data ORDER BY {column}
+        """)
+
+    cursor.execute("""
+        CREATE TABLE hna_fact (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region_id INTEGER NOT NULL REFERENCES dim_region (id),
+            mitra_id INTEGER NOT NULL REFERENCES dim_mitra (id),
+            kode_item TEXT NOT NULL,
+            nama_barang TEXT NOT NULL,
+            group_id INTEGER NOT NULL REFERENCES dim_group_transaksi (id),
+            satuan_id INTEGER NOT NULL REFERENCES dim_satuan (id),
+            hna REAL NOT NULL,
+            periode_bulan TEXT NOT NULL,
+            periode_tahun INTEGER NOT NULL,
+            uploaded_by TEXT NOT NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO hna_fact (
+            id, region_id, mitra_id, kode_item, nama_barang, group_id, satuan_id,
+            hna, periode_bulan, periode_tahun, uploaded_by, uploaded_at
+        )
+        SELECT h.id, r.id, m.id, h.kode_item, h.nama_barang, g.id, s.id,
+               h.hna, h.periode_bulan, h.periode_tahun, h.uploaded_by, h.uploaded_at
+        FROM hna_data h
+        JOIN dim_region r ON r.nama = h.region
+        JOIN dim_mitra m ON m.nama = h.mitra
+        JOIN dim_group_transaksi g ON g.nama = h.group_transaksi
+        JOIN dim_satuan s ON s.nama = h.satuan
+        ORDER BY h.id
+    """)
+    cursor.execute("DROP TABLE hna_data")
+
+    # Index migrasi 2 dan 6, sekarang di atas kolom id
+    cursor.execute("""
+        CREATE UNIQUE INDEX ux_hna_fact_item_periode
+        ON hna_fact (region_id, mitra_id, kode_item, periode_bulan, periode_tahun)
+    """)
+    cursor.execute("""
+        CREATE INDEX ix_hna_fact_region_mitra_periode
+        ON hna_fact (region_id, mitra_id, periode_tahun, periode_bulan)
+    """)
+    cursor.execute(
+        "CREATE INDEX ix_hna_fact_mitra_group ON hna_fact (mitra_id, group_id)"
+    )
+    cursor.execute("CREATE INDEX ix_hna_fact_uploaded_at ON hna_fact (uploaded_at)")
+    cursor.execute("CREATE INDEX ix_hna_fact_kode_item ON hna_fact (kode_item)")
+
+    cursor.execute("""
+        CREATE VIEW hna_data AS
+        SELECT f.id, r.nama AS region, m.nama AS mitra, f.kode_item, f.nama_barang,
+               g.nama AS group_transaksi, s.nama AS satuan, f.hna,
+               f.periode_bulan, f.periode_tahun, f.uploaded_by, f.uploaded_at
+        FROM hna_fact f
+        JOIN dim_region r ON r.id = f.region_id
+        JOIN dim_mitra m ON m.id = f.mitra_id
+        JOIN dim_group_transaksi g ON g.id = f.group_id
+        JOIN dim_satuan s ON s.id = f.satuan_id
+    """)
+
+    # Penulis lama yang masih INSERT/DELETE ke hna_data diteruskan ke hna_fact.
+    # Klausa OR REPLACE/OR IGNORE dari statement luar ikut berlaku di dalam
+    # trigger, jadi nama dimensi baru ditambahkan dengan NOT EXISTS (bukan
+    # OR IGNORE) agar REPLACE tidak mengganti id dimensi yang sudah dipakai.
+    dim_inserts = "\n".join(
+        f"INSERT INTO {table} (nama) SELECT new.{column} "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE nama = new.{column});"
+        for column, (table, _) in HNA_DIMENSIONS.items()
+    )
+    cursor.execute(f"""
+        CREATE TRIGGER trg_hna_data_insert INSTEAD OF INSERT ON hna_data
+        BEGIN
+            {dim_inserts}
+            INSERT INTO hna_fact (
+                id, region_id, mitra_id, kode_item, nama_barang, group_id,
+                satuan_id, hna, periode_bulan, periode_tahun, uploaded_by, uploaded_at
+            ) VALUES (
+                new.id,
+                (SELECT id FROM dim_region WHERE nama = new.region),
+                (SELECT id FROM dim_mitra WHERE nama = new.mitra),
+                new.kode_item, new.nama_barang,
+                (SELECT id FROM dim_group_transaksi WHERE nama = new.group_transaksi),
+                (SELECT id FROM dim_satuan WHERE nama = new.satuan),
+                new.hna, new.periode_bulan, new.periode_tahun, new.uploaded_by,
+                COALESCE(new.uploaded_at, CURRENT_TIMESTAMP)
+            );
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_hna_data_delete INSTEAD OF DELETE ON hna_data
+        BEGIN
+            DELETE FROM hna_fact WHERE id = old.id;
+        END
+    """)
+    cursor.execute("ANALYZE")
+
+
+def _m008_hna_archive(cursor):
+    # Tahun yang sudah ditutup dipindah dari hna_fact ke file SQLite arsip
+    # sendiri (lihat hna_archive.py); tabel ini mencatat tahun dan filenya
+    cursor.execute("""
+        CREATE TABLE hna_archive (
+            periode_tahun INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            archived_by TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _create_fts(cursor, table, column):
+    # Index FTS5 external content: teks tidak disalin, hanya token -> rowid.
+    # Trigger menjaga index tetap sinkron untuk semua jalur tulis; REPLACE
+    # hanya ikut terhapus dari index jika recursive_triggers aktif.
+    fts = f"{table}_fts"
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE {fts} USING fts5(
+            {column},
+            content = '{table}',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    cursor.execute(f"""
+        CREATE TRIGGER trg_{fts}_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_{fts}_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column})
+            VALUES ('delete', old.id, old.{column});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_{fts}_update AFTER UPDATE OF {column} ON {table}
+        WHEN old.{column} IS NOT new.{column}
+        BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column})
+            VALUES ('delete', old.id, old.{column});
+            INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+        END
+    """)
+
+
+def _m009_fts_search(cursor):
+    # Pencarian nama barang HNA dan deskripsi penunjang lewat index FTS5
+    _create_fts(cursor, "hna_fact", "nama_barang")
+    _create_fts(cursor, "pemeriksaan_penunjang", "deskripsi")
+
+
+# Nama dataset -> tabel yang perubahannya menaikkan versi dataset tersebut
+DATA_VERSION_TABLES = {
+    "hna": ["hna_fact"],
+    "penunjang": ["pemeriksaan_penunjang", "pemeriksaan_tarif"],
+}
+
+
+def _m010_data_version(cursor):
+    # Penghitung perubahan per dataset, dinaikkan trigger di setiap insert,
+    # update dan delete (semua jalur tulis, termasuk yang lama). Snapshot dan
+    # cache cukup membandingkan angka ini untuk tahu datanya masih berlaku.
+    cursor.execute("""
+        CREATE TABLE data_version (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for name, tables in DATA_VERSION_TABLES.items():
+        _add_data_version(cursor, name, tables)
+
+
+def _add_data_version(cursor, name, tables):
+    cursor.execute("INSERT INTO data_version (name) VALUES (?)", (name,))
+    for table in tables:
+        for action in ["INSERT", "UPDATE", "DELETE"]:
+            cursor.execute(f"""
+                CREATE TRIGGER trg_{table}_version_{action.lower()}
+                AFTER {action} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1
+                    WHERE name = '{name}';
+                END
+            """)
+
+
+def _m011_hna_filter_indexes(cursor):
+    # Filter halaman data dijalankan di SQL (hna_query.py); index untuk
+    # kombinasi yang belum tertutup index migrasi 7
+    cursor.execute("""
+        CREATE INDEX ix_hna_fact_mitra_periode
+        ON hna_fact (mitra_id, periode_bulan, periode_tahun)
+    """)
+    cursor.execute("CREATE INDEX ix_hna_fact_group ON hna_fact (group_id)")
+    cursor.execute("CREATE INDEX ix_hna_fact_satuan ON hna_fact (satuan_id)")
+    cursor.execute("""
+        CREATE INDEX ix_hna_fact_periode
+        ON hna_fact (periode_tahun, periode_bulan, uploaded_at)
+    """)
+
+
+# (tabel, kolom sumber, kolom kunci pencarian) untuk search_keys.search_key
+SEARCH_KEY_COLUMNS = [
+    ("hna_fact", "nama_barang", "nama_key"),
+    ("pemeriksaan_penunjang", "deskripsi", "deskripsi_key"),
+]
+
+
+def _m012_search_keys(cursor):
+    # Kunci pencarian diisi saat upload (ingest.py); baris lama diisi di sini.
+    # Baris yang ditulis lewat jalur lain (view hna_data, SQL langsung) bisa
+    # NULL dan dihitung saat dataset dibaca.
+    for table, column, key_column in SEARCH_KEY_COLUMNS:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {key_column} TEXT")
+        rows = cursor.execute(f"SELECT id, {column} FROM {table}").fetchall()
+        cursor.executemany(
+            f"UPDATE {table} SET {key_column} = ? WHERE id = ?",
+            [(search_key(value), row_id) for row_id, value in rows],
+        )
+        cursor.execute(
+            f"CREATE INDEX ix_{table}_{key_column} ON {table} ({key_column})"
+        )
+
+
+def _m013_item_clusters(cursor):
+    # Kelompok item yang sama lintas mitra (item_clusters.py), satu baris per
+    # kunci nama + satuan; perbandingan harga cukup join lewat nama_key
+    cursor.execute("""
+        CREATE TABLE item_clusters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nama_key TEXT NOT NULL,
+            satuan_id INTEGER NOT NULL REFERENCES dim_satuan(id),
+            cluster_id INTEGER NOT NULL,
+            score INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (nama_key, satuan_id)
+        )
+    """)
+    cursor.execute(
+        "CREATE INDEX ix_item_clusters_cluster ON item_clusters (cluster_id)"
+    )
+
+
+def _m014_item_clusters_version(cursor):
+    # Cache hasil perbandingan per cluster (analytics.py) ikut basi saat
+    # item_clusters diperbarui setelah upload, bukan hanya saat hna_fact berubah
+    _add_data_version(cursor, "item_clusters", ["item_clusters"])
+
+
+# (versi, nama, fungsi). Tambahkan migrasi baru di akhir dengan versi berikutnya.
+MIGRATIONS = [
+    (1, "base_tables", _m001_base_tables),
+    (2, "hna_unique_item_periode", _m002_hna_unique_item_periode),
+    (3, "ingest_jobs", _m003_ingest_jobs),
+    (4, "upload_registry", _m004_upload_registry),
+    (5, "pemeriksaan_tarif", _m005_pemeriksaan_tarif),
+    (6, "query_indexes", _m006_query_indexes),
+    (7, "hna_dimensions", _m007_hna_dimensions),
+    (8, "hna_archive", _m008_hna_archive),
+    (9, "fts_search", _m009_fts_search),
+    (10, "data_version", _m010_data_version),
+    (11, "hna_filter_indexes", _m011_hna_filter_indexes),
+    (12, "search_keys", _m012_search_keys),
+    (13, "item_clusters", _m013_item_clusters),
+    (14, "item_clusters_version", _m014_item_clusters_version),
+]
+
+
+def applied_versions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def _bump_data_versions(cursor):
+    # Migrasi bisa mengubah bentuk data tanpa menulis baris (kolom/index baru);
+    # naikkan semua versi agar snapshot dan cache dataset dibangun ulang
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'data_version'")
+    if cursor.fetchone() is not None:
+        cursor.execute("UPDATE data_version SET version = version + 1")
+
+
+def run_migrations(db_path):
+    """Terapkan migrasi yang belum tercatat; mengembalikan daftar nama yang dijalankan"""
+    # isolation_level=None: transaksi diatur sendiri agar DDL ikut di-rollback
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        done = applied_versions(conn)
+        applied = []
+        for version, name, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            cursor = conn.cursor()
+            # IMMEDIATE: dua proses yang start bersamaan tidak menjalankan
+            # migrasi yang sama dua kali
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute(
+                    "SELECT 1 FROM schema_migrations WHERE version = ?", (version,)
+                )
+                if cursor.fetchone() is None:
+                    migrate(cursor)
+                    _bump_data_versions(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                        (version, name),
+                    )
+                    applied.append(name)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return applied
+    finally:
+        conn.close()
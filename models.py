@@ -1,7 +1,25 @@
 import pandas as pd
 import streamlit as st
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from fuzzywuzzy import process
+from datasets import build_hna_frame, cached_frame, load_dataset, refresh_snapshot
+from hna_archive import archived_years, refresh_archives
+from hna_query import active_filters, filter_frame, filter_options
+from ingest import IngestError, ingest_hna
+from jobs import submit_job
+from search_index import search_ids
+from similarity import name_index
+from trigram_index import sync_index
+from upload_registry import (
+    describe_upload,
+    file_sha256,
+    find_upload,
+    forget_uploads,
+    register_upload,
+)
+
+# Jumlah id per statement DELETE ... IN (...)
+DELETE_CHUNK_SIZE = 500
 
 
 def format_currency_id(value):
@@ -69,95 +87,235 @@ class HNAData:
     def __init__(self, session):
         self.session = session
 
-    def upload_excel(self, file, region, mitra, bulan, tahun, user):
+    def find_previous_upload(self, data, region, mitra, bulan, tahun, force=False):
+        """Cek registry sebelum file dibaca; tampilkan peringatan jika sudah pernah diupload"""
+        sha256 = file_sha256(data)
+        previous = find_upload(self.session, sha256, region, mitra, bulan, tahun)
+        if previous and not force:
+            st.warning(
+                f"⚠️ {describe_upload(previous)} Upload dilewati; centang opsi "
+                "upload ulang jika data memang perlu diproses lagi."
+            )
+        return sha256, previous
+
+    def upload_excel(
+        self, file, region, mitra, bulan, tahun, user, mode="replace", force=False
+    ):
         try:
-            df = pd.read_excel(file)
-            expected_cols = [
-                "Kode Item",
-                "Nama Barang",
-                "Group Transaki",
-                "Satuan",
-                "HNA",
-            ]
-            if list(df.columns) != expected_cols:
-                st.error("Format kolom tidak sesuai template!")
+            sha256, previous = self.find_previous_upload(
+                file.getvalue(), region, mitra, bulan, tahun, force
+            )
+            if previous and not force:
                 return
-
-            if not pd.api.types.is_numeric_dtype(df["HNA"]):
-                st.error(
-                    "Kolom HNA harus berisi angka! Pastikan format angka tanpa titik/koma."
+            stats = ingest_hna(
+                self.session, file, region, mitra, bulan, tahun, user, mode=mode
+            )
+            register_upload(
+                self.session, sha256, file.name, region, mitra, bulan, tahun, user
+            )
+            self.refresh_snapshot()
+            st.success(
+                f"✅ File berhasil diupload! {stats['rows']} data diproses "
+                f"({stats['rows_per_second']:,.0f} baris/detik): "
+                f"{stats['inserted']} baru, {stats['updated']} diperbarui, "
+                f"{stats['unchanged']} tidak berubah."
+            )
+            if stats["skipped"]:
+                st.warning(
+                    f"⚠️ {stats['skipped']} baris tidak lolos validasi dan dilewati. "
+                    "Download laporan error untuk melihat alasannya."
                 )
-                return
+                st.download_button(
+                    label="📥 Download Laporan Error",
+                    data=stats["error_report"],
+                    file_name="error_upload_hna.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                )
+        except IngestError as e:
+            st.error(str(e))
+        except Exception as e:
+            st.error(f"❌ Error upload: {e}")
 
-            success_count = 0
-            for _, row in df.iterrows():
+    def submit_upload_job(
+        self, file, region, mitra, bulan, tahun, user, mode="replace", force=False
+    ):
+        """Jalankan upload di background; status bisa dipantau lewat jobs.list_jobs.
 
-                if pd.isna(row["Kode Item"]) or pd.isna(row["Nama Barang"]):
-                    continue
+        Mengembalikan id job, atau None jika file yang sama sudah pernah diupload.
+        """
+        data = file.getvalue()
+        sha256, previous = self.find_previous_upload(
+            data, region, mitra, bulan, tahun, force
+        )
+        if previous and not force:
+            return None
+        params = {
+            "region": region,
+            "mitra": mitra,
+            "bulan": bulan,
+            "tahun": int(tahun),
+            "mode": mode,
+            "sha256": sha256,
+            "filename": file.name,
+        }
+        return submit_job("hna", data, file.name, params, user)
 
-                stmt = text(
-                    """
-                    INSERT INTO hna_data 
-                    (region, mitra, kode_item, nama_barang, group_transaksi, satuan, hna, periode_bulan, periode_tahun, uploaded_by)
-                    VALUES (:region, :mitra, :kode_item, :nama_barang, :group_transaksi, :satuan, :hna, :bulan, :tahun, :user)
-                """
-                )
-                self.session.execute(
-                    stmt,
-                    {
-                        "region": region,
-                        "mitra": mitra,
-                        "kode_item": row["Kode Item"],
-                        "nama_barang": row["Nama Barang"],
-                        "group_transaksi": row["Group Transaki"],
-                        "satuan": row["Satuan"],
-                        "hna": row["HNA"],
-                        "bulan": bulan,
-                        "tahun": tahun,
-                        "user": user,
-                    },
-                )
-                success_count += 1
+    def submit_batch_upload_job(self, files, user, mode="replace", force=False):
+        """Upload banyak file .xlsx/.zip di background, satu transaksi per file.
 
-            self.session.commit()
-            st.success(f"✅ File berhasil diupload! {success_count} data tersimpan.")
+        File yang sudah pernah diupload dilewati per file kecuali force.
+        """
+        payload = [(file.name, file.getvalue()) for file in files]
+        filename = ", ".join(name for name, _ in payload)
+        params = {"mode": mode, "force": force}
+        return submit_job("hna_batch", payload, filename, params, user)
+
+    def archived_years(self):
+        """Tahun yang sudah dipindah ke arsip read-only"""
+        try:
+            return archived_years(self.session)
         except Exception as e:
-            st.error(f"❌ Error upload: {e}")
+            st.error(f"❌ Error membaca daftar arsip: {e}")
+            return []
 
-    def load_data(self):
+    def load_data(self, include_archive=False, columns=None, filters=None, limit=None):
+        """Data HNA, baris terbaru dulu; region/mitra/group/satuan berupa Categorical.
+
+        filters ({kolom: nilai}) dan limit dijalankan di database (lihat
+        hna_query.py). Tanpa keduanya, data aktif dibaca dari snapshot
+        Parquet selama masih berlaku (lihat datasets.py); columns membatasi
+        kolom yang dibaca. include_archive ikut membaca tahun arsip.
+        Hasil disimpan di cache proses sampai data HNA berubah.
+        """
         try:
-            df = pd.read_sql(
-                "SELECT * FROM hna_data ORDER BY uploaded_at DESC", self.session.bind
+            source = "hna_fact"
+            if include_archive:
+                refresh_archives(self.session)
+                source = "hna_fact_all"
+            elif not active_filters(filters) and limit is None:
+                return load_dataset(self.session.connection(), "hna", columns)
+            connection = self.session.connection()
+
+            def load():
+                df = build_hna_frame(connection, source, filters, limit)
+                return df if columns is None else df[columns]
+
+            key = (
+                source,
+                tuple(sorted(active_filters(filters).items())),
+                limit,
+                None if columns is None else tuple(columns),
             )
-            return df
+            return cached_frame(connection, "hna", key, load)
         except Exception as e:
             st.error(f"❌ Error loading data: {e}")
             return pd.DataFrame()
 
+    def filter_options(self, include_archive=False):
+        """Pilihan filter halaman data: nilai yang punya data, terurut"""
+        try:
+            source = "hna_fact"
+            if include_archive:
+                refresh_archives(self.session)
+                source = "hna_fact_all"
+            return filter_options(self.session.connection(), source)
+        except Exception as e:
+            st.error(f"❌ Error loading filter: {e}")
+            return {}
+
+    def refresh_snapshot(self):
+        """Tulis ulang snapshot HNA dan tambahkan nama baru ke index trigram"""
+        try:
+            refresh_snapshot(self.session.connection(), "hna")
+            sync_index(self.session.connection())
+        except Exception as e:
+            print(f"⚠️ Snapshot HNA gagal diperbarui: {e}")
+
+    def search_ids(self, query, prefix=True):
+        """Id baris yang nama barangnya cocok dengan query (index FTS), urut relevansi.
+
+        Hanya mencakup data aktif (hna_fact). Mengembalikan None jika index
+        tidak bisa dipakai.
+        """
+        try:
+            return search_ids(self.session, "hna_fact", query, prefix)
+        except Exception as e:
+            st.error(f"❌ Error pencarian: {e}")
+            return None
+
+    def name_index(self):
+        """Nama barang data aktif yang sudah dinormalisasi, untuk similarity.
+
+        Mengembalikan None jika index tidak bisa dibangun.
+        """
+        try:
+            return name_index(
+                self.session.connection(), "hna", "nama_barang", "nama_key"
+            )
+        except Exception as e:
+            st.error(f"❌ Error index similarity: {e}")
+            return None
+
+    def trigram_index(self):
+        """Index trigram nama barang untuk memangkas kandidat similarity.
+
+        Mengembalikan None jika index tidak bisa dipakai.
+        """
+        try:
+            return sync_index(self.session.connection())
+        except Exception as e:
+            st.error(f"❌ Error index trigram: {e}")
+            return None
+
     def filter_data(
         self, df, region=None, mitra=None, group=None, bulan=None, tahun=None
     ):
-        if region:
-            df = df[df["region"] == region]
-        if mitra:
-            df = df[df["mitra"] == mitra]
-        if group:
-            df = df[df["group_transaksi"] == group]
-        if bulan:
-            df = df[df["periode_bulan"] == bulan]
-        if tahun:
-            df = df[df["periode_tahun"] == tahun]
-        return df
+        """Filter DataFrame yang sudah terbaca; untuk data di database pakai
+        load_data(filters=...) agar filter dijalankan di SQL"""
+        return filter_frame(
+            df,
+            {
+                "region": region,
+                "mitra": mitra,
+                "group_transaksi": group,
+                "periode_bulan": bulan,
+                "periode_tahun": tahun,
+            },
+        )
 
     # ========== FUNGSI HAPUS DATA HNA ==========
     def delete_data_by_id(self, data_id):
         """Hapus data HNA berdasarkan ID"""
         try:
-            stmt = text("DELETE FROM hna_data WHERE id = :id")
+            forget_uploads(self.session, "id = :id", {"id": data_id})
+            stmt = text("DELETE FROM hna_fact WHERE id = :id")
             result = self.session.execute(stmt, {"id": data_id})
             self.session.commit()
+            self.refresh_snapshot()
             return result.rowcount
         except Exception as e:
+            self.session.rollback()
+            st.error(f"❌ Error menghapus data: {e}")
+            return 0
+
+    def delete_data_by_ids(self, data_ids):
+        """Hapus banyak data sekaligus dalam satu transaksi; mengembalikan jumlah terhapus"""
+        try:
+            stmt = text("DELETE FROM hna_fact WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            )
+            data_ids = [int(data_id) for data_id in data_ids]
+            deleted = 0
+            # Per potongan agar jumlah parameter tetap di bawah batas SQLite
+            for start in range(0, len(data_ids), DELETE_CHUNK_SIZE):
+                chunk = data_ids[start : start + DELETE_CHUNK_SIZE]
+                forget_uploads(self.session, "id IN :ids", {"ids": chunk})
+                deleted += self.session.execute(stmt, {"ids": chunk}).rowcount
+            self.session.commit()
+            self.refresh_snapshot()
+            return deleted
+        except Exception as e:
+            self.session.rollback()
             st.error(f"❌ Error menghapus data: {e}")
             return 0
 
@@ -166,41 +324,51 @@ class HNAData:
     ):
         """Hapus data HNA berdasarkan filter"""
         try:
-            base_sql = "DELETE FROM hna_data WHERE 1=1"
+            where = "1=1"
             params = {}
 
             if region and region != "Semua":
-                base_sql += " AND region = :region"
+                where += (
+                    " AND region_id = (SELECT id FROM dim_region WHERE nama = :region)"
+                )
                 params["region"] = region
             if mitra and mitra != "Semua":
-                base_sql += " AND mitra = :mitra"
+                where += (
+                    " AND mitra_id = (SELECT id FROM dim_mitra WHERE nama = :mitra)"
+                )
                 params["mitra"] = mitra
             if group and group != "Semua":
-                base_sql += " AND group_transaksi = :group"
+                where += " AND group_id = (SELECT id FROM dim_group_transaksi WHERE nama = :group)"
                 params["group"] = group
             if bulan and bulan != "Semua":
-                base_sql += " AND periode_bulan = :bulan"
+                where += " AND periode_bulan = :bulan"
                 params["bulan"] = bulan
             if tahun and tahun != "Semua":
-                base_sql += " AND periode_tahun = :tahun"
+                where += " AND periode_tahun = :tahun"
                 params["tahun"] = tahun
 
-            stmt = text(base_sql)
+            forget_uploads(self.session, where, params)
+            stmt = text(f"DELETE FROM hna_fact WHERE {where}")
             result = self.session.execute(stmt, params)
             self.session.commit()
+            self.refresh_snapshot()
 
             return result.rowcount
         except Exception as e:
+            self.session.rollback()
             st.error(f"❌ Error menghapus data: {e}")
             return 0
 
     def delete_all_data(self):
         """Hapus semua data HNA"""
         try:
-            stmt = text("DELETE FROM hna_data")
+            self.session.execute(text("DELETE FROM upload_registry"))
+            stmt = text("DELETE FROM hna_fact")
             result = self.session.execute(stmt)
             self.session.commit()
+            self.refresh_snapshot()
             return result.rowcount
         except Exception as e:
+            self.session.rollback()
             st.error(f"❌ Error menghapus semua data: {e}")
             return 0
@@ -1,7 +1,18 @@
 import pandas as pd
 import streamlit as st
-from sqlalchemy import text
-import json
+from sqlalchemy import bindparam, text
+from datasets import (
+    PENUNJANG_COLUMNS,
+    TARIF_PREFIX,
+    load_dataset,
+    refresh_snapshot,
+)
+from ingest import IngestError, ingest_penunjang
+from jobs import submit_job
+from search_index import search_ids
+
+# Jumlah id per statement DELETE ... IN (...)
+DELETE_CHUNK_SIZE = 500
 
 
 class PemeriksaanPenunjang:
@@ -10,94 +21,93 @@ class PemeriksaanPenunjang:
 
     def upload_excel(self, file, mitra, user):
         try:
-            df = pd.read_excel(file)
-
-            expected_base_cols = ["KODE", "DESKRIPSI", "GROUP TRANSAKSI", "SATUAN"]
-
-            for col in expected_base_cols:
-                if col not in df.columns:
-                    st.error(f"❌ Kolom {col} tidak ditemukan dalam file!")
-                    return
-
-            additional_cols = [
-                col for col in df.columns if col not in expected_base_cols
-            ]
-
-            for col in additional_cols:
-                try:
-                    stmt = text(
-                        """
-                        INSERT OR IGNORE INTO pemeriksaan_columns_metadata (column_name, display_name, created_by)
-                        VALUES (:column_name, :display_name, :created_by)
-                    """
-                    )
-                    self.session.execute(
-                        stmt,
-                        {"column_name": col, "display_name": col, "created_by": user},
-                    )
-                except Exception as e:
-                    st.warning(f"⚠️ Kolom {col} sudah ada atau error: {e}")
-
-            self.session.commit()
-
-            success_count = 0
-            for _, row in df.iterrows():
-
-                if pd.isna(row["KODE"]) or pd.isna(row["DESKRIPSI"]):
-                    continue
-
-                additional_data = {}
-                for col in additional_cols:
-                    if not pd.isna(row[col]):
-                        additional_data[col] = str(row[col])
-
-                stmt = text(
-                    """
-                    INSERT INTO pemeriksaan_penunjang 
-                    (mitra, kode, deskripsi, group_transaksi, satuan, additional_data, uploaded_by)
-                    VALUES (:mitra, :kode, :deskripsi, :group_transaksi, :satuan, :additional_data, :user)
-                """
-                )
-                self.session.execute(
-                    stmt,
-                    {
-                        "mitra": mitra,
-                        "kode": row["KODE"],
-                        "deskripsi": row["DESKRIPSI"],
-                        "group_transaksi": row["GROUP TRANSAKSI"],
-                        "satuan": row["SATUAN"],
-                        "additional_data": json.dumps(additional_data),
-                        "user": user,
-                    },
-                )
-                success_count += 1
-
-            self.session.commit()
+            stats = ingest_penunjang(self.session, file, mitra, user)
+            self.refresh_snapshot()
             st.success(
-                f"✅ File berhasil diupload! {success_count} data pemeriksaan penunjang tersimpan."
+                f"✅ File berhasil diupload! {stats['rows']} data pemeriksaan penunjang tersimpan "
+                f"({stats['rows_per_second']:,.0f} baris/detik)."
             )
+            additional_cols = stats["additional_cols"]
             st.info(
                 f"📝 Kolom tambahan terdeteksi: {', '.join(additional_cols) if additional_cols else 'Tidak ada'}"
             )
 
+        except IngestError as e:
+            st.error(str(e))
         except Exception as e:
             st.error(f"❌ Error upload: {e}")
 
+    def submit_upload_job(self, file, mitra, user):
+        """Jalankan upload di background; status bisa dipantau lewat jobs.list_jobs"""
+        return submit_job(
+            "penunjang", file.getvalue(), file.name, {"mitra": mitra}, user
+        )
+
     def load_data(self):
+        """Data pakem pemeriksaan penunjang; tarif per kelas ada di pemeriksaan_tarif"""
         try:
-            df = pd.read_sql(
-                "SELECT * FROM pemeriksaan_penunjang ORDER BY uploaded_at DESC",
-                self.session.bind,
+            return load_dataset(
+                self.session.connection(), "penunjang", PENUNJANG_COLUMNS
             )
+        except Exception as e:
+            st.error(f"❌ Error loading data: {e}")
+            return pd.DataFrame()
+
+    def refresh_snapshot(self):
+        """Tulis ulang snapshot penunjang setelah data berubah"""
+        try:
+            refresh_snapshot(self.session.connection(), "penunjang")
+        except Exception as e:
+            print(f"⚠️ Snapshot penunjang gagal diperbarui: {e}")
+
+    def search_ids(self, query, prefix=True):
+        """Id item yang deskripsinya cocok dengan query (index FTS), urut relevansi.
 
-            if not df.empty and "additional_data" in df.columns:
-                df["additional_data"] = df["additional_data"].apply(
-                    lambda x: json.loads(x) if x else {}
-                )
+        Mengembalikan None jika index tidak bisa dipakai.
+        """
+        try:
+            return search_ids(self.session, "pemeriksaan_penunjang", query, prefix)
+        except Exception as e:
+            st.error(f"❌ Error pencarian: {e}")
+            return None
 
-            return df
+    def load_tarif(self, column_name):
+        """Tarif satu kelas untuk semua item, sebagai Series dengan index penunjang_id"""
+        try:
+            tarif_column = TARIF_PREFIX + column_name
+            df = load_dataset(
+                self.session.connection(), "penunjang", ["id", tarif_column]
+            )
+            if tarif_column not in df.columns:
+                return pd.Series(dtype=object)
+            return df.set_index("id")[tarif_column].dropna()
         except Exception as e:
-            st.error(f"❌ Error loading data: {e}")
+            st.error(f"❌ Error loading tarif: {e}")
+            return pd.Series(dtype=object)
+
+    def get_item_tarif(self, penunjang_id):
+        """Semua tarif satu item, urut sesuai kolom di file upload"""
+        stmt = text("""
+            SELECT column_name, COALESCE(nilai, nilai_asli) AS nilai
+            FROM pemeriksaan_tarif WHERE penunjang_id = :penunjang_id ORDER BY id
+        """)
+        return self.session.execute(stmt, {"penunjang_id": penunjang_id}).fetchall()
+
+    def load_tarif_wide(self, columns=None):
+        """Tarif semua item dalam format lebar: index penunjang_id, satu kolom per kelas"""
+        try:
+            tarif_columns = None
+            if columns is not None:
+                tarif_columns = ["id"] + [TARIF_PREFIX + column for column in columns]
+            df = load_dataset(self.session.connection(), "penunjang", tarif_columns)
+            wide = df.set_index("id").filter(regex=f"^{TARIF_PREFIX}")
+            wide.columns = wide.columns.str.removeprefix(TARIF_PREFIX)
+            wide = wide.dropna(how="all").rename_axis("penunjang_id")
+            if columns is not None:
+                wide = wide.reindex(columns=columns)
+            return wide
+        except Exception as e:
+            st.error(f"❌ Error loading tarif: {e}")
             return pd.DataFrame()
 
     def get_available_columns(self):
@@ -130,11 +140,32 @@ class PemeriksaanPenunjang:
             stmt = text("DELETE FROM pemeriksaan_penunjang WHERE id = :id")
             result = self.session.execute(stmt, {"id": data_id})
             self.session.commit()
+            self.refresh_snapshot()
             return result.rowcount
         except Exception as e:
             st.error(f"❌ Error menghapus data: {e}")
             return 0
 
+    def delete_data_by_ids(self, data_ids):
+        """Hapus banyak data sekaligus dalam satu transaksi; mengembalikan jumlah terhapus"""
+        try:
+            stmt = text(
+                "DELETE FROM pemeriksaan_penunjang WHERE id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True))
+            data_ids = [int(data_id) for data_id in data_ids]
+            deleted = 0
+            # Per potongan agar jumlah parameter tetap di bawah batas SQLite
+            for start in range(0, len(data_ids), DELETE_CHUNK_SIZE):
+                chunk = data_ids[start : start + DELETE_CHUNK_SIZE]
+                deleted += self.session.execute(stmt, {"ids": chunk}).rowcount
+            self.session.commit()
+            self.refresh_snapshot()
+            return deleted
+        except Exception as e:
+            self.session.rollback()
+            st.error(f"❌ Error menghapus data: {e}")
+            return 0
+
     def delete_data_by_filter(self, mitra=None, group=None, satuan=None):
         """Hapus data penunjang berdasarkan filter"""
         try:
@@ -154,6 +185,7 @@ class PemeriksaanPenunjang:
             stmt = text(base_sql)
             result = self.session.execute(stmt, params)
             self.session.commit()
+            self.refresh_snapshot()
 
             return result.rowcount
         except Exception as e:
@@ -166,6 +198,7 @@ class PemeriksaanPenunjang:
             stmt = text("DELETE FROM pemeriksaan_penunjang")
             result = self.session.execute(stmt)
             self.session.commit()
+            self.refresh_snapshot()
             return result.rowcount
         except Exception as e:
             st.error(f"❌ Error menghapus semua data: {e}")
@@ -0,0 +1,67 @@
+"""Cache DataFrame per proses, dibatasi total ukuran memori (LRU).
+
+Setiap entri disimpan bersama versi datanya (tabel data_version). Entri
+dengan versi lain dianggap basi dan langsung dibuang saat dibaca, jadi tulisan
+apa pun ke tabel sumber otomatis membatalkan cache tanpa perlu dihapus manual.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, max_bytes):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (version, df, nbytes)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """DataFrame untuk key pada versi ini, atau None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, df):
+        """Simpan df; entri terlama dibuang sampai total ukuran muat"""
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (version, df, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def snapshot(self):
+        """Ringkasan saat ini untuk ditampilkan"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
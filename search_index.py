@@ -0,0 +1,49 @@
+import re
+
+import pandas as pd
+from sqlalchemy import text
+
+# Tabel FTS5 dari migrasi 9, per tabel sumber
+FTS_TABLES = {
+    "hna_fact": "hna_fact_fts",
+    "pemeriksaan_penunjang": "pemeriksaan_penunjang_fts",
+}
+
+# Karakter yang dipakai sebagai token oleh tokenizer unicode61
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def fts_query(query, prefix=True):
+    """Ubah input user menjadi query FTS5: semua token wajib ada.
+
+    prefix=True mencocokkan awal kata ("para 500" -> PARACETAMOL 500MG),
+    prefix=False hanya token utuh. Mengembalikan None jika tidak ada token.
+    """
+    tokens = _TOKEN_PATTERN.findall(str(query).lower())
+    if not tokens:
+        return None
+    suffix = "*" if prefix else ""
+    return " ".join(f'"{token}"{suffix}' for token in tokens)
+
+
+def search_ids(session, table, query, prefix=True, limit=None):
+    """Id baris yang cocok dengan query, urut relevansi (bm25) terbaik dulu"""
+    match = fts_query(query, prefix)
+    if match is None:
+        return []
+    fts = FTS_TABLES[table]
+    sql = f"SELECT rowid FROM {fts} WHERE {fts} MATCH :match ORDER BY rank"
+    params = {"match": match}
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = int(limit)
+    return [row[0] for row in session.execute(text(sql), params)]
+
+
+def rank_by_ids(df, ids):
+    """Baris df dengan id di ids, diurutkan mengikuti urutan ids"""
+    if not ids:
+        return df.iloc[0:0]
+    position = pd.Series(range(len(ids)), index=ids)
+    matched = df[df["id"].isin(position.index)]
+    return matched.iloc[matched["id"].map(position).argsort()]
@@ -0,0 +1,43 @@
+"""Kunci pencarian ternormalisasi untuk nama barang dan deskripsi penunjang.
+
+Kunci dihitung sekali saat upload dan disimpan di kolom ber-index
+(hna_fact.nama_key, pemeriksaan_penunjang.deskripsi_key). Pencarian cukup
+menormalisasi string query lalu membandingkannya dengan kolom tersebut.
+Modul ini sengaja tanpa dependensi agar bisa dipakai migrasi.
+"""
+
+import re
+
+# Huruf kecil; setiap deret karakter bukan huruf/angka (termasuk "_" dan
+# spasi) menjadi satu spasi
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def search_key(text):
+    """Bentuk ternormalisasi satu nilai; None/NaN menjadi string kosong"""
+    if text is None or text != text:
+        return ""
+    return _NON_WORD.sub(" ", str(text).lower()).strip()
+
+
+def search_keys(values):
+    """search_key untuk setiap nilai, sebagai list dengan urutan yang sama"""
+    return [search_key(value) for value in values]
+
+
+def key_matches(df, column, query, key_column=None, contains=False):
+    """Baris df yang sama dengan query (atau memuatnya jika contains).
+
+    Jika df punya key_column, kunci tersimpan itu yang dibandingkan dengan
+    search_key(query); selain itu column dalam huruf kecil dengan query apa
+    adanya.
+    """
+    if key_column is not None and key_column in df.columns:
+        values, query = df[key_column], search_key(query)
+    else:
+        values, query = df[column].str.lower(), str(query).lower()
+    if not query:
+        return df.iloc[0:0]
+    if contains:
+        return df[values.str.contains(query, regex=False, na=False)]
+    return df[values == query]
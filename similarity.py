@@ -0,0 +1,164 @@
+"""Skor kemiripan nama (WRatio) terhadap seluruh daftar nama sekaligus.
+
+Nama dinormalisasi dengan search_keys.search_key; bentuk itu sudah tersimpan
+di database sejak upload (nama_key), jadi NameIndex cukup memakainya dan
+hanya query yang dinormalisasi. Query diskor terhadap semua kandidat dalam
+satu panggilan batch. Dengan paket rapidfuzz (pip install rapidfuzz) skor
+dihitung native dan paralel; tanpa itu dipakai fuzzywuzzy per nama di Python.
+Scorer-nya sama (WRatio), tapi pembulatannya berbeda sehingga skor kedua
+backend bisa selisih 1 poin.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz
+
+try:
+    from rapidfuzz import fuzz as rapid_fuzz
+    from rapidfuzz import process as rapid_process
+except ImportError:  # opsional, lihat docstring modul
+    rapid_process = None
+
+from datasets import data_version, load_dataset
+from search_keys import search_key, search_keys
+
+# Kolom skor (0-100) yang ditambahkan ke hasil pencarian
+SIMILARITY_COLUMN = "similarity"
+
+
+def score_processed(query, choices, score_cutoff=0):
+    """Skor WRatio 0-100 query terhadap setiap choice (hasil search_key).
+
+    Skor di bawah score_cutoff boleh dilaporkan 0 (perhitungannya dihentikan
+    lebih awal).
+    """
+    query = search_key(query)
+    if not len(choices):
+        return np.zeros(0, dtype=int)
+    if rapid_process is not None:
+        scores = rapid_process.cdist(
+            [query],
+            list(choices),
+            scorer=rapid_fuzz.WRatio,
+            processor=None,
+            # Skor dibulatkan, jadi 84.5 masih lolos threshold 85
+            score_cutoff=max(score_cutoff - 0.5, 0),
+            workers=-1,
+        )[0]
+        return np.rint(scores).astype(int)
+    return np.fromiter(
+        (fuzz.WRatio(query, choice) for choice in choices),
+        dtype=int,
+        count=len(choices),
+    )
+
+
+class NameIndex:
+    """Nama unik beserta bentuk ternormalisasinya, dengan urutan tetap.
+
+    keys (sejajar names) adalah kunci tersimpan; tanpa keys dihitung di sini.
+    """
+
+    def __init__(self, names, keys=None):
+        frame = pd.DataFrame({"name": pd.Series(names, dtype=object)})
+        if keys is not None:
+            frame["key"] = np.asarray(keys, dtype=object)
+        frame = frame.dropna(subset=["name"]).drop_duplicates("name")
+        self.names = frame["name"].to_numpy(dtype=object)
+        if keys is None:
+            self.processed = np.asarray(search_keys(self.names), dtype=object)
+        else:
+            self.processed = frame["key"].to_numpy(dtype=object)
+        self._positions = pd.Index(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def processed_for(self, names):
+        """Bentuk ternormalisasi names; nama di luar index dinormalisasi saat itu"""
+        names = np.asarray(names, dtype=object)
+        positions = self._positions.get_indexer(names)
+        found = positions >= 0
+        processed = np.empty(len(names), dtype=object)
+        processed[found] = self.processed[positions[found]]
+        if not found.all():
+            processed[~found] = search_keys(names[~found])
+        return processed
+
+
+def similarity_search(query, names, threshold=85, limit=None, index=None):
+    """Nama dengan skor >= threshold, skor tertinggi dulu.
+
+    names adalah kandidat (boleh berulang/NaN). Mengembalikan DataFrame
+    (name, score) yang selalu sejajar: skor milik nama di baris yang sama.
+    """
+    candidates = np.asarray(
+        pd.unique(pd.Series(names, dtype=object).dropna()), dtype=object
+    )
+    if index is None:
+        processed = np.asarray(search_keys(candidates), dtype=object)
+    else:
+        processed = index.processed_for(candidates)
+    scores = score_processed(query, processed, score_cutoff=threshold)
+    matched = np.flatnonzero(scores >= threshold)
+    # Stabil: skor sama tetap dalam urutan kandidat
+    matched = matched[np.argsort(-scores[matched], kind="stable")]
+    if limit is not None:
+        matched = matched[:limit]
+    return pd.DataFrame({"name": candidates[matched], "score": scores[matched]})
+
+
+def broadcast_scores(values, names, scores):
+    """Skor per nama unik -> skor per baris values (vectorized); nama tanpa skor 0"""
+    positions = pd.Index(names).get_indexer(np.asarray(values, dtype=object))
+    scores = np.asarray(scores, dtype=int)
+    return np.where(positions >= 0, scores[np.maximum(positions, 0)], 0)
+
+
+def add_similarity(df, query, column="nama_barang", index=None, key_column=None):
+    """df dengan kolom SIMILARITY_COLUMN; skor dihitung sekali per nama unik.
+
+    Kolom yang sudah ada (hasil similarity_search) dipakai apa adanya. Jika
+    df punya key_column (kunci tersimpan), kunci itu yang diskor.
+    """
+    if SIMILARITY_COLUMN in df.columns:
+        return df
+    if key_column is not None and key_column in df.columns:
+        pairs = df[[column, key_column]].dropna(subset=[column])
+        pairs = pairs.drop_duplicates(column)
+        names = pairs[column].to_numpy(dtype=object)
+        processed = pairs[key_column].fillna("").to_numpy(dtype=object)
+    elif index is None:
+        names = np.asarray(pd.unique(df[column].dropna()), dtype=object)
+        processed = np.asarray(search_keys(names), dtype=object)
+    else:
+        names = np.asarray(pd.unique(df[column].dropna()), dtype=object)
+        processed = index.processed_for(names)
+    scores = score_processed(query, processed)
+    return df.assign(**{SIMILARITY_COLUMN: broadcast_scores(df[column], names, scores)})
+
+
+_index_lock = threading.Lock()
+_indexes = {}  # (dataset, column) -> (versi, NameIndex)
+
+
+def name_index(connection, dataset, column, key_column=None):
+    """NameIndex kolom dataset untuk versi data saat ini (dibangun ulang jika berubah).
+
+    key_column adalah kolom kunci tersimpan untuk column (mis. nama_key).
+    """
+    version = data_version(connection, dataset)
+    with _index_lock:
+        cached = _indexes.get((dataset, column))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    if key_column is None:
+        index = NameIndex(load_dataset(connection, dataset, [column])[column])
+    else:
+        df = load_dataset(connection, dataset, [column, key_column])
+        index = NameIndex(df[column], df[key_column])
+    with _index_lock:
+        _indexes[(dataset, column)] = (version, index)
+    return index
@@ -0,0 +1,59 @@
+import pandas as pd
+
+from validation import ERROR_COLUMN, HNAValidator
+
+
+def _frame(rows):
+    columns = ["Kode Item", "Nama Barang", "Group Transaki", "Satuan", "HNA"]
+    # Index = nomor baris Excel, seperti hasil excel_reader
+    return pd.DataFrame(rows, columns=columns, index=range(2, 2 + len(rows)))
+
+
+def test_blank_text_columns_are_rejected_per_row():
+    df = _frame(
+        [
+            ["A", "Paracetamol", "Obat", "Tablet", 1000],
+            ["B", "Amoxicillin", "Obat", None, 2000],
+            ["C", "Kasa", None, "Pcs", 300],
+            ["D", "   ", "Obat", "Pcs", 400],
+            ["E", "Spuit", "Alkes", "  ", 500],
+            ["  ", "Infus", "Alkes", "Pcs", 600],
+            ["F", "Vitamin C", "Obat", "Botol", "1.250"],
+        ]
+    )
+    validator = HNAValidator()
+
+    valid = validator.validate(df)
+
+    assert list(valid["Kode Item"]) == ["A", "F"]
+    assert list(valid["HNA"]) == [1000.0, 1250.0]
+    errors = validator.error_frame()
+    assert validator.invalid_count == 5
+    assert errors[ERROR_COLUMN].to_dict() == {
+        3: "Satuan kosong",
+        4: "Group Transaki kosong",
+        5: "Nama Barang kosong",
+        6: "Satuan kosong",
+        7: "Kode Item kosong",
+    }
+
+
+def test_duplicate_codes_do_not_depend_on_chunk_size():
+    df = _frame(
+        [
+            ["A", None, "Obat", "Tablet", 1],
+            ["A", "Paracetamol", "Obat", "Tablet", 2],
+            ["B", "Kasa", "Alkes", "Pcs", 3],
+            ["A", "Paracetamol", "Obat", "Tablet", 4],
+        ]
+    )
+    results = []
+    for size in (1, 2, 4):
+        validator = HNAValidator()
+        valid = [
+            validator.validate(df.iloc[start : start + size])
+            for start in range(0, len(df), size)
+        ]
+        results.append(list(pd.concat(valid).index))
+
+    assert results == [[4], [4], [4]]
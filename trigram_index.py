@@ -0,0 +1,193 @@
+"""Inverted index trigram nama barang untuk memangkas kandidat similarity.
+
+Kunci pencarian setiap nama unik (search_keys.search_key, tersimpan sebagai
+nama_key) dipecah menjadi trigram karakter. Query hanya diskor terhadap nama yang
+berbagi trigram terbanyak dengannya (candidates), bukan seluruh katalog.
+
+Index disimpan di sebelah database (snapshots/hna_trigram.npz) dan hanya
+bertambah: setelah upload, nama yang belum ada ditambahkan (sync_index).
+Index tidak pernah diubah di tempat; add membuat index baru yang dipasang
+sekali, jadi session lain boleh membaca index lama tanpa lock.
+Nama yang datanya sudah dihapus tetap ada di index; hasilnya selalu diiris
+dengan nama pada data yang sedang dicari, jadi tidak pernah ikut tampil.
+"""
+
+import copy
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datasets import data_version, load_dataset, snapshot_path
+from search_keys import search_key, search_keys
+
+# Jumlah maksimum nama (overlap trigram terbanyak) yang diteruskan ke scorer
+TRIGRAM_CANDIDATES = int(os.getenv("TRIGRAM_CANDIDATES", 2000))
+
+# Pemisah antarnama saat dipecah bersamaan; tidak pernah ada di nama
+# ternormalisasi karena search_key mengganti karakter non-kata dengan spasi
+_SEPARATOR = "\x00"
+
+
+def trigram_postings(keys):
+    """(kode trigram, posisi kunci) unik untuk setiap kunci, urut kode trigram.
+
+    Trigram dibentuk dari kunci pencarian berspasi di kedua ujung; tiga
+    codepoint dikemas menjadi satu uint64 sehingga semua operasi tetap numpy.
+    """
+    padded = [f" {key} " for key in keys]
+    if not padded:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int32)
+    joined = _SEPARATOR.join(padded)
+    points = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32)
+    points = points.astype(np.uint64)
+    codes = (points[:-2] << np.uint64(42)) | (points[1:-1] << np.uint64(21))
+    codes |= points[2:]
+    # Posisi nama untuk setiap karakter (pemisah ikut nama sebelumnya)
+    lengths = np.fromiter((len(text) + 1 for text in padded), dtype=np.int64)
+    owner = np.repeat(np.arange(len(padded), dtype=np.int32), lengths)[:-1]
+    separator = np.uint64(0)
+    valid = (points[:-2] != separator) & (points[1:-1] != separator)
+    valid &= points[2:] != separator
+    codes = codes[valid]
+    owner = owner[:-2][valid]
+    order = np.lexsort((owner, codes))
+    codes, owner = codes[order], owner[order]
+    unique = np.ones(len(codes), dtype=bool)
+    unique[1:] = (codes[1:] != codes[:-1]) | (owner[1:] != owner[:-1])
+    return codes[unique], owner[unique]
+
+
+class TrigramIndex:
+    def __init__(self, names=(), codes=None, name_ids=None, version=None):
+        self.names = np.asarray(list(names), dtype=object)
+        self._positions = pd.Index(self.names)
+        self.codes = np.zeros(0, dtype=np.uint64) if codes is None else codes
+        self.name_ids = np.zeros(0, dtype=np.int32) if name_ids is None else name_ids
+        self.version = version
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, names, keys=None, version=None):
+        """Index baru berisi nama index ini ditambah names yang belum ada.
+
+        keys (sejajar names) adalah kunci tersimpan; tanpa keys dihitung di sini.
+        version menjadi versi index baru.
+        """
+        added = copy.copy(self)
+        added.version = version
+        frame = pd.DataFrame({"name": pd.Series(names, dtype=object)})
+        if keys is not None:
+            frame["key"] = np.asarray(keys, dtype=object)
+        frame = frame.dropna(subset=["name"]).drop_duplicates("name")
+        frame = frame[self._positions.get_indexer(frame["name"]) < 0]
+        if frame.empty:
+            return added
+        new = frame["name"].to_numpy(dtype=object)
+        if keys is None:
+            new_keys = search_keys(new)
+        else:
+            new_keys = frame["key"].fillna("").tolist()
+        codes, owner = trigram_postings(new_keys)
+        # Gabungkan dua daftar terurut tanpa mengurutkan ulang semuanya
+        at = np.searchsorted(self.codes, codes, side="right")
+        added.codes = np.insert(self.codes, at, codes)
+        added.name_ids = np.insert(self.name_ids, at, owner + len(self.names))
+        added.names = np.concatenate([self.names, new])
+        added._positions = pd.Index(added.names)
+        return added
+
+    def overlap(self, query):
+        """Jumlah trigram query yang dimiliki setiap nama (sejajar self.names)"""
+        codes, _ = trigram_postings([search_key(query)])
+        start = np.searchsorted(self.codes, codes, side="left")
+        end = np.searchsorted(self.codes, codes, side="right")
+        hits = [self.name_ids[a:b] for a, b in zip(start, end) if b > a]
+        if not hits:
+            return np.zeros(len(self.names), dtype=np.int64)
+        return np.bincount(np.concatenate(hits), minlength=len(self.names))
+
+    def candidates(self, query, names, limit=TRIGRAM_CANDIDATES):
+        """Nama unik dari names yang perlu diskor untuk query.
+
+        Yang dipilih: maksimal limit nama dengan overlap trigram terbanyak,
+        ditambah nama yang belum ada di index (misalnya data arsip).
+        """
+        names = np.asarray(
+            pd.unique(pd.Series(names, dtype=object).dropna()), dtype=object
+        )
+        positions = self._positions.get_indexer(names)
+        indexed = positions >= 0
+        overlap = self.overlap(query)[positions[indexed]]
+        keep = np.flatnonzero(overlap > 0)
+        if len(keep) > limit:
+            keep = keep[np.argsort(-overlap[keep], kind="stable")[:limit]]
+        return np.concatenate([names[indexed][np.sort(keep)], names[~indexed]])
+
+    def save(self, path):
+        """Simpan atomik (file sementara lalu os.replace)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blob = _SEPARATOR.join(map(str, self.names)).encode("utf-8")
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(
+            temp_path,
+            codes=self.codes,
+            name_ids=self.name_ids,
+            names=np.frombuffer(blob, dtype=np.uint8),
+            version=np.array([self.version], dtype=np.int64),
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            blob = data["names"].tobytes().decode("utf-8")
+            names = blob.split(_SEPARATOR) if blob else []
+            return cls(
+                names,
+                data["codes"],
+                data["name_ids"],
+                int(data["version"][0]),
+            )
+
+
+_index_lock = threading.Lock()
+_index = None
+
+
+def index_path(connection):
+    path = snapshot_path(connection, "hna_trigram")
+    return None if path is None else path.replace(".parquet", ".npz")
+
+
+def sync_index(connection):
+    """Index trigram nama barang HNA yang sudah memuat semua nama saat ini.
+
+    Index dibaca dari file sekali per proses; jika versi data berubah sejak
+    index terakhir disimpan, hanya nama baru yang ditambahkan lalu disimpan.
+    """
+    global _index
+    version = data_version(connection, "hna")
+    path = index_path(connection)
+    with _index_lock:
+        index = _index
+        if index is None and path is not None and os.path.exists(path):
+            try:
+                index = TrigramIndex.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Index trigram dibangun ulang: {e}")
+        if index is None:
+            index = TrigramIndex()
+        if index.version != version:
+            df = load_dataset(connection, "hna", ["nama_barang", "nama_key"])
+            index = index.add(df["nama_barang"], df["nama_key"], version)
+            if path is not None:
+                try:
+                    index.save(path)
+                except OSError as e:
+                    print(f"⚠️ Index trigram tidak bisa disimpan: {e}")
+        # Satu assignment: pembaca melihat index lama atau baru, tidak campuran
+        _index = index
+        return index
@@ -0,0 +1,117 @@
+import hashlib
+
+from sqlalchemy import bindparam, text
+
+# Satu baris per kombinasi isi file + region/mitra/periode yang sudah berhasil
+# diupload. File yang sama untuk periode yang sama tidak perlu di-parse ulang.
+REGISTRY_COLUMNS = (
+    "id, sha256, filename, region, mitra, periode_bulan, periode_tahun, "
+    "job_id, uploaded_by, uploaded_at"
+)
+
+
+def file_sha256(data):
+    """Hash SHA-256 dari isi file (bytes)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_upload(session, sha256, region, mitra, bulan, tahun):
+    """Upload sebelumnya dengan isi dan periode yang sama, atau None"""
+    row = (
+        session.execute(
+            text(f"""
+                SELECT {REGISTRY_COLUMNS} FROM upload_registry
+                WHERE sha256 = :sha256 AND region = :region AND mitra = :mitra
+                  AND periode_bulan = :bulan AND periode_tahun = :tahun
+            """),
+            {
+                "sha256": sha256,
+                "region": region,
+                "mitra": mitra,
+                "bulan": bulan,
+                "tahun": int(tahun),
+            },
+        )
+        .mappings()
+        .fetchone()
+    )
+    return dict(row) if row else None
+
+
+def find_uploads_by_hash(session, hashes):
+    """Semua registrasi untuk daftar hash, dikelompokkan per hash"""
+    if not hashes:
+        return {}
+    stmt = text(
+        f"SELECT {REGISTRY_COLUMNS} FROM upload_registry WHERE sha256 IN :hashes"
+    ).bindparams(bindparam("hashes", expanding=True))
+    found = {}
+    for row in session.execute(stmt, {"hashes": list(hashes)}).mappings():
+        found.setdefault(row["sha256"], []).append(dict(row))
+    return found
+
+
+def register_upload(
+    session, sha256, filename, region, mitra, bulan, tahun, user, job_id=None
+):
+    """Catat upload yang berhasil; upload ulang (paksa) memperbarui catatan lama"""
+    session.execute(
+        text("""
+            INSERT INTO upload_registry
+                (sha256, filename, region, mitra, periode_bulan, periode_tahun,
+                 job_id, uploaded_by)
+            VALUES (:sha256, :filename, :region, :mitra, :bulan, :tahun,
+                    :job_id, :user)
+            ON CONFLICT (sha256, region, mitra, periode_bulan, periode_tahun)
+            DO UPDATE SET filename = excluded.filename, job_id = excluded.job_id,
+                uploaded_by = excluded.uploaded_by, uploaded_at = CURRENT_TIMESTAMP
+        """),
+        {
+            "sha256": sha256,
+            "filename": filename,
+            "region": region,
+            "mitra": mitra,
+            "bulan": bulan,
+            "tahun": int(tahun),
+            "job_id": job_id,
+            "user": user,
+        },
+    )
+    session.commit()
+
+
+def forget_uploads(session, where="1 = 1", params=None):
+    """Hapus catatan upload untuk region/mitra/periode yang barisnya akan dihapus.
+
+    where adalah kondisi DELETE FROM hna_fact yang sama (tanpa commit);
+    panggil sebelum DELETE itu di transaksi yang sama, agar file yang sama
+    bisa diupload lagi setelah datanya dihapus. Parameter bertipe list
+    dipakai sebagai expanding IN.
+    """
+    params = params or {}
+    stmt = text(f"""
+        DELETE FROM upload_registry WHERE EXISTS (
+            SELECT 1 FROM hna_fact
+            WHERE ({where})
+              AND hna_fact.region_id =
+                  (SELECT id FROM dim_region WHERE nama = upload_registry.region)
+              AND hna_fact.mitra_id =
+                  (SELECT id FROM dim_mitra WHERE nama = upload_registry.mitra)
+              AND hna_fact.periode_bulan = upload_registry.periode_bulan
+              AND hna_fact.periode_tahun = upload_registry.periode_tahun
+        )
+    """)
+    for key, value in params.items():
+        if isinstance(value, (list, tuple)):
+            stmt = stmt.bindparams(bindparam(key, expanding=True))
+    return session.execute(stmt, params).rowcount
+
+
+def describe_upload(upload):
+    """Kalimat singkat yang menunjuk ke upload sebelumnya"""
+    source = f"job #{upload['job_id']}" if upload["job_id"] else upload["filename"]
+    return (
+        f"File yang sama untuk {upload['region']} / {upload['mitra']} "
+        f"{upload['periode_bulan']} {upload['periode_tahun']} sudah diupload "
+        f"oleh {upload['uploaded_by']} pada {upload['uploaded_at']} ({source})."
+    )
@@ -1,30 +1,42 @@
-import pandas as pd
 from db import SessionLocal
-from fuzzywuzzy import process
+from datasets import build_hna_frame
+from hna_query import filter_frame
+from similarity import NameIndex, similarity_search
+from trigram_index import sync_index
 
 
-def load_data():
+def load_data(filters=None, limit=None):
+    """Data HNA; filter ({kolom: nilai}) dan limit dijalankan di database"""
     session = SessionLocal()
-    df = pd.read_sql("SELECT * FROM hna_data", session.bind)
-    session.close()
-    return df
+    try:
+        return build_hna_frame(session.connection(), filters=filters, limit=limit)
+    finally:
+        session.close()
 
 
 def filter_data(df, region=None, mitra=None, group=None, bulan=None, tahun=None):
-    if region:
-        df = df[df["region"] == region]
-    if mitra:
-        df = df[df["mitra"] == mitra]
-    if group:
-        df = df[df["group_transaksi"] == group]
-    if bulan:
-        df = df[df["periode_bulan"] == bulan]
-    if tahun:
-        df = df[df["periode_tahun"] == tahun]
-    return df
+    return filter_frame(
+        df,
+        {
+            "region": region,
+            "mitra": mitra,
+            "group_transaksi": group,
+            "periode_bulan": bulan,
+            "periode_tahun": tahun,
+        },
+    )
 
 
 def search_similarity(df, query, column="nama_barang", limit=10):
-    choices = df[column].tolist()
-    results = process.extract(query, choices, limit=limit)
-    return pd.DataFrame(results, columns=[column, "Similarity"])
+    """Nama paling mirip dengan query; nama barang dipangkas lewat index trigram"""
+    choices = df[column]
+    index = None
+    if column == "nama_barang":
+        index = NameIndex(choices, df["nama_key"]) if "nama_key" in df else None
+        session = SessionLocal()
+        try:
+            choices = sync_index(session.connection()).candidates(query, choices)
+        finally:
+            session.close()
+    results = similarity_search(query, choices, threshold=0, limit=limit, index=index)
+    return results.rename(columns={"name": column, "score": "Similarity"})
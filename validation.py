@@ -0,0 +1,131 @@
+import io
+
+import pandas as pd
+
+HNA_EXCEL_COLUMNS = ["Kode Item", "Nama Barang", "Group Transaki", "Satuan", "HNA"]
+
+# Batas panjang teks per kolom template HNA
+HNA_MAX_LENGTHS = {
+    "Kode Item": 50,
+    "Nama Barang": 255,
+    "Group Transaki": 100,
+    "Satuan": 50,
+}
+
+ERROR_COLUMN = "Keterangan Error"
+
+# Angka format Indonesia: 1.250.000 atau 1.250.000,50 atau 1250000,5
+_INDONESIAN_NUMBER = r"-?\d{1,3}(?:\.\d{3})+(?:,\d+)?|-?\d+,\d+"
+
+
+def parse_numbers(series):
+    """Konversi kolom harga ke float secara vectorized.
+
+    Sel angka dipakai apa adanya. Sel teks boleh berformat Indonesia
+    ("1.250.000", "Rp 1.250.000,50") atau angka biasa ("1250000.5").
+    Nilai yang tidak bisa dibaca menjadi NaN.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+
+    series = series.astype(object)
+    try:
+        # .str menghasilkan NaN untuk sel yang bukan teks
+        text = series.str.strip()
+    except AttributeError:
+        # Tidak ada sel teks sama sekali
+        return pd.to_numeric(series, errors="coerce").astype(float)
+
+    numbers = pd.to_numeric(series.where(text.isna()), errors="coerce")
+    cleaned = text.str.replace(r"^rp\.?\s*", "", case=False, regex=True).str.replace(
+        " ", "", regex=False
+    )
+    indonesian = cleaned.str.fullmatch(_INDONESIAN_NUMBER).fillna(False).astype(bool)
+    from_indonesian = pd.to_numeric(
+        cleaned.where(indonesian)
+        .str.replace(".", "", regex=False)
+        .str.replace(",", ".", regex=False),
+        errors="coerce",
+    )
+    from_plain = pd.to_numeric(cleaned.where(~indonesian), errors="coerce")
+    return numbers.fillna(from_indonesian).fillna(from_plain).astype(float)
+
+
+def is_blank(series):
+    """Sel kosong: NaN/None atau teks yang hanya berisi spasi"""
+    return series.isna() | series.astype("string").str.strip().eq("").fillna(False)
+
+
+class HNAValidator:
+    """Validasi file HNA per chunk; baris valid diteruskan, baris salah dicatat.
+
+    Satu instance dipakai untuk satu file agar Kode Item ganda antar chunk
+    ikut terdeteksi. Index DataFrame diasumsikan nomor baris Excel.
+    """
+
+    def __init__(self, max_lengths=None):
+        self.max_lengths = max_lengths or HNA_MAX_LENGTHS
+        self.seen_codes = set()
+        self.invalid_count = 0
+        self._errors = []
+
+    def validate(self, df):
+        """Kembalikan baris valid dengan kolom HNA sudah berupa float"""
+        df = df[HNA_EXCEL_COLUMNS]
+        hna = parse_numbers(df["HNA"])
+        blank = {col: is_blank(df[col]) for col in HNA_EXCEL_COLUMNS}
+        codes = df["Kode Item"].astype("string").str.strip().mask(blank["Kode Item"])
+
+        checks = [
+            (blank["Kode Item"], "Kode Item kosong"),
+            (blank["Nama Barang"], "Nama Barang kosong"),
+            (blank["Group Transaki"], "Group Transaki kosong"),
+            (blank["Satuan"], "Satuan kosong"),
+            (blank["HNA"], "HNA kosong"),
+            (~blank["HNA"] & hna.isna(), "HNA bukan angka"),
+            (hna < 0, "HNA negatif"),
+            (
+                codes.notna() & (codes.duplicated() | codes.isin(self.seen_codes)),
+                "Kode Item ganda dalam file",
+            ),
+        ]
+        for col, limit in self.max_lengths.items():
+            too_long = df[col].astype("string").str.len() > limit
+            checks.append(
+                (too_long.fillna(False), f"{col} lebih dari {limit} karakter")
+            )
+
+        reasons = pd.Series("", index=df.index, dtype=object)
+        for mask, label in checks:
+            mask = mask.fillna(False).astype(bool)
+            reasons = reasons.where(~mask, reasons + label + "; ")
+        invalid = reasons != ""
+
+        # Semua kode dicatat, valid atau tidak, seperti duplicated() di atas:
+        # baris ganda = kode sudah muncul di baris sebelumnya, apa pun chunk-nya
+        self.seen_codes.update(codes.dropna())
+
+        if invalid.any():
+            errors = df[invalid].copy()
+            errors[ERROR_COLUMN] = reasons[invalid].str.rstrip("; ")
+            self._errors.append(errors)
+            self.invalid_count += int(invalid.sum())
+
+        valid = df[~invalid].copy()
+        valid["HNA"] = hna[~invalid]
+        return valid
+
+    def error_frame(self):
+        """Semua baris yang ditolak beserta alasannya, index = nomor baris Excel"""
+        if not self._errors:
+            return pd.DataFrame(columns=HNA_EXCEL_COLUMNS + [ERROR_COLUMN])
+        return pd.concat(self._errors)
+
+
+def build_error_workbook(errors):
+    """Buat file Excel laporan error; kolom pertama berisi nomor baris di file asal"""
+    output = io.BytesIO()
+    report = errors.rename_axis("Baris").reset_index()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        report.to_excel(writer, index=False, sheet_name="Error Upload")
+    return output.getvalue()